@@ -0,0 +1,5 @@
+from moving_multiscalemnist.dataset import MovingMultiscaleMNIST
+from moving_multiscalemnist.reader import DatasetReader
+from moving_multiscalemnist.transport import SharedMemoryLoader
+
+__all__ = ["DatasetReader", "MovingMultiscaleMNIST", "SharedMemoryLoader"]
@@ -1,23 +1,36 @@
 import argparse
 import logging
 
-import numpy as np
-
 from moving_multiscalemnist.defaults import (
+    BATCH_SIZE,
+    COLOR_MODE,
     DATA_DIR,
+    ENGINE,
+    FORMAT,
     FPS,
     IMAGE_SIZE,
     MAX_DIGITS,
     MIN_DIGITS,
     N_FRAMES,
+    NUM_SHARDS,
     OSCILLATIONS,
     OSCILLATIONS_VARIANCES,
+    OUTPUT_DIR,
+    QUEUE_DEPTH,
     SEED,
+    SHARD_INDEX,
+    SHARD_SIZE,
     SIZES,
     TEST_SIZE,
     TRAIN_SIZE,
+    WORKERS,
+    WRITER_THREADS,
 )
-from moving_multiscalemnist.generate import generate_dataset
+from moving_multiscalemnist.generate import ENGINES, generate_dataset
+from moving_multiscalemnist.sequence import COLOR_MODES, MASK_FORMATS
+from moving_multiscalemnist.sharding import merge_shards
+from moving_multiscalemnist.sweep import generate_sweep, load_sweep
+from moving_multiscalemnist.writers import WRITERS
 
 logging.basicConfig(level=logging.INFO)
 
@@ -25,6 +38,9 @@ if __name__ == "__main__":
     parser = argparse.ArgumentParser()
     parser.add_argument("--seed", "-s", help="Random seed", type=int, default=SEED)
     parser.add_argument("--data-dir", "-d", help="MNIST location", default=DATA_DIR)
+    parser.add_argument(
+        "--output-dir", "-od", help="Dataset directory", default=OUTPUT_DIR
+    )
     parser.add_argument(
         "--train-size", "-trs", help="Train subset size", type=int, default=TRAIN_SIZE
     )
@@ -80,10 +96,145 @@ if __name__ == "__main__":
     parser.add_argument(
         "--fps", help="Frames per second (period length)", type=float, default=FPS
     )
+    parser.add_argument(
+        "--workers",
+        "-w",
+        help="Number of worker processes generating sequences",
+        type=int,
+        default=WORKERS,
+    )
+    parser.add_argument(
+        "--engine",
+        "-e",
+        help="Rendering engine (dense recomposites only changed regions of frames, for"
+        " scenes of hundreds of digits)",
+        choices=ENGINES,
+        default=ENGINE,
+    )
+    parser.add_argument(
+        "--batch-size",
+        "-bs",
+        help="Number of sequences rendered at once",
+        type=int,
+        default=BATCH_SIZE,
+    )
+    parser.add_argument(
+        "--format",
+        "-f",
+        help="Output format: JPEG or animated PNG frames, memory-mappable arrays or"
+        " tar shards",
+        choices=list(WRITERS),
+        default=FORMAT,
+    )
+    parser.add_argument(
+        "--resume",
+        help="Skip sequences already saved according to subset manifests",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--writer-threads",
+        "-wt",
+        help="Number of threads encoding and writing frames in each worker process",
+        type=int,
+        default=WRITER_THREADS,
+    )
+    parser.add_argument(
+        "--queue-depth",
+        "-qd",
+        help="Maximum number of rendered sequences waiting to be written",
+        type=int,
+        default=QUEUE_DEPTH,
+    )
+    parser.add_argument(
+        "--atlas-dir",
+        help="Cache directory of sprite atlases (digits are resized on the fly if not"
+        " given)",
+        default=None,
+    )
+    parser.add_argument(
+        "--profile",
+        help="Record and summarize wall time of generation stages",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--profile-output",
+        help="Profile generation loop with cProfile and save pstats to this file",
+        default=None,
+    )
+    parser.add_argument(
+        "--trajectories",
+        help="Also save digit trajectories and boxes of each subset",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--shard-size",
+        help="Maximum size of tar shards in MB",
+        type=int,
+        default=SHARD_SIZE // 2**20,
+    )
+    parser.add_argument(
+        "--color-mode",
+        help="Render frames with three identical channels or a single channel",
+        choices=list(COLOR_MODES),
+        default=COLOR_MODE,
+    )
+    parser.add_argument(
+        "--masks",
+        help="Also save digit masks of frames as float32 or bit-packed arrays",
+        choices=MASK_FORMATS,
+        default=None,
+    )
+    parser.add_argument(
+        "--instances",
+        help="Also save instance id maps of frames and visible fractions of digits",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--stream",
+        help="Write frames and annotations of sequences as they are rendered, in"
+        " memory independent of sequence length (jpeg format and pil or dense engine"
+        " only)",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--scenario",
+        help="Draw parameters of all digits up front into a table saved with each"
+        " subset and render sequences from it",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--sweep",
+        help="JSON file with a grid or list of parameters of dataset variants to"
+        " generate in subdirectories of the output directory",
+        default=None,
+    )
+    parser.add_argument(
+        "--num-shards",
+        help="Number of nodes the dataset is split across",
+        type=int,
+        default=NUM_SHARDS,
+    )
+    parser.add_argument(
+        "--shard-index",
+        help="Index of the node generating its shard of sequences",
+        type=int,
+        default=SHARD_INDEX,
+    )
+    parser.add_argument(
+        "--merge",
+        help="Dataset directories of all shards to merge (moving their sequences)"
+        " into the output directory",
+        nargs="+",
+        default=None,
+    )
 
     args = parser.parse_args()
-    np.random.seed(args.seed)
-    generate_dataset(
+    if args.sweep is not None and args.profile_output is not None:
+        parser.error("--profile-output cannot be used with --sweep")
+    if args.merge is not None:
+        merge_shards(args.merge, output_dir=args.output_dir)
+        parser.exit()
+    params = dict(
         data_dir=args.data_dir,
         train_size=args.train_size,
         test_size=args.test_size,
@@ -95,4 +246,29 @@ if __name__ == "__main__":
         oscillations=args.oscillations,
         oscillations_variances=args.oscillations_variances,
         fps=args.fps,
+        seed=args.seed,
+        workers=args.workers,
+        engine=args.engine,
+        batch_size=args.batch_size,
+        output_format=args.format,
+        resume=args.resume,
+        writer_threads=args.writer_threads,
+        queue_depth=args.queue_depth,
+        atlas_dir=args.atlas_dir,
+        profile=args.profile,
+        profile_output=args.profile_output,
+        trajectories=args.trajectories,
+        shard_size=args.shard_size * 2**20,
+        color_mode=args.color_mode,
+        mask_format=args.masks,
+        instances=args.instances,
+        output_dir=args.output_dir,
+        streaming=args.stream,
+        scenario=args.scenario,
+        num_shards=args.num_shards,
+        shard_index=args.shard_index,
     )
+    if args.sweep is None:
+        generate_dataset(**params)
+    else:
+        generate_sweep(load_sweep(args.sweep), **params)
@@ -0,0 +1,190 @@
+"""Precomputed atlas of resized digit sprites of a whole MNIST subset."""
+import hashlib
+import itertools
+import json
+import logging
+import shutil
+import tempfile
+from pathlib import Path
+from typing import Any, Dict, List, Tuple
+
+import numpy as np
+from numpy.lib.format import open_memmap
+from PIL import Image
+from tqdm import tqdm
+
+from moving_multiscalemnist.manifest import params_hash
+from moving_multiscalemnist.sprite import Sprite, tight_bboxes
+
+logger = logging.getLogger(__name__)
+
+ATLAS_FILE = "atlas.json"
+
+
+def oscillated_sizes(
+    sizes: Tuple[int, ...],
+    oscillations: Tuple[float, ...],
+    oscillations_variances: Tuple[float, ...],
+    fps: float,
+    n_frames: int,
+) -> List[int]:
+    """List all digit sizes reached in sequences of given length.
+
+    .. note: sizes are calculated with the same formula as
+        :attr:`moving_multiscalemnist.digit.Digit.size`
+    """
+    t = np.arange(n_frames)
+    found = set()
+    for size, osc_t, osc_var in itertools.product(
+        sizes, oscillations, oscillations_variances
+    ):
+        sin = np.round(1 + np.sin(t / (fps * osc_t) * 2 * np.pi) * osc_var, 2)
+        found.update(np.trunc(size * sin).astype(int).tolist())
+    return sorted(size for size in found if size > 0)
+
+
+def images_digest(images: np.ndarray) -> str:
+    """Calculate SHA-256 checksum of images."""
+    return hashlib.sha256(np.ascontiguousarray(images).data).hexdigest()
+
+
+def _size_files(size: int) -> Tuple[str, str, str]:
+    return f"{size}-images.npy", f"{size}-masks.npy", f"{size}-bboxes.npy"
+
+
+def build_atlas(images: np.ndarray, sizes: List[int], directory: Path):
+    """Resize all images to all sizes and save them with masks and tight bboxes.
+
+    :param images: digit images of shape (n_images, height, width)
+    :param sizes: digit sizes
+    :param directory: output directory
+    """
+    directory.mkdir(parents=True, exist_ok=True)
+    for size in sizes:
+        images_file, masks_file, bboxes_file = _size_files(size)
+        resized = open_memmap(
+            directory.joinpath(images_file),
+            mode="w+",
+            dtype=np.uint8,
+            shape=(len(images), size, size),
+        )
+        for idx, image in enumerate(tqdm(images, desc=f"Resizing to {size}")):
+            resized[idx] = np.array(Image.fromarray(image).resize((size, size)))
+        masks = resized > 100
+        np.save(directory.joinpath(masks_file), masks)
+        np.save(directory.joinpath(bboxes_file), tight_bboxes(resized[:]))
+        resized.flush()
+        del resized
+    with directory.joinpath(ATLAS_FILE).open("w") as fp:
+        json.dump({"n_images": len(images), "sizes": list(sizes)}, fp)
+
+
+class Atlas:
+    """Resized digit images, paste masks and tight bboxes in memory-mapped arrays.
+
+    .. note: only the directory is pickled; arrays are memory-mapped again when the
+        atlas is copied to a worker process
+    """
+
+    def __init__(self, directory: str):
+        """
+        :param directory: atlas directory created by :func:`build_atlas`
+        """
+        self.directory = Path(directory)
+        self._load()
+
+    def _load(self):
+        with self.directory.joinpath(ATLAS_FILE).open("r") as fp:
+            meta = json.load(fp)
+        self.n_images: int = meta["n_images"]
+        self.sizes: Tuple[int, ...] = tuple(meta["sizes"])
+        self.images: Dict[int, np.ndarray] = {}
+        self.masks: Dict[int, np.ndarray] = {}
+        self.bboxes: Dict[int, np.ndarray] = {}
+        for size in self.sizes:
+            images_file, masks_file, bboxes_file = _size_files(size)
+            self.images[size] = np.load(
+                self.directory.joinpath(images_file), mmap_mode="r"
+            )
+            self.masks[size] = np.load(
+                self.directory.joinpath(masks_file), mmap_mode="r"
+            )
+            self.bboxes[size] = np.load(self.directory.joinpath(bboxes_file))
+
+    def __getstate__(self) -> Dict[str, Any]:
+        return {"directory": str(self.directory)}
+
+    def __setstate__(self, state: Dict[str, Any]):
+        self.directory = Path(state["directory"])
+        self._load()
+
+    def sprite(self, idx: int, image: np.ndarray) -> "AtlasSprite":
+        """Get sprite of a subset image looking up resized variants in the atlas.
+
+        :param idx: index of the image in the subset the atlas was built from
+        :param image: the image (resized when a size is missing in the atlas)
+        """
+        return AtlasSprite(image, atlas=self, idx=idx)
+
+
+class AtlasSprite(Sprite):
+    """Sprite reading resized images, masks and bboxes from an atlas."""
+
+    def __init__(self, image: np.ndarray, atlas: Atlas, idx: int):
+        """
+        :param image: digit image as np array
+        :param atlas: atlas containing the image
+        :param idx: index of the image in the atlas
+        """
+        super().__init__(image)
+        self._atlas = atlas
+        self._idx = idx
+
+    def image(self, size: int) -> Image.Image:
+        if size in self._atlas.images and size not in self._images:
+            self._images[size] = Image.fromarray(self.array(size))
+        return super().image(size)
+
+    def array(self, size: int) -> np.ndarray:
+        if size in self._atlas.images:
+            return self._atlas.images[size][self._idx]
+        return super().array(size)
+
+    def binary_mask(self, size: int) -> np.ndarray:
+        if size in self._atlas.masks:
+            return self._atlas.masks[size][self._idx]
+        return super().binary_mask(size)
+
+    def bbox(self, size: int) -> Tuple[int, int, int, int]:
+        if size in self._atlas.bboxes:
+            x1, y1, x2, y2 = self._atlas.bboxes[size][self._idx].tolist()
+            return x1, y1, x2, y2
+        return super().bbox(size)
+
+
+def load_atlas(cache_dir: str, images: np.ndarray, sizes: List[int]) -> Atlas:
+    """Load atlas of images from cache directory, building it if it is missing.
+
+    .. note: atlas directory is named after hash of images and sizes; it is built in
+        a temporary directory and renamed, so an interrupted build is never loaded
+
+    :param cache_dir: directory holding atlases
+    :param images: digit images of the whole subset
+    :param sizes: digit sizes (see :func:`oscillated_sizes`)
+    :return: memory-mapped atlas
+    """
+    key = params_hash({"images": images_digest(images), "sizes": sorted(sizes)})
+    directory = Path(cache_dir).joinpath(f"atlas-{key[:16]}")
+    if not directory.joinpath(ATLAS_FILE).exists():
+        logger.info(f"Building sprite atlas in {directory}.")
+        Path(cache_dir).mkdir(parents=True, exist_ok=True)
+        tmp = Path(tempfile.mkdtemp(dir=cache_dir, prefix=".atlas-"))
+        try:
+            build_atlas(images, sorted(sizes), tmp)
+            tmp.rename(directory)
+        except OSError:
+            if not directory.joinpath(ATLAS_FILE).exists():
+                raise
+        finally:
+            shutil.rmtree(tmp, ignore_errors=True)
+    return Atlas(str(directory))
@@ -0,0 +1,451 @@
+"""Benchmark rendering, encoding and end-to-end generation throughput."""
+import itertools
+import json
+import logging
+import platform
+import resource
+import sys
+import tempfile
+import time
+from argparse import ArgumentParser
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Tuple
+
+import numpy as np
+import PIL
+
+from moving_multiscalemnist.defaults import (
+    BATCH_SIZE,
+    DATA_DIR,
+    ENGINE,
+    FORMAT,
+    FPS,
+    IMAGE_SIZE,
+    MAX_DIGITS,
+    MIN_DIGITS,
+    N_FRAMES,
+    OSCILLATIONS,
+    OSCILLATIONS_VARIANCES,
+    SEED,
+    SIZES,
+)
+from moving_multiscalemnist.dense import iter_dense_sequence
+from moving_multiscalemnist.digit import Digit
+from moving_multiscalemnist.generate import (
+    ENGINES,
+    generate_dataset,
+    get_subset_seed_sequence,
+    prepare_subset,
+    prepare_subset_digits,
+)
+from moving_multiscalemnist.mnist import fetch_mnist
+from moving_multiscalemnist.reader import DatasetReader, load_index
+from moving_multiscalemnist.render import iter_rendered_sequences, render_batch
+from moving_multiscalemnist.sequence import prepare_sequence
+from moving_multiscalemnist.writers import WRITERS, load_arrays
+
+logger = logging.getLogger(__name__)
+
+
+def peak_rss_mb() -> float:
+    """Get peak resident set size of the process in MB."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is reported in bytes on macOS and in kilobytes elsewhere
+    return peak / 2**20 if sys.platform == "darwin" else peak / 2**10
+
+
+def synthetic_subset(
+    n_images: int = 1000, seed: int = SEED
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Create MNIST-like subset of random blobs (used when MNIST is unavailable)."""
+    random_state = np.random.RandomState(seed)
+    images = np.zeros((n_images, 28, 28), dtype=np.uint8)
+    images[:, 4:24, 6:22] = random_state.randint(0, 256, size=(n_images, 20, 16))
+    labels = random_state.randint(0, 10, size=n_images).astype(np.uint8)
+    return images, labels
+
+
+def _time_calls(function: Callable[[], Any], n_calls: int) -> float:
+    """Measure mean time of a call in microseconds."""
+    start = time.perf_counter()
+    for _ in range(n_calls):
+        function()
+    return (time.perf_counter() - start) / n_calls * 1e6
+
+
+def benchmark_digit(
+    images: np.ndarray,
+    image_size: Tuple[int, int],
+    sizes: Tuple[int, ...],
+    n_calls: int,
+) -> Dict[str, float]:
+    """Measure time of digit methods in microseconds.
+
+    .. note: `image_cold` and `bbox_cold` resize a fresh digit each time, while
+        `image` and `bbox` hit the sprite cache
+    """
+    random_state = np.random.RandomState(SEED)
+
+    def new_digit() -> Digit:
+        image = images[random_state.randint(len(images))]
+        return Digit(
+            image,
+            label=0,
+            image_size=image_size,
+            sizes=sizes,
+            oscillations=tuple(OSCILLATIONS),
+            oscillations_variances=tuple(OSCILLATIONS_VARIANCES),
+            random_state=random_state,
+        )
+
+    digit = new_digit()
+    return {
+        "init_us": _time_calls(new_digit, n_calls),
+        "update_us": _time_calls(digit.update, n_calls),
+        "image_us": _time_calls(lambda: digit.image, n_calls),
+        "bbox_us": _time_calls(lambda: digit.bbox, n_calls),
+        "image_cold_us": _time_calls(lambda: new_digit().image, n_calls),
+        "bbox_cold_us": _time_calls(lambda: new_digit().bbox, n_calls),
+    }
+
+
+def render_sequences(
+    subset: Tuple[np.ndarray, np.ndarray],
+    n_sequences: int,
+    n_frames: int,
+    max_digits: int,
+    image_size: Tuple[int, int],
+    sizes: Tuple[int, ...],
+    engine: str,
+) -> List[List[Any]]:
+    """Render sequences with given engine."""
+    seed_sequence = get_subset_seed_sequence(SEED, "train")
+    images, labels = subset
+    order, slices = prepare_subset(
+        subset,
+        n_sequences=n_sequences,
+        min_digits=min(MIN_DIGITS, max_digits),
+        max_digits=max_digits,
+        seed_sequence=seed_sequence,
+    )
+    digits = [
+        prepare_subset_digits(
+            images,
+            labels,
+            idx=idx,
+            slices=slices,
+            order=order,
+            seed_sequence=seed_sequence,
+            image_size=image_size,
+            sizes=sizes,
+            oscillations=tuple(OSCILLATIONS),
+            oscillations_variances=tuple(OSCILLATIONS_VARIANCES),
+            fps=FPS,
+        )
+        for idx in range(n_sequences)
+    ]
+    if engine == "numpy":
+        rendered = render_batch(digits, n_frames=n_frames, image_size=image_size)
+        return [list(sequence) for sequence in iter_rendered_sequences(rendered)]
+    if engine == "dense":
+        return [
+            list(
+                iter_dense_sequence(sequence, n_frames=n_frames, image_size=image_size)
+            )
+            for sequence in digits
+        ]
+    return [
+        list(prepare_sequence(sequence, n_frames=n_frames, image_size=image_size))
+        for sequence in digits
+    ]
+
+
+def benchmark_render(
+    subset: Tuple[np.ndarray, np.ndarray],
+    n_sequences: int,
+    n_frames: int,
+    max_digits: int,
+    image_size: Tuple[int, int],
+    sizes: Tuple[int, ...],
+    engine: str,
+) -> Dict[str, float]:
+    """Measure throughput of rendering sequences ready to be saved with an engine."""
+    start = time.perf_counter()
+    render_sequences(
+        subset,
+        n_sequences=n_sequences,
+        n_frames=n_frames,
+        max_digits=max_digits,
+        image_size=image_size,
+        sizes=sizes,
+        engine=engine,
+    )
+    elapsed = time.perf_counter() - start
+    return {
+        "seconds": elapsed,
+        "sequences_per_sec": n_sequences / elapsed,
+        "frames_per_sec": n_sequences * n_frames / elapsed,
+    }
+
+
+def _directory_size(directory: str) -> int:
+    """Get total size of files in directory in bytes."""
+    return sum(file.stat().st_size for file in Path(directory).rglob("*"))
+
+
+def _read_sequences(directory: str, output_format: str, n_frames: int) -> int:
+    """Decode all frames of saved subset sequentially and return number of frames."""
+    if output_format == "npy":
+        frames = load_arrays(directory)["frames"]
+        for sequence in frames:
+            np.asarray(sequence).sum()
+        return frames.shape[0] * frames.shape[1]
+    reader = DatasetReader(directory, cache_size=n_frames)
+    n_read = 0
+    for idx in range(len(reader)):
+        n_read += len(reader[idx]["frames"])
+    reader.close()
+    return n_read
+
+
+def benchmark_save(
+    sequences: List[List[Any]],
+    n_frames: int,
+    image_size: Tuple[int, int],
+    output_format: str,
+) -> Dict[str, float]:
+    """Measure encoding, writing and sequential decoding throughput of a format.
+
+    .. note: reader index is built before decoding is timed
+    """
+    with tempfile.TemporaryDirectory() as directory:
+        writer = WRITERS[output_format](directory, len(sequences), n_frames, image_size)
+        start = time.perf_counter()
+        for idx, sequence in enumerate(sequences):
+            writer.collect(idx, writer.write(idx, sequence))
+        writer.close()
+        elapsed = time.perf_counter() - start
+        size = _directory_size(directory)
+        if output_format != "npy":
+            load_index(directory)
+        start = time.perf_counter()
+        n_read = _read_sequences(directory, output_format, n_frames)
+        read_elapsed = time.perf_counter() - start
+    return {
+        "seconds": elapsed,
+        "sequences_per_sec": len(sequences) / elapsed,
+        "frames_per_sec": len(sequences) * n_frames / elapsed,
+        "megabytes": size / 2**20,
+        "megabytes_per_sec": size / 2**20 / elapsed,
+        "read_seconds": read_elapsed,
+        "read_frames_per_sec": n_read / read_elapsed,
+    }
+
+
+def benchmark_generate(
+    subset: Tuple[np.ndarray, np.ndarray],
+    n_sequences: int,
+    n_frames: int,
+    max_digits: int,
+    image_size: Tuple[int, int],
+    sizes: Tuple[int, ...],
+) -> Dict[str, float]:
+    """Measure end-to-end throughput of generating a train subset with defaults.
+
+    .. note: sequences are rendered with default engine and batch size and saved in
+        default format, so the timing includes planning, rendering, encoding,
+        writing and the dataset files
+    """
+    with tempfile.TemporaryDirectory() as directory:
+        start = time.perf_counter()
+        generate_dataset(
+            data_dir=directory,
+            train_size=n_sequences,
+            test_size=0,
+            n_frames=n_frames,
+            min_digits=min(MIN_DIGITS, max_digits),
+            max_digits=max_digits,
+            image_size=image_size,
+            sizes=sizes,
+            oscillations=tuple(OSCILLATIONS),
+            oscillations_variances=tuple(OSCILLATIONS_VARIANCES),
+            fps=FPS,
+            seed=SEED,
+            engine=ENGINE,
+            batch_size=BATCH_SIZE,
+            output_format=FORMAT,
+            output_dir=directory,
+            mnist={"train": subset, "test": subset},
+        )
+        elapsed = time.perf_counter() - start
+    return {
+        "seconds": elapsed,
+        "sequences_per_sec": n_sequences / elapsed,
+        "frames_per_sec": n_sequences * n_frames / elapsed,
+    }
+
+
+def run_benchmark(
+    subset: Tuple[np.ndarray, np.ndarray],
+    n_sequences: int,
+    n_frames: int,
+    max_digits: int,
+    image_size: Tuple[int, int],
+    sizes: Tuple[int, ...],
+    n_calls: int = 1000,
+) -> Dict[str, Any]:
+    """Run all benchmarks for a single configuration."""
+    images, _ = subset
+    results: Dict[str, Any] = {
+        "params": {
+            "n_sequences": n_sequences,
+            "n_frames": n_frames,
+            "max_digits": max_digits,
+            "image_size": list(image_size),
+            "sizes": list(sizes),
+        },
+        "digit": benchmark_digit(images, image_size, sizes, n_calls=n_calls),
+        "render": {},
+        "save": {},
+    }
+    for engine in ENGINES:
+        results["render"][engine] = benchmark_render(
+            subset,
+            n_sequences=n_sequences,
+            n_frames=n_frames,
+            max_digits=max_digits,
+            image_size=image_size,
+            sizes=sizes,
+            engine=engine,
+        )
+    sequences = render_sequences(
+        subset,
+        n_sequences=n_sequences,
+        n_frames=n_frames,
+        max_digits=max_digits,
+        image_size=image_size,
+        sizes=sizes,
+        engine="numpy",
+    )
+    for output_format in WRITERS:
+        results["save"][output_format] = benchmark_save(
+            sequences, n_frames, image_size, output_format=output_format
+        )
+    results["generate"] = benchmark_generate(
+        subset,
+        n_sequences=n_sequences,
+        n_frames=n_frames,
+        max_digits=max_digits,
+        image_size=image_size,
+        sizes=sizes,
+    )
+    return results
+
+
+def benchmark(
+    data_dir: str,
+    n_sequences: int,
+    n_frames: List[int],
+    max_digits: List[int],
+    image_sizes: List[Tuple[int, int]],
+    sizes: List[Tuple[int, ...]],
+    n_calls: int = 1000,
+) -> Dict[str, Any]:
+    """Run benchmarks over a grid of configurations.
+
+    .. note: peak resident set size is reported once for the whole benchmark, as
+        the process peak does not decrease between configurations
+    """
+    try:
+        subset = fetch_mnist(data_dir)["train"]
+        source = "mnist"
+    except FileNotFoundError:
+        logger.warning(f"MNIST not found in {data_dir}, using synthetic digits.")
+        subset = synthetic_subset()
+        source = "synthetic"
+
+    runs = []
+    for frames, digits, image_size, digit_sizes in itertools.product(
+        n_frames, max_digits, image_sizes, sizes
+    ):
+        logger.info(
+            f"Benchmarking {n_sequences} sequences of {frames} frames with up to"
+            f" {digits} digits of sizes {digit_sizes} on {image_size} images."
+        )
+        runs.append(
+            run_benchmark(
+                subset,
+                n_sequences=n_sequences,
+                n_frames=frames,
+                max_digits=digits,
+                image_size=image_size,
+                sizes=digit_sizes,
+                n_calls=n_calls,
+            )
+        )
+    return {
+        "environment": {
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "pillow": PIL.__version__,
+            "platform": platform.platform(),
+            "source": source,
+        },
+        "runs": runs,
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    parser = ArgumentParser()
+    parser.add_argument("--data-dir", "-d", help="MNIST location", default=DATA_DIR)
+    parser.add_argument(
+        "--n-sequences", "-ns", help="Sequences per run", type=int, default=64
+    )
+    parser.add_argument(
+        "--n-frames",
+        "-nf",
+        help="Frame counts",
+        nargs="+",
+        type=int,
+        default=[N_FRAMES],
+    )
+    parser.add_argument(
+        "--max-digits", help="Digit counts", nargs="+", type=int, default=[MAX_DIGITS]
+    )
+    parser.add_argument(
+        "--image-sizes",
+        "-is",
+        help="Square image sizes",
+        nargs="+",
+        type=int,
+        default=[IMAGE_SIZE[0]],
+    )
+    parser.add_argument(
+        "--sizes",
+        "-ss",
+        help="Digit sizes lists, comma separated (e.g. 16,32 64)",
+        nargs="+",
+        default=[",".join(str(size) for size in SIZES)],
+    )
+    parser.add_argument(
+        "--n-calls", help="Calls per digit method", type=int, default=1000
+    )
+    parser.add_argument("--output", "-o", help="Output JSON file (default: stdout)")
+    args = parser.parse_args()
+
+    results = benchmark(
+        data_dir=args.data_dir,
+        n_sequences=args.n_sequences,
+        n_frames=args.n_frames,
+        max_digits=args.max_digits,
+        image_sizes=[(size, size) for size in args.image_sizes],
+        sizes=[tuple(int(size) for size in sizes.split(",")) for sizes in args.sizes],
+        n_calls=args.n_calls,
+    )
+    if args.output:
+        with open(args.output, "w") as fp:
+            json.dump(results, fp, indent=2)
+    else:
+        json.dump(results, sys.stdout, indent=2)
@@ -0,0 +1,194 @@
+"""In-memory procedurally generated dataset."""
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from moving_multiscalemnist.atlas import load_atlas, oscillated_sizes
+from moving_multiscalemnist.defaults import (
+    BATCH_SIZE,
+    DATA_DIR,
+    FPS,
+    IMAGE_SIZE,
+    MAX_DIGITS,
+    MIN_DIGITS,
+    N_FRAMES,
+    OSCILLATIONS,
+    OSCILLATIONS_VARIANCES,
+    SEED,
+    SIZES,
+    TRAIN_SIZE,
+)
+from moving_multiscalemnist.generate import (
+    get_subset_seed_sequence,
+    plan_scenario,
+    prepare_subset,
+    prepare_subset_digits,
+)
+from moving_multiscalemnist.mnist import fetch_mnist
+from moving_multiscalemnist.render import RenderedBatch, render_batch
+
+
+class MovingMultiscaleMNIST:
+    """Moving multiscale MNIST rendered on the fly.
+
+    Sequence `i` is rendered deterministically from the seed and is identical to the
+    sequence `i` of the subset saved by
+    :func:`moving_multiscalemnist.generate.generate_dataset` with the same parameters.
+    Each item is a dict of np arrays:
+
+    - frames: uint8 frames of shape (frames, height, width)
+    - boxes: XYWH boxes of shape (frames, digits, 4)
+    - labels: digit labels of shape (digits,)
+    - ids: digit track ids of shape (digits,)
+
+    .. note: the dataset holds no open files nor global random state, so it may be
+        used from multiple worker processes; when iterated inside a PyTorch
+        DataLoader worker, each worker yields its own share of sequences
+    """
+
+    def __init__(
+        self,
+        data_dir: str = DATA_DIR,
+        subset: str = "train",
+        length: int = TRAIN_SIZE,
+        n_frames: int = N_FRAMES,
+        min_digits: int = MIN_DIGITS,
+        max_digits: int = MAX_DIGITS,
+        image_size: Tuple[int, int] = (IMAGE_SIZE[0], IMAGE_SIZE[1]),
+        sizes: Tuple[int, ...] = tuple(SIZES),
+        oscillations: Tuple[float, ...] = tuple(OSCILLATIONS),
+        oscillations_variances: Tuple[float, ...] = tuple(OSCILLATIONS_VARIANCES),
+        fps: int = FPS,
+        seed: int = SEED,
+        batch_size: int = BATCH_SIZE,
+        atlas_dir: Optional[str] = None,
+        scenario: bool = False,
+    ):
+        """
+        :param data_dir: MNIST location
+        :param subset: MNIST subset ("train" or "test")
+        :param length: number of sequences
+        :param n_frames: number of frames in each sequence
+        :param min_digits: minimum number of digits in sequence
+        :param max_digits: maximum number of digits in sequence
+        :param image_size: frame size
+        :param sizes: available digit sizes
+        :param oscillations: digit size change periods coefficients
+        :param oscillations_variances: proportion in which size oscillates
+        :param fps: number of frames in one second (period length)
+        :param seed: random seed
+        :param batch_size: number of sequences rendered at once when iterating
+        :param atlas_dir: cache directory of sprite atlases (digits are resized on the
+            fly if not given)
+        :param scenario: draw parameters of all digits up front (see
+            :func:`moving_multiscalemnist.generate.plan_scenario`)
+        """
+        self.length = length
+        self.n_frames = n_frames
+        self.max_digits = max_digits
+        width, height = image_size
+        self.image_size = (width, height)
+        self.batch_size = batch_size
+        self._seed_sequence = get_subset_seed_sequence(seed, subset)
+        subset_data = fetch_mnist(data_dir)[subset]
+        self._images, self._labels = subset_data
+        self._order, self._slices = prepare_subset(
+            subset_data,
+            n_sequences=length,
+            min_digits=min_digits,
+            max_digits=max_digits,
+            seed_sequence=self._seed_sequence,
+        )
+        self._digit_kwargs: Dict[str, Any] = {
+            "image_size": self.image_size,
+            "sizes": sizes,
+            "oscillations": oscillations,
+            "oscillations_variances": oscillations_variances,
+            "fps": fps,
+            "atlas": None,
+            "scenario": None,
+        }
+        if scenario:
+            self._digit_kwargs["scenario"] = plan_scenario(
+                self._labels,
+                order=self._order,
+                slices=self._slices,
+                seed_sequence=self._seed_sequence,
+                max_digits=max_digits,
+                image_size=self.image_size,
+                sizes=sizes,
+                oscillations=oscillations,
+                oscillations_variances=oscillations_variances,
+            )
+        if atlas_dir is not None:
+            self._digit_kwargs["atlas"] = load_atlas(
+                atlas_dir,
+                images=self._images,
+                sizes=oscillated_sizes(
+                    sizes, oscillations, oscillations_variances, fps, n_frames
+                ),
+            )
+
+    def __len__(self) -> int:
+        return self.length
+
+    def __getitem__(self, idx: int) -> Dict[str, np.ndarray]:
+        if idx < 0:
+            idx += self.length
+        if not 0 <= idx < self.length:
+            raise IndexError(f"Sequence index {idx} out of range")
+        return self._item(self.render([idx]), 0)
+
+    def __iter__(self) -> Iterator[Dict[str, np.ndarray]]:
+        start, stop, step = 0, self.length, 1
+        try:
+            from torch.utils.data import get_worker_info
+
+            worker_info = get_worker_info()
+        except ImportError:
+            worker_info = None
+        if worker_info is not None:
+            start, step = worker_info.id, worker_info.num_workers
+
+        indices = list(range(start, stop, step))
+        for batch_start in range(0, len(indices), self.batch_size):
+            rendered = self.render(indices[batch_start : batch_start + self.batch_size])
+            for batch_idx in range(len(rendered.n_digits)):
+                yield self._item(rendered, batch_idx)
+
+    def render(
+        self, indices: List[int], frames: Optional[np.ndarray] = None
+    ) -> RenderedBatch:
+        """Render batch of sequences with given indices.
+
+        :param indices: sequence indices
+        :param frames: preallocated array frames are rendered into (see
+            :func:`moving_multiscalemnist.render.render_batch`)
+        """
+        return render_batch(
+            [
+                prepare_subset_digits(
+                    self._images,
+                    self._labels,
+                    idx=idx,
+                    slices=self._slices,
+                    order=self._order,
+                    seed_sequence=self._seed_sequence,
+                    **self._digit_kwargs,
+                )
+                for idx in indices
+            ],
+            n_frames=self.n_frames,
+            image_size=self.image_size,
+            frames=frames,
+        )
+
+    @staticmethod
+    def _item(rendered: RenderedBatch, batch_idx: int) -> Dict[str, np.ndarray]:
+        n_digits = rendered.n_digits[batch_idx]
+        return {
+            "frames": rendered.frames[batch_idx],
+            "boxes": rendered.bboxes[batch_idx, :, :n_digits],
+            "labels": rendered.labels[batch_idx, :n_digits],
+            "ids": np.arange(n_digits),
+        }
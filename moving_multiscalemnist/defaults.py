@@ -1,4 +1,5 @@
 DATA_DIR = "mnist"
+OUTPUT_DIR = "dataset"
 TRAIN_SIZE = 2500
 TEST_SIZE = 600
 N_FRAMES = 10
@@ -10,3 +11,13 @@ OSCILLATIONS = [1.0]
 OSCILLATIONS_VARIANCES = [0.0]
 FPS = 10
 SEED = 13
+WORKERS = 1
+NUM_SHARDS = 1
+SHARD_INDEX = 0
+ENGINE = "pil"
+BATCH_SIZE = 32
+FORMAT = "jpeg"
+COLOR_MODE = "rgb"
+WRITER_THREADS = 0
+QUEUE_DEPTH = 4
+SHARD_SIZE = 2**30
@@ -0,0 +1,235 @@
+"""Renderer of dense scenes recompositing only changed regions of frames."""
+from collections import defaultdict
+from typing import Any, DefaultDict, Generator, List, Set, Tuple
+
+import numpy as np
+from PIL import Image
+
+from moving_multiscalemnist.digit import Digit
+from moving_multiscalemnist.sequence import COLOR_MODES, Frame, FrameInstances
+from moving_multiscalemnist.trajectory import DigitBatch
+
+GRID_CELL = 64
+FULL_REPAINT_FRACTION = 0.5
+
+Rect = Tuple[int, int, int, int]
+Placement = Tuple[int, int, int]
+
+
+class SpatialGrid:
+    """Index of digit footprints by cells of a regular grid.
+
+    .. note: a footprint is registered in every cell it overlaps, so querying a
+        region visits only digits pasted near it instead of all digits of a frame
+    """
+
+    def __init__(self, cell: int = GRID_CELL):
+        """
+        :param cell: cell size in pixels
+        """
+        self._cell = cell
+        self._cells: DefaultDict[Tuple[int, int], List[int]] = defaultdict(list)
+
+    def _cell_range(self, rect: Rect) -> Tuple[range, range]:
+        left, top, right, bottom = rect
+        cell = self._cell
+        return (
+            range(left // cell, (right - 1) // cell + 1),
+            range(top // cell, (bottom - 1) // cell + 1),
+        )
+
+    def insert(self, idx: int, rect: Rect):
+        """Register footprint of a digit.
+
+        :param idx: digit index
+        :param rect: non-empty left, top, right, bottom footprint
+        """
+        columns, rows = self._cell_range(rect)
+        for row in rows:
+            for column in columns:
+                self._cells[column, row].append(idx)
+
+    def query(self, rect: Rect) -> List[int]:
+        """Find digits possibly overlapping a region.
+
+        :param rect: non-empty left, top, right, bottom region
+        :return: digit indices in ascending (paste) order
+        """
+        columns, rows = self._cell_range(rect)
+        found: Set[int] = set()
+        for row in rows:
+            for column in columns:
+                found.update(self._cells.get((column, row), ()))
+        return sorted(found)
+
+
+def _footprint(
+    x1: int, y1: int, size: int, image_size: Tuple[int, int]
+) -> Tuple[int, int, int, int]:
+    """Clip pasted sprite to the frame (empty if right <= left or bottom <= top)."""
+    width, height = image_size
+    return max(x1, 0), max(y1, 0), min(x1 + size, width), min(y1 + size, height)
+
+
+def _is_empty(rect: Rect) -> bool:
+    left, top, right, bottom = rect
+    return left >= right or top >= bottom
+
+
+def _dirty_regions(
+    previous: List[Placement], current: List[Placement], image_size: Tuple[int, int]
+) -> List[Rect]:
+    """List regions covering footprints of moved or resized digits.
+
+    Footprints (in previous and current frame) of changed digits mark cells of a
+    grid as dirty; horizontal runs of dirty cells are merged into regions, or the
+    whole frame is a single region if most cells are dirty.
+
+    .. note: digits are compared by placement instead of footprint, as a digit
+        larger than the frame may move or change size with the same footprint
+
+    :param previous: x1, y1 and size of digits in previous frame
+    :param current: x1, y1 and size of digits in current frame
+    :param image_size: target image size
+    :return: disjoint left, top, right, bottom regions
+    """
+    width, height = image_size
+    dirty = np.zeros((-(-height // GRID_CELL), -(-width // GRID_CELL)), dtype=bool)
+    for before, after in zip(previous, current):
+        if before == after:
+            continue
+        for left, top, right, bottom in (
+            _footprint(*before, image_size),
+            _footprint(*after, image_size),
+        ):
+            if left < right and top < bottom:
+                dirty[
+                    top // GRID_CELL : (bottom - 1) // GRID_CELL + 1,
+                    left // GRID_CELL : (right - 1) // GRID_CELL + 1,
+                ] = True
+    if dirty.mean() >= FULL_REPAINT_FRACTION:
+        return [(0, 0, width, height)]
+
+    regions = []
+    for row, cells in enumerate(dirty.tolist()):
+        top, bottom = row * GRID_CELL, min((row + 1) * GRID_CELL, height)
+        column = 0
+        while column < len(cells):
+            if not cells[column]:
+                column += 1
+                continue
+            start = column
+            while column < len(cells) and cells[column]:
+                column += 1
+            regions.append(
+                (start * GRID_CELL, top, min(column * GRID_CELL, width), bottom)
+            )
+    return regions
+
+
+def iter_dense_sequence(
+    digits: List[Digit],
+    n_frames: int,
+    image_size: Tuple[int, int],
+    color_mode: str = "rgb",
+    instances: bool = False,
+) -> Generator[Frame, None, None]:
+    """Render a sequence of many digits on a single canvas updated in place.
+
+    The first frame is composited in full. In each following frame, only footprints
+    of digits which moved or changed size (in previous and current frame) are
+    cleared and recomposited; digits overlapping such a region are found in a
+    spatial grid and pasted in their order, clipped to the region, so frames are
+    the same as of :func:`moving_multiscalemnist.sequence.prepare_sequence`.
+
+    .. note: compositing work per frame scales with area of moving digits instead
+        of number of digits times frame size, and memory with a single frame instead
+        of the whole sequence or batch
+
+    :param digits: digits of the sequence
+    :param n_frames: number of frames to generate
+    :param image_size: target image size
+    :param color_mode: mode of generated frames (see
+        :data:`moving_multiscalemnist.sequence.COLOR_MODES`)
+    :param instances: also yield instance id maps and visible fractions of digits
+    :return: generator of frames in format of `prepare_sequence`
+    """
+    width, height = image_size
+    batch = DigitBatch([digits])
+    trajectories = batch.trajectories(n_frames)
+    bboxes = batch.bboxes(trajectories)[:, 0].tolist()
+    sprites = batch.sprites[0]
+    n_digits = len(digits)
+    labels = [digit.label for digit in digits]
+    ids = list(range(n_digits))
+    sizes = trajectories.sizes[:, 0, :n_digits].tolist()
+    xs = trajectories.x1[:, 0, :n_digits].tolist()
+    ys = trajectories.y1[:, 0, :n_digits].tolist()
+
+    canvas = np.zeros((height, width), dtype=np.uint8)
+    id_map = np.zeros((height, width), dtype=np.uint8) if instances else None
+    previous: List[Placement] = []
+    for frame_idx in range(n_frames):
+        frame_sizes = sizes[frame_idx]
+        frame_xs, frame_ys = xs[frame_idx], ys[frame_idx]
+        placements = list(zip(frame_xs, frame_ys, frame_sizes))
+        current = [_footprint(x1, y1, size, image_size) for x1, y1, size in placements]
+        grid = SpatialGrid()
+        for digit_idx, rect in enumerate(current):
+            if not _is_empty(rect):
+                grid.insert(digit_idx, rect)
+        regions = (
+            [(0, 0, width, height)]
+            if frame_idx == 0
+            else _dirty_regions(previous, placements, image_size)
+        )
+
+        for region in regions:
+            left, top, right, bottom = region
+            canvas[top:bottom, left:right] = 0
+            if id_map is not None:
+                id_map[top:bottom, left:right] = 0
+            for digit_idx in grid.query(region):
+                x1, y1 = frame_xs[digit_idx], frame_ys[digit_idx]
+                size = frame_sizes[digit_idx]
+                footprint = current[digit_idx]
+                paste_left, paste_top = max(left, footprint[0]), max(top, footprint[1])
+                paste_right = min(right, footprint[2])
+                paste_bottom = min(bottom, footprint[3])
+                if paste_left >= paste_right or paste_top >= paste_bottom:
+                    continue
+                sprite = sprites[digit_idx]
+                crop = (
+                    slice(paste_top - y1, paste_bottom - y1),
+                    slice(paste_left - x1, paste_right - x1),
+                )
+                mask = sprite.binary_mask(size)[crop]
+                target = (
+                    slice(paste_top, paste_bottom),
+                    slice(paste_left, paste_right),
+                )
+                np.copyto(canvas[target], sprite.array(size)[crop], where=mask)
+                if id_map is not None:
+                    np.copyto(id_map[target], digit_idx + 1, where=mask)
+        previous = placements
+
+        image = Image.fromarray(canvas.copy())
+        annotations: Tuple[Any, ...] = (
+            image if color_mode == "gray" else image.convert(COLOR_MODES[color_mode]),
+            [tuple(bbox) for bbox in bboxes[frame_idx][:n_digits]],
+            labels,
+            ids,
+        )
+        if id_map is not None:
+            counts = np.bincount(id_map.ravel(), minlength=n_digits + 1)[1:].tolist()
+            areas = [sprite.area(size) for sprite, size in zip(sprites, frame_sizes)]
+            annotations += (
+                FrameInstances(
+                    id_map.copy(),
+                    [
+                        count / area if area else 0.0
+                        for count, area in zip(counts, areas)
+                    ],
+                ),
+            )
+        yield annotations
@@ -1,33 +1,63 @@
 """Handler for moving digit."""
-from typing import Tuple
+from typing import NamedTuple, Optional, Tuple, Union
 
 import numpy as np
 from PIL import Image
 
+from moving_multiscalemnist.sprite import Sprite
+
+
+class DigitParams(NamedTuple):
+    """Parameters of a digit drawn when it is created.
+
+    :param size: base digit size
+    :param osc_t: oscillation period factor
+    :param osc_var: proportion in which size oscillates
+    :param osc_dir: oscillation direction
+    :param x: relative horizontal position of digit center
+    :param y: relative vertical position of digit center
+    :param vel_x: horizontal velocity
+    :param vel_y: vertical velocity
+    """
+
+    size: int
+    osc_t: float
+    osc_var: float
+    osc_dir: int
+    x: float
+    y: float
+    vel_x: float
+    vel_y: float
+
 
 class Digit:
     """Single digit from MNIST."""
 
     def __init__(
         self,
-        image: np.ndarray,
+        image: Union[np.ndarray, Sprite],
         label: int,
         image_size: Tuple[int, int],
         sizes: Tuple[int, ...],
         oscillations: Tuple[float, ...] = (0.8, 1.0, 1.2, 1.4),
         oscillations_variances: Tuple[float, ...] = (0.0, 0.1, 0.2, 0.3),
         fps: int = 10,
+        random_state: Optional[np.random.RandomState] = None,
+        params: Optional[DigitParams] = None,
     ):
         """
-        :param image: digit image as np array
+        :param image: digit image as np array or sprite shared with other digits
         :param label: digit label
         :param image_size: target image size (width, height)
         :param sizes: available digit sizes
         :param oscillations: oscillation period factor
         :param oscillations_variances: proportion in which size oscillates
         :param fps: number of frames per second (period)
+        :param random_state: random state to draw digit parameters from (defaults to
+            global numpy random state)
+        :param params: parameters of the digit (drawn from random state if not given)
         """
-        self._image = Image.fromarray(image)
+        self._sprite = image if isinstance(image, Sprite) else Sprite(image)
         self.label = label
 
         self._t: int = 0
@@ -35,16 +65,29 @@ class Digit:
 
         self._image_width, self._image_height = image_size
 
-        self._size = np.random.choice(sizes)
-        self._osc_t = np.random.choice(oscillations)
-        self._osc_var = np.random.choice(oscillations_variances)
-        self._osc_dir = np.random.choice([1, -1])
-
-        self._x = np.random.uniform(self.x_margin, 1 - self.x_margin)
-        self._y = np.random.uniform(self.y_margin, 1 - self.y_margin)
-
-        self._vel_x = np.random.uniform(-1, 1)
-        self._vel_y = np.random.uniform(-1, 1)
+        if params is None:
+            rng = np.random if random_state is None else random_state
+            self._size = rng.choice(sizes)
+            self._osc_t = rng.choice(oscillations)
+            self._osc_var = rng.choice(oscillations_variances)
+            self._osc_dir = rng.choice([1, -1])
+
+            self._x = rng.uniform(self.x_margin, 1 - self.x_margin)
+            self._y = rng.uniform(self.y_margin, 1 - self.y_margin)
+
+            self._vel_x = rng.uniform(-1, 1)
+            self._vel_y = rng.uniform(-1, 1)
+        else:
+            (
+                self._size,
+                self._osc_t,
+                self._osc_var,
+                self._osc_dir,
+                self._x,
+                self._y,
+                self._vel_x,
+                self._vel_y,
+            ) = params
 
         self._x_bounce = -1
         self._y_bounce = -1
@@ -52,7 +95,19 @@ class Digit:
 
     @property
     def image(self) -> Image.Image:
-        return self._image.resize((self.size, self.size))
+        return self._sprite.image(self.size)
+
+    @property
+    def mask(self) -> Image.Image:
+        return self._sprite.mask(self.size)
+
+    @property
+    def binary_mask(self) -> np.ndarray:
+        return self._sprite.binary_mask(self.size)
+
+    @property
+    def area(self) -> int:
+        return self._sprite.area(self.size)
 
     def _sin(self) -> float:
         return round(
@@ -61,11 +116,11 @@ class Digit:
 
     @property
     def x1(self) -> int:
-        return int(self._x * self._image_width - self.image.width / 2)
+        return int(self._x * self._image_width - self.size / 2)
 
     @property
     def y1(self) -> int:
-        return int(self._y * self._image_height - self.image.height / 2)
+        return int(self._y * self._image_height - self.size / 2)
 
     @property
     def size(self) -> int:
@@ -86,10 +141,7 @@ class Digit:
         .. note: MNIST digits are usually smaller than the image, hence for tight bbox
             coordinates need to be recalculated
         """
-        coords = np.where(np.array(self.image) > 0)
-        white_ys = coords[0]
-        white_xs = coords[1]
-        return white_xs.min(), white_ys.min(), white_xs.max(), white_ys.max()
+        return self._sprite.bbox(self.size)
 
     def shall_bounce_horizontally(self) -> bool:
         shall_bounce = self._x < self.x_margin or 1 - self.x_margin < self._x
@@ -1,27 +1,378 @@
 """Generate dataset."""
 import logging
+import multiprocessing
+import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from itertools import chain
+from multiprocessing import Pool
+from multiprocessing.synchronize import Barrier
 from pathlib import Path
-from typing import Generator, Iterable, List, Tuple
+from typing import Any, Deque, Dict, Generator, Iterable, List, Optional, Set, Tuple
 
 import numpy as np
-from PIL.Image import Image
-from tqdm import trange
+from tqdm import tqdm, trange
 
+from moving_multiscalemnist import profiling
+from moving_multiscalemnist.atlas import Atlas, load_atlas, oscillated_sizes
+from moving_multiscalemnist.defaults import QUEUE_DEPTH
+from moving_multiscalemnist.dense import iter_dense_sequence
 from moving_multiscalemnist.digit import Digit
+from moving_multiscalemnist.manifest import Manifest, file_checksums
 from moving_multiscalemnist.mnist import fetch_mnist
-from moving_multiscalemnist.prepare import prepare_dataset
-from moving_multiscalemnist.sequence import prepare_sequence, save_sequence
+from moving_multiscalemnist.prepare import save_dataset_files, sequence_images
+from moving_multiscalemnist.render import iter_rendered_sequences, render_batch
+from moving_multiscalemnist.scenario import (
+    SCENARIO_BLOCK,
+    SCENARIO_FILE,
+    DigitParamColumns,
+    Scenario,
+    draw_digit_params,
+    save_scenario,
+)
+from moving_multiscalemnist.sequence import (
+    COLOR_MODES,
+    MASK_FORMATS,
+    MAX_INSTANCES,
+    Frame,
+    prepare_sequence,
+)
+from moving_multiscalemnist.sharding import save_shard_info, shard_range
+from moving_multiscalemnist.trajectory import (
+    TRAJECTORIES_FILE,
+    DigitBatch,
+    concatenate_trajectories,
+    save_trajectories,
+)
+from moving_multiscalemnist.writers import (
+    WRITERS,
+    ApngWriter,
+    SequenceWriter,
+    TarWriter,
+)
 
 logger = logging.getLogger(__name__)
 
+SHUFFLE_KEY = 0
+PLAN_KEY = 1
+SEQUENCE_KEY = 2
+SCENARIO_KEY = 3
 
-def shuffle_subset(
-    subset: Tuple[np.ndarray, np.ndarray]
+SUBSETS = ("train", "test")
+
+ENGINES = ("pil", "numpy", "dense")
+
+PROFILE_FILE = "profile.json"
+
+
+def child_seed_sequence(
+    seed_sequence: np.random.SeedSequence, *key: int
+) -> np.random.SeedSequence:
+    """Get child seed sequence addressed by key.
+
+    .. note: equivalent to the child obtained with `SeedSequence.spawn`, but does not
+        depend on how many children were spawned before
+    """
+    return np.random.SeedSequence(
+        seed_sequence.entropy,
+        spawn_key=tuple(seed_sequence.spawn_key) + key,
+        pool_size=seed_sequence.pool_size,
+    )
+
+
+def get_subset_seed_sequence(seed: int, subset: str) -> np.random.SeedSequence:
+    """Get seed sequence of dataset subset."""
+    return child_seed_sequence(np.random.SeedSequence(seed), SUBSETS.index(subset))
+
+
+def get_random_state(seed_sequence: np.random.SeedSequence) -> np.random.RandomState:
+    """Create random state seeded with given seed sequence."""
+    return np.random.RandomState(np.random.MT19937(seed_sequence))
+
+
+def shuffle_order(
+    n_labels: int, random_state: Optional[np.random.RandomState] = None
+) -> np.ndarray:
+    """Draw order in which digits of subset are used."""
+    rng = np.random if random_state is None else random_state
+    return rng.permutation(n_labels)
+
+
+def plan_subset(
+    n_labels: int,
+    n_sequences: int,
+    min_digits: int,
+    max_digits: int,
+    random_state: np.random.RandomState,
+) -> np.ndarray:
+    """Assign consecutive slices of shuffled subset to sequences.
+
+    :param n_labels: number of digits in subset
+    :param n_sequences: number of sequences to generate
+    :param min_digits: minimum number of digits in sequence
+    :param max_digits: maximum number of digits in sequence
+    :param random_state: random state to draw number of digits from
+    :return: start and end index of digits for each sequence
+    """
+    n_digits = random_state.randint(min_digits, max_digits + 1, size=n_sequences)
+    slices = np.zeros((n_sequences, 2), dtype=np.int64)
+    start_idx = 0
+    for idx, count in enumerate(n_digits.tolist()):
+        if start_idx + count > n_labels:
+            start_idx = 0
+        end_idx = start_idx + count
+        slices[idx] = start_idx, end_idx
+        start_idx = end_idx
+    return slices
+
+
+def prepare_subset_digits(
+    images: np.ndarray,
+    labels: np.ndarray,
+    idx: int,
+    slices: np.ndarray,
+    seed_sequence: np.random.SeedSequence,
+    image_size: Tuple[int, int],
+    sizes: Tuple[int, ...],
+    oscillations: Tuple[float, ...],
+    oscillations_variances: Tuple[float, ...],
+    fps: int,
+    order: Optional[np.ndarray] = None,
+    atlas: Optional[Atlas] = None,
+    scenario: Optional[Scenario] = None,
+) -> List[Digit]:
+    """Prepare digits of single sequence of shuffled subset.
+
+    .. note: each sequence draws from its own random state derived from subset seed
+        sequence and sequence index, hence it does not depend on other sequences
+
+    :param order: order of digits in shuffled subset (subset is already shuffled if
+        not given)
+    :param atlas: sprite atlas built from (not shuffled) subset images
+    :param scenario: scenario of the subset digits are created from (see
+        :func:`plan_scenario`), in which case nothing is drawn
+    """
+    if scenario is not None:
+        return [
+            Digit(
+                image=(
+                    images[source]
+                    if atlas is None
+                    else atlas.sprite(source, images[source])
+                ),
+                label=label,
+                image_size=image_size,
+                sizes=sizes,
+                fps=fps,
+                params=params,
+            )
+            for source, label, params in scenario.sequence_digits(idx)
+        ]
+    random_state = get_random_state(
+        child_seed_sequence(seed_sequence, SEQUENCE_KEY, int(idx))
+    )
+    start_idx, end_idx = slices[idx]
+    digit_indices = (
+        range(start_idx, end_idx) if order is None else order[start_idx:end_idx]
+    )
+    return [
+        Digit(
+            image=(
+                images[digit_idx]
+                if atlas is None
+                else atlas.sprite(int(digit_idx), images[digit_idx])
+            ),
+            label=labels[digit_idx].item(),
+            image_size=image_size,
+            sizes=sizes,
+            oscillations=oscillations,
+            oscillations_variances=oscillations_variances,
+            fps=fps,
+            random_state=random_state,
+        )
+        for digit_idx in digit_indices
+    ]
+
+
+def prepare_subset_sequence(
+    images: np.ndarray,
+    labels: np.ndarray,
+    idx: int,
+    slices: np.ndarray,
+    seed_sequence: np.random.SeedSequence,
+    n_frames: int,
+    image_size: Tuple[int, int],
+    sizes: Tuple[int, ...],
+    oscillations: Tuple[float, ...],
+    oscillations_variances: Tuple[float, ...],
+    fps: int,
+    order: Optional[np.ndarray] = None,
+    atlas: Optional[Atlas] = None,
+    color_mode: str = "rgb",
+    instances: bool = False,
+    scenario: Optional[Scenario] = None,
+) -> Generator[Frame, None, None]:
+    """Prepare single sequence of shuffled subset."""
+    with profiling.stage("digits"):
+        digits = prepare_subset_digits(
+            images,
+            labels,
+            idx=idx,
+            slices=slices,
+            seed_sequence=seed_sequence,
+            image_size=image_size,
+            sizes=sizes,
+            oscillations=oscillations,
+            oscillations_variances=oscillations_variances,
+            fps=fps,
+            order=order,
+            atlas=atlas,
+            scenario=scenario,
+        )
+    return prepare_sequence(
+        digits,
+        n_frames=n_frames,
+        image_size=image_size,
+        color_mode=color_mode,
+        instances=instances,
+    )
+
+
+def prepare_subset(
+    subset: Tuple[np.ndarray, np.ndarray],
+    n_sequences: int,
+    min_digits: int,
+    max_digits: int,
+    seed_sequence: np.random.SeedSequence,
 ) -> Tuple[np.ndarray, np.ndarray]:
-    """Shuffle subset in unison."""
-    images, labels = subset
-    indices = np.random.permutation(len(labels))
-    return images[indices], labels[indices]
+    """Shuffle subset and plan digit slices of all sequences.
+
+    .. note: subset is not copied, digits are gathered in shuffled order instead, so
+        memory-mapped images are shared by all processes
+
+    :return: order of digits in shuffled subset and digit slices of sequences
+    """
+    _, labels = subset
+    order = shuffle_order(
+        len(labels), get_random_state(child_seed_sequence(seed_sequence, SHUFFLE_KEY))
+    )
+    slices = plan_subset(
+        len(labels),
+        n_sequences=n_sequences,
+        min_digits=min_digits,
+        max_digits=max_digits,
+        random_state=get_random_state(child_seed_sequence(seed_sequence, PLAN_KEY)),
+    )
+    return order, slices
+
+
+def sequence_labels(
+    labels: np.ndarray, order: np.ndarray, slices: np.ndarray
+) -> Set[int]:
+    """Find labels of digits present in sequences.
+
+    :param labels: labels of (not shuffled) subset
+    :param order: order of digits in shuffled subset
+    :param slices: digit slices of sequences (see :func:`prepare_subset`)
+    :return: labels of digits of the sequences
+    """
+    counts = np.zeros(len(order) + 1, dtype=np.int64)
+    np.add.at(counts, slices[:, 0], 1)
+    np.add.at(counts, slices[:, 1], -1)
+    used = np.cumsum(counts[:-1]) > 0
+    return set(np.unique(labels[order[used]]).tolist())
+
+
+def plan_scenario(
+    labels: np.ndarray,
+    order: np.ndarray,
+    slices: np.ndarray,
+    seed_sequence: np.random.SeedSequence,
+    max_digits: int,
+    image_size: Tuple[int, int],
+    sizes: Tuple[int, ...],
+    oscillations: Tuple[float, ...],
+    oscillations_variances: Tuple[float, ...],
+) -> Scenario:
+    """Draw parameters of all digits of subset with vectorized calls.
+
+    Parameters are drawn for blocks of `SCENARIO_BLOCK` sequences with `max_digits`
+    digits each, from a random state of the block, and digits missing in sequences
+    are dropped; hence a sequence depends only on its block and index, not on the
+    number of sequences.
+
+    .. note: digits are drawn from other random states than the ones of
+        :func:`prepare_subset_digits`, so sequences differ from the ones drawn
+        digit by digit
+
+    :param labels: labels of (not shuffled) subset
+    :param order: order of digits in shuffled subset
+    :param slices: digit slices of sequences (see :func:`prepare_subset`)
+    :param seed_sequence: seed sequence of the subset
+    :param max_digits: maximum number of digits in sequence
+    :return: scenario of all sequences
+    """
+    n_sequences = len(slices)
+    counts = slices[:, 1] - slices[:, 0]
+    digit_offsets = np.zeros(n_sequences + 1, dtype=np.int64)
+    np.cumsum(counts, out=digit_offsets[1:])
+    positions = np.repeat(slices[:, 0] - digit_offsets[:-1], counts) + np.arange(
+        digit_offsets[-1]
+    )
+    source = order[positions]
+    valid = np.arange(max_digits)[None, :] < counts[:, None]
+    columns: List[List[np.ndarray]] = [[] for _ in DigitParamColumns._fields]
+    # a subset without sequences gets a single empty block, hence empty columns
+    for block, start in enumerate(range(0, max(n_sequences, 1), SCENARIO_BLOCK)):
+        stop = min(start + SCENARIO_BLOCK, n_sequences)
+        params = draw_digit_params(
+            get_random_state(child_seed_sequence(seed_sequence, SCENARIO_KEY, block)),
+            shape=(SCENARIO_BLOCK, max_digits),
+            image_size=image_size,
+            sizes=sizes,
+            oscillations=oscillations,
+            oscillations_variances=oscillations_variances,
+        )
+        for column, values in zip(columns, params):
+            column.append(values[: stop - start][valid[start:stop]])
+    return Scenario(
+        digit_offsets,
+        source,
+        labels[source].astype(np.int64),
+        *(np.concatenate(column) for column in columns),
+    )
+
+
+def prepare_subset_scenario(
+    subset: Tuple[np.ndarray, np.ndarray],
+    n_sequences: int,
+    min_digits: int,
+    max_digits: int,
+    seed_sequence: np.random.SeedSequence,
+    image_size: Tuple[int, int],
+    sizes: Tuple[int, ...],
+    oscillations: Tuple[float, ...],
+    oscillations_variances: Tuple[float, ...],
+) -> Scenario:
+    """Shuffle subset, plan digit slices and draw scenario of all sequences."""
+    order, slices = prepare_subset(
+        subset,
+        n_sequences=n_sequences,
+        min_digits=min_digits,
+        max_digits=max_digits,
+        seed_sequence=seed_sequence,
+    )
+    return plan_scenario(
+        subset[1],
+        order=order,
+        slices=slices,
+        seed_sequence=seed_sequence,
+        max_digits=max_digits,
+        image_size=image_size,
+        sizes=sizes,
+        oscillations=oscillations,
+        oscillations_variances=oscillations_variances,
+    )
 
 
 def generate_subset(
@@ -35,13 +386,10 @@ def generate_subset(
     oscillations: Tuple[float, ...],
     oscillations_variances: Tuple[float, ...],
     fps: int,
-) -> Generator[
-    Iterable[
-        Tuple[Image, List[Tuple[float, float, float, float]], List[int], List[int]]
-    ],
-    None,
-    None,
-]:
+    seed_sequence: Optional[np.random.SeedSequence] = None,
+    color_mode: str = "rgb",
+    instances: bool = False,
+) -> Generator[Iterable[Frame], None, None]:
     """Generate subset of moving multiscale MNIST.
 
     :param subset: tuple of images and labels
@@ -54,31 +402,428 @@ def generate_subset(
     :param oscillations: digit size change periods coefficients
     :param oscillations_variances: proportion in which size oscillates
     :param fps: number of frames in one second (period length)
+    :param seed_sequence: seed sequence of the subset (drawn from global numpy random
+        state if not given)
+    :param color_mode: "rgb" (three identical channels) or "gray" (single channel)
+    :param instances: also yield instance id maps and visible fractions of digits
+        with frames (see :class:`moving_multiscalemnist.sequence.FrameInstances`)
     :return: generator of sequences of frames, boxes, labels and track ids
     """
-    images, labels = shuffle_subset(subset)
-    start_idx = 0
-    for _ in trange(n_sequences, desc="Generating"):
-        n_digits = np.random.randint(min_digits, max_digits + 1)
-        if start_idx + n_digits > len(labels):
-            start_idx = 0
+    if seed_sequence is None:
+        seed_sequence = np.random.SeedSequence(np.random.randint(2**31))
+    images, labels = subset
+    order, slices = prepare_subset(
+        subset,
+        n_sequences=n_sequences,
+        min_digits=min_digits,
+        max_digits=max_digits,
+        seed_sequence=seed_sequence,
+    )
+    for idx in trange(n_sequences, desc="Generating"):
+        yield prepare_subset_sequence(
+            images,
+            labels,
+            idx=idx,
+            slices=slices,
+            order=order,
+            seed_sequence=seed_sequence,
+            n_frames=n_frames,
+            image_size=image_size,
+            sizes=sizes,
+            oscillations=oscillations,
+            oscillations_variances=oscillations_variances,
+            fps=fps,
+            color_mode=color_mode,
+            instances=instances,
+        )
 
-        end_idx = start_idx + n_digits
-        digits = [
-            Digit(
-                image=images[idx],
-                label=labels[idx].item(),
-                image_size=image_size,
-                sizes=sizes,
-                oscillations=oscillations,
-                oscillations_variances=oscillations_variances,
-                fps=fps,
+
+def save_subset_trajectories(
+    subset: Tuple[np.ndarray, np.ndarray],
+    path: Path,
+    n_sequences: int,
+    n_frames: int,
+    min_digits: int,
+    max_digits: int,
+    image_size: Tuple[int, int],
+    sizes: Tuple[int, ...],
+    oscillations: Tuple[float, ...],
+    oscillations_variances: Tuple[float, ...],
+    fps: int,
+    seed_sequence: np.random.SeedSequence,
+    atlas: Optional[Atlas] = None,
+    scenario: Optional[Scenario] = None,
+    num_shards: int = 1,
+    shard_index: int = 0,
+    batch_size: int = 1,
+):
+    """Save digit trajectories and boxes of sequences of subset without rendering.
+
+    .. note: trajectories are identical to the ones of sequences saved with
+        :func:`save_subset` with the same parameters; sequences are padded to
+        `max_digits`, so trajectories of batches (and of shards, on merge) are
+        concatenated
+
+    :param batch_size: number of sequences whose digits are created and moved at
+        once
+    :param num_shards: number of shards the subset is split into
+    :param shard_index: index of the shard of sequences to save (see
+        :func:`moving_multiscalemnist.sharding.shard_range`)
+    """
+    images, labels = subset
+    order, slices = prepare_subset(
+        subset,
+        n_sequences=n_sequences,
+        min_digits=min_digits,
+        max_digits=max_digits,
+        seed_sequence=seed_sequence,
+    )
+    shard = shard_range(n_sequences, num_shards, shard_index)
+    batch_size = max(1, batch_size)
+    parts = []
+    # an empty shard gets a single empty batch, hence empty arrays
+    for start in range(shard.start, max(shard.stop, shard.start + 1), batch_size):
+        batch = DigitBatch(
+            [
+                prepare_subset_digits(
+                    images,
+                    labels,
+                    idx=idx,
+                    slices=slices,
+                    order=order,
+                    atlas=atlas,
+                    scenario=scenario,
+                    seed_sequence=seed_sequence,
+                    image_size=image_size,
+                    sizes=sizes,
+                    oscillations=oscillations,
+                    oscillations_variances=oscillations_variances,
+                    fps=fps,
+                )
+                for idx in range(start, min(start + batch_size, shard.stop))
+            ],
+            max_digits=max_digits,
+        )
+        trajectories = batch.trajectories(n_frames)
+        parts.append((trajectories, batch.bboxes(trajectories)))
+    path.parent.mkdir(parents=True, exist_ok=True)
+    save_trajectories(path, *concatenate_trajectories(parts))
+
+
+_worker_kwargs: Dict[str, Any] = {}
+_writer_executor: Optional[ThreadPoolExecutor] = None
+_pending: Deque[Future] = deque()
+_close_barrier: Optional[Barrier] = None
+
+
+def _init_worker(kwargs: Dict[str, Any], close_barrier: Optional[Barrier] = None):
+    """Store arguments shared by all sequences in worker process."""
+    global _writer_executor, _close_barrier
+    _worker_kwargs.update(kwargs)
+    profiling.configure(*kwargs.get("profile", (False, None)))
+    _close_worker()
+    _close_barrier = close_barrier
+    if kwargs.get("writer_threads", 0) > 0:
+        _writer_executor = ThreadPoolExecutor(kwargs["writer_threads"])
+
+
+def _close_worker() -> List[Tuple[int, Any, Dict[str, str]]]:
+    """Wait for pending writes and stop writer threads.
+
+    :return: results of writes still pending after the last batch
+    """
+    global _writer_executor
+    results = [future.result() for future in _pending]
+    _pending.clear()
+    if _writer_executor is not None:
+        _writer_executor.shutdown()
+        _writer_executor = None
+    return results
+
+
+def _drain_worker(
+    _: int,
+) -> Tuple[List[Tuple[int, Any, Dict[str, str]]], profiling.Stats]:
+    """Wait for pending writes once all batches are saved.
+
+    .. note: workers of a pool wait for each other on a barrier first, so each one
+        of them takes exactly one of as many calls as there are workers
+    """
+    if _close_barrier is not None:
+        _close_barrier.wait()
+    results = _close_worker()
+    return results, profiling.collect()
+
+
+def _write_sequence(
+    writer: SequenceWriter, idx: int, sequence: Iterable[Any]
+) -> Tuple[int, Any, Dict[str, str]]:
+    """Write single sequence and calculate checksums of its files."""
+    result = writer.write(idx, sequence)
+    with profiling.stage("checksum"):
+        checksums = file_checksums(writer.directory, writer.sequence_files(idx))
+    return idx, result, checksums
+
+
+def _save_subset_batch(
+    indices: List[int],
+) -> Tuple[List[Tuple[int, Any, Dict[str, str]]], profiling.Stats]:
+    """Prepare and save batch of sequences in worker process.
+
+    :return: results of saved sequences and stage timings recorded in the process
+    """
+    with profiling.profile_hot_loop():
+        results = _save_batch(indices)
+    return results, profiling.collect()
+
+
+def _save_batch(indices: List[int]) -> List[Tuple[int, Any, Dict[str, str]]]:
+    """Prepare and save batch of sequences.
+
+    .. note: when writer threads are enabled, rendered sequences are handed to the
+        threads (which encode and write them), while the next sequences are rendered;
+        at most `queue_depth` rendered sequences wait to be written (with a streaming
+        writer, sequences are rendered frame by frame by the threads instead); writes
+        still pending at the end of the batch overlap with rendering of the next
+        batch, and are waited for only by :func:`_close_worker`
+
+    :return: results of sequences written so far, of this or previous batches
+    """
+    kwargs = dict(_worker_kwargs)
+    writer = kwargs.pop("writer")
+    engine = kwargs.pop("engine")
+    n_frames = kwargs.pop("n_frames")
+    queue_depth = max(1, kwargs.pop("queue_depth", QUEUE_DEPTH))
+    color_mode = kwargs.pop("color_mode", "rgb")
+    instances = kwargs.pop("instances", False)
+    kwargs.pop("writer_threads", None)
+    kwargs.pop("profile", None)
+    sequences: Iterable[Iterable[Any]]
+    if engine == "numpy":
+        with profiling.stage("digits"):
+            digits = [prepare_subset_digits(idx=idx, **kwargs) for idx in indices]
+        with profiling.stage("render"):
+            rendered = render_batch(
+                digits,
+                n_frames=n_frames,
+                image_size=kwargs["image_size"],
+                instances=instances,
+            )
+        sequences = iter_rendered_sequences(rendered, color_mode=color_mode)
+    elif engine == "dense":
+        sequences = (
+            iter_dense_sequence(
+                prepare_subset_digits(idx=idx, **kwargs),
+                n_frames=n_frames,
+                image_size=kwargs["image_size"],
+                color_mode=color_mode,
+                instances=instances,
             )
-            for idx in range(start_idx, end_idx)
+            for idx in indices
+        )
+    else:
+        sequences = (
+            prepare_subset_sequence(
+                idx=idx,
+                n_frames=n_frames,
+                color_mode=color_mode,
+                instances=instances,
+                **kwargs,
+            )
+            for idx in indices
+        )
+
+    if _writer_executor is None:
+        return [
+            _write_sequence(writer, idx, sequence)
+            for idx, sequence in zip(indices, sequences)
         ]
-        yield prepare_sequence(digits, n_frames=n_frames, image_size=image_size)
 
-        start_idx = end_idx
+    results = []
+    for idx, sequence in zip(indices, sequences):
+        if len(_pending) >= queue_depth:
+            results.append(_pending.popleft().result())
+        _pending.append(
+            _writer_executor.submit(
+                _write_sequence,
+                writer,
+                idx,
+                sequence if writer.streaming else list(sequence),
+            )
+        )
+    while _pending and _pending[0].done():
+        results.append(_pending.popleft().result())
+    return results
+
+
+def save_subset(
+    subset: Tuple[np.ndarray, np.ndarray],
+    writer: SequenceWriter,
+    n_sequences: int,
+    n_frames: int,
+    min_digits: int,
+    max_digits: int,
+    image_size: Tuple[int, int],
+    sizes: Tuple[int, ...],
+    oscillations: Tuple[float, ...],
+    oscillations_variances: Tuple[float, ...],
+    fps: int,
+    seed_sequence: np.random.SeedSequence,
+    workers: int = 1,
+    engine: str = "pil",
+    batch_size: int = 1,
+    manifest: Optional[Manifest] = None,
+    resume: bool = False,
+    writer_threads: int = 0,
+    queue_depth: int = QUEUE_DEPTH,
+    atlas: Optional[Atlas] = None,
+    color_mode: str = "rgb",
+    instances: bool = False,
+    scenario: Optional[Scenario] = None,
+    num_shards: int = 1,
+    shard_index: int = 0,
+) -> Set[int]:
+    """Generate subset of moving multiscale MNIST and save it with writer.
+
+    .. note: batches of sequence indices are sharded across a pool of worker
+        processes; results are collected in order of sequence indices, hence the
+        output does not depend on the number of workers
+
+    :param engine: rendering engine: "pil" (per-digit paste), "numpy" (batched) or
+        "dense" (recompositing changed regions of frames, for scenes of many digits)
+    :param batch_size: number of sequences rendered at once by a single worker
+    :param manifest: manifest recording saved sequences
+    :param resume: skip sequences already recorded in the manifest
+    :param writer_threads: number of threads encoding and writing rendered sequences
+        in each process (0 writes synchronously)
+    :param queue_depth: maximum number of rendered sequences waiting to be written in
+        each process
+    :param atlas: sprite atlas of subset images (digits are resized on the fly if
+        not given)
+    :param color_mode: "rgb" (three identical channels) or "gray" (single channel)
+    :param instances: render instance id maps and visible fractions of digits with
+        frames (writer has to be created with `instances` as well)
+    :param scenario: scenario of the subset digits are created from (see
+        :func:`plan_scenario`; digits are drawn one by one if not given)
+    :param num_shards: number of shards the subset is split into
+    :param shard_index: index of the shard of sequences to generate (see
+        :func:`moving_multiscalemnist.sharding.shard_range`)
+    :return: labels of digits present in the generated sequences
+    """
+    if engine not in ENGINES:
+        raise ValueError(f"Unknown rendering engine: {engine}")
+    if color_mode not in COLOR_MODES:
+        raise ValueError(f"Unknown color mode: {color_mode}")
+    if resume and not writer.resumable:
+        raise ValueError(f"{type(writer).__name__} does not support resuming")
+    if scenario is not None and len(scenario) < n_sequences:
+        raise ValueError(
+            f"Scenario holds {len(scenario)} sequences, {n_sequences} requested"
+        )
+    completed: Dict[int, Dict[str, Any]] = {}
+    if manifest is not None:
+        if resume:
+            completed = manifest.load()
+        else:
+            manifest.reset()
+    images, labels = subset
+    order, slices = prepare_subset(
+        subset,
+        n_sequences=n_sequences,
+        min_digits=min_digits,
+        max_digits=max_digits,
+        seed_sequence=seed_sequence,
+    )
+    kwargs = {
+        "images": images,
+        "labels": labels,
+        "slices": slices,
+        "order": order,
+        "atlas": atlas,
+        "scenario": scenario,
+        "seed_sequence": seed_sequence,
+        "n_frames": n_frames,
+        "image_size": image_size,
+        "sizes": sizes,
+        "oscillations": oscillations,
+        "oscillations_variances": oscillations_variances,
+        "fps": fps,
+        "writer": writer,
+        "engine": engine,
+        "writer_threads": writer_threads,
+        "queue_depth": queue_depth,
+        "color_mode": color_mode,
+        "instances": instances,
+        "profile": profiling.settings(),
+    }
+    shard = shard_range(n_sequences, num_shards, shard_index)
+    indices = [idx for idx in shard if idx not in completed]
+    batch_size = max(1, batch_size)
+    batches = [
+        indices[start : start + batch_size]
+        for start in range(0, len(indices), batch_size)
+    ]
+    with tqdm(
+        total=len(shard), initial=len(shard) - len(indices), desc="Generating"
+    ) as progress:
+        if workers <= 1:
+            _init_worker(kwargs)
+            results: Iterable[
+                Tuple[List[Tuple[int, Any, Dict[str, str]]], profiling.Stats]
+            ] = chain(map(_save_subset_batch, batches), map(_drain_worker, [0]))
+            try:
+                _collect(writer, manifest, seed_sequence, indices, results, progress)
+            finally:
+                _close_worker()
+        else:
+            close_barrier = multiprocessing.Barrier(workers)
+            with Pool(
+                workers, initializer=_init_worker, initargs=(kwargs, close_barrier)
+            ) as pool:
+                chunksize = max(1, min(64, len(batches) // (4 * workers)))
+                results = chain(
+                    pool.imap(_save_subset_batch, batches, chunksize=chunksize),
+                    pool.imap_unordered(_drain_worker, range(workers)),
+                )
+                _collect(writer, manifest, seed_sequence, indices, results, progress)
+    writer.close()
+    return sequence_labels(labels, order, slices[shard.start : shard.stop])
+
+
+def _collect(
+    writer: SequenceWriter,
+    manifest: Optional[Manifest],
+    seed_sequence: np.random.SeedSequence,
+    indices: List[int],
+    results: Iterable[Tuple[List[Tuple[int, Any, Dict[str, str]]], profiling.Stats]],
+    progress: tqdm,
+):
+    """Pass results of saved batches to writer and record them in manifest.
+
+    .. note: sequences are recorded in order of `indices` (each as soon as all
+        preceding ones are written), so the manifest does not depend on the order
+        in which workers and writer threads finish
+    """
+    order = iter(indices)
+    next_idx = next(order, None)
+    written: Dict[int, Dict[str, str]] = {}
+    for batch_results, stats in results:
+        profiling.merge(stats)
+        for idx, result, checksums in batch_results:
+            writer.collect(idx, result)
+            written[idx] = checksums
+        while next_idx is not None and next_idx in written:
+            checksums = written.pop(next_idx)
+            if manifest is not None:
+                manifest.append(
+                    next_idx,
+                    seed_sequence=child_seed_sequence(
+                        seed_sequence, SEQUENCE_KEY, next_idx
+                    ),
+                    files=checksums,
+                )
+            next_idx = next(order, None)
+        progress.update(len(batch_results))
 
 
 def generate_dataset(
@@ -93,45 +838,255 @@ def generate_dataset(
     oscillations: Tuple[float, ...],
     oscillations_variances: Tuple[float, ...],
     fps: int,
+    seed: int,
+    workers: int = 1,
+    engine: str = "pil",
+    batch_size: int = 1,
+    output_format: str = "jpeg",
+    resume: bool = False,
+    writer_threads: int = 0,
+    queue_depth: int = QUEUE_DEPTH,
+    atlas_dir: Optional[str] = None,
+    profile: bool = False,
+    profile_output: Optional[str] = None,
+    trajectories: bool = False,
+    shard_size: Optional[int] = None,
+    color_mode: str = "rgb",
+    mask_format: Optional[str] = None,
+    instances: bool = False,
+    output_dir: str = "dataset",
+    mnist: Optional[Dict[str, Tuple[np.ndarray, np.ndarray]]] = None,
+    atlases: Optional[Dict[str, Atlas]] = None,
+    streaming: bool = False,
+    scenario: bool = False,
+    num_shards: int = 1,
+    shard_index: int = 0,
 ):
-    """Generate sequences and save to file."""
-    mnist = fetch_mnist(data_dir)
-
-    logger.info("Generating train dataset.")
-    for idx, sequence in enumerate(
-        generate_subset(
-            subset=mnist["train"],
-            n_sequences=train_size,
-            n_frames=n_frames,
-            min_digits=min_digits,
-            max_digits=max_digits,
-            image_size=image_size,
-            sizes=sizes,
-            oscillations=oscillations,
-            oscillations_variances=oscillations_variances,
-            fps=fps,
+    """Generate sequences and save to file.
+
+    .. note: with `resume`, sequences recorded in subset manifests are skipped; since
+        every sequence depends only on the seed and its index, an interrupted or
+        smaller dataset is completed or extended to a dataset identical to a fresh one
+
+    .. note: with `atlas_dir`, all subset digits are resized once to all sizes they
+        may take and cached there, so that digits are only looked up while rendering
+
+    .. note: with `profile`, wall time and calls of generation stages are recorded in
+        all processes and summarized in the log and in a JSON file in the dataset
+        directory; with `profile_output`, the loop saving sequences is profiled with
+        cProfile in all processes and saved as a single pstats file
+
+    .. note: with `trajectories`, digit positions, sizes, bounces and boxes of all
+        sequences are also saved in an npz file in each subset directory
+
+    .. note: with `color_mode` "gray", frames are rendered, encoded and saved with a
+        single channel; with `mask_format`, digit masks of all frames are saved next
+        to frames (see :func:`moving_multiscalemnist.sequence.encode_masks`)
+
+    .. note: with `instances`, instance id maps (track id + 1 of the digit visible in
+        each pixel) of all frames are saved next to frames and visible fractions of
+        digits are saved with annotations
+
+    .. note: with `streaming`, frames of each sequence are written as they are
+        rendered and annotations are appended to a JSON Lines file frame by frame,
+        so memory use does not depend on sequence length (JPEG output format and PIL
+        or dense engine only, since other formats and the numpy engine hold whole
+        sequences)
+
+    .. note: with `scenario`, parameters of all digits of each subset are drawn up
+        front with vectorized calls into a table, which is saved in the subset
+        directory and sequences are rendered from (see :func:`plan_scenario`)
+
+    .. note: with `num_shards`, only sequences of a contiguous range of global
+        indices of each subset (see :func:`moving_multiscalemnist.sharding.shard_range`)
+        are generated (and their trajectories saved), in directories numbered by
+        global indices; the range and
+        labels of the shard are recorded in the dataset directory, and outputs of
+        all shards are merged with :func:`moving_multiscalemnist.sharding.merge_shards`
+        into the dataset generated by a single node (output formats saving each
+        sequence separately only)
+
+    :param shard_size: maximum size of tar shards in bytes (tar output format only)
+    :param output_dir: dataset directory
+    :param mnist: MNIST subsets already loaded (loaded from `data_dir` if not given)
+    :param atlases: sprite atlases of subsets already loaded (loaded from
+        `atlas_dir` if not given)
+    :param num_shards: number of nodes generating the dataset
+    :param shard_index: index of the node generating this shard
+    """
+    if output_format not in WRITERS:
+        raise ValueError(f"Unknown output format: {output_format}")
+    if color_mode not in COLOR_MODES:
+        raise ValueError(f"Unknown color mode: {color_mode}")
+    if mask_format is not None and mask_format not in MASK_FORMATS:
+        raise ValueError(f"Unknown mask format: {mask_format}")
+    if instances and max_digits > MAX_INSTANCES:
+        raise ValueError(
+            f"Instance id maps hold at most {MAX_INSTANCES} digits, got {max_digits}"
         )
-    ):
-        save_sequence(sequence, directory="dataset/train", idx=idx)
-
-    logger.info("Generating test dataset.")
-    for idx, sequence in enumerate(
-        generate_subset(
-            subset=mnist["test"],
-            n_sequences=test_size,
-            n_frames=n_frames,
-            min_digits=min_digits,
-            max_digits=max_digits,
-            image_size=image_size,
-            sizes=sizes,
-            oscillations=oscillations,
-            oscillations_variances=oscillations_variances,
-            fps=fps,
+    if streaming and (output_format != "jpeg" or engine == "numpy"):
+        raise ValueError(
+            "Streaming requires jpeg output format and pil or dense engine"
+        )
+    writer_cls = WRITERS[output_format]
+    if resume and not writer_cls.resumable:
+        raise ValueError(f"Output format {output_format} does not support resuming")
+    if num_shards > 1 and not writer_cls.resumable:
+        raise ValueError(f"Output format {output_format} does not support sharding")
+    writer_kwargs: Dict[str, Any] = {
+        "color_mode": color_mode,
+        "mask_format": mask_format,
+        "instances": instances,
+    }
+    if shard_size is not None and issubclass(writer_cls, TarWriter):
+        writer_kwargs["shard_size"] = shard_size
+    if issubclass(writer_cls, ApngWriter):
+        writer_kwargs["fps"] = fps
+    if streaming:
+        writer_kwargs["streaming"] = streaming
+    if mnist is None:
+        mnist = fetch_mnist(data_dir)
+    sequence_params: Dict[str, Any] = {
+        "n_frames": n_frames,
+        "min_digits": min_digits,
+        "max_digits": max_digits,
+        "image_size": image_size,
+        "sizes": sizes,
+        "oscillations": oscillations,
+        "oscillations_variances": oscillations_variances,
+        "fps": fps,
+    }
+
+    profiling.configure(profile, profile_output)
+    profiling.totals()
+    if profile_output is not None:
+        profiling.clear_profiles(profile_output)
+    start = time.perf_counter()
+    subset_labels = {}
+    shard_subsets = {}
+    for subset, n_sequences in [("train", train_size), ("test", test_size)]:
+        logger.info(f"Generating {subset} dataset.")
+        directory = str(Path(output_dir).joinpath(subset))
+        atlas = None
+        if atlases is not None:
+            atlas = atlases[subset]
+        elif atlas_dir is not None:
+            atlas = load_atlas(
+                atlas_dir,
+                images=mnist[subset][0],
+                sizes=oscillated_sizes(
+                    sizes, oscillations, oscillations_variances, fps, n_frames
+                ),
+            )
+        table = None
+        if scenario:
+            table = prepare_subset_scenario(
+                mnist[subset],
+                n_sequences=n_sequences,
+                min_digits=min_digits,
+                max_digits=max_digits,
+                seed_sequence=get_subset_seed_sequence(seed, subset),
+                image_size=image_size,
+                sizes=sizes,
+                oscillations=oscillations,
+                oscillations_variances=oscillations_variances,
+            )
+            save_scenario(Path(directory).joinpath(SCENARIO_FILE), table)
+        subset_labels[subset] = save_subset(
+            subset=mnist[subset],
+            writer=writer_cls(
+                directory, n_sequences, n_frames, image_size, **writer_kwargs
+            ),
+            n_sequences=n_sequences,
+            seed_sequence=get_subset_seed_sequence(seed, subset),
+            workers=workers,
+            engine=engine,
+            batch_size=batch_size,
+            manifest=Manifest(
+                directory,
+                params={
+                    "seed": seed,
+                    "subset": subset,
+                    "format": output_format,
+                    "color_mode": color_mode,
+                    "mask_format": mask_format,
+                    "instances": instances,
+                    "streaming": streaming,
+                    "scenario": scenario,
+                    **sequence_params,
+                },
+            ),
+            resume=resume,
+            writer_threads=writer_threads,
+            queue_depth=queue_depth,
+            atlas=atlas,
+            color_mode=color_mode,
+            instances=instances,
+            scenario=table,
+            num_shards=num_shards,
+            shard_index=shard_index,
+            **sequence_params,
         )
-    ):
-        save_sequence(sequence, directory="dataset/test", idx=idx)
+        shard = shard_range(n_sequences, num_shards, shard_index)
+        shard_subsets[subset] = {
+            "start": shard.start,
+            "stop": shard.stop,
+            "labels": sorted(subset_labels[subset]),
+        }
+        if trajectories:
+            save_subset_trajectories(
+                subset=mnist[subset],
+                path=Path(directory).joinpath(TRAJECTORIES_FILE),
+                n_sequences=n_sequences,
+                seed_sequence=get_subset_seed_sequence(seed, subset),
+                atlas=atlas,
+                scenario=table,
+                num_shards=num_shards,
+                shard_index=shard_index,
+                batch_size=batch_size,
+                **sequence_params,
+            )
+    elapsed = time.perf_counter() - start
+    stats = profiling.totals()
+    profiling.configure(False)
+    if profile:
+        logger.info(
+            f"Generated in {elapsed:.3f} s, stage timings:\n{profiling.summary(stats)}"
+        )
+        profiling.save_summary(stats, Path(output_dir).joinpath(PROFILE_FILE), elapsed)
+    if profile_output is not None:
+        profiling.merge_profiles(profile_output)
+        logger.info(f"Saved profile to {profile_output}.")
 
-    logger.info("Generating annotations.")
-    prepare_dataset(Path("dataset"), train_folder="train", test_folder="test")
+    if num_shards > 1:
+        save_shard_info(
+            output_dir,
+            num_shards=num_shards,
+            shard_index=shard_index,
+            params={
+                "seed": seed,
+                "format": output_format,
+                "train_size": train_size,
+                "test_size": test_size,
+                "color_mode": color_mode,
+                "mask_format": mask_format,
+                "instances": instances,
+                "streaming": streaming,
+                "scenario": scenario,
+                "trajectories": trajectories,
+                **sequence_params,
+            },
+            subsets=shard_subsets,
+        )
+        logger.info(f"Generated shard {shard_index} of {num_shards}.")
+    elif output_format == "jpeg":
+        logger.info("Generating annotations.")
+        save_dataset_files(
+            Path(output_dir),
+            train_images=sequence_images(train_size, n_frames),
+            test_images=sequence_images(test_size, n_frames),
+            train_labels=subset_labels["train"],
+            test_labels=subset_labels["test"],
+        )
 
     logger.info("Done.")
@@ -0,0 +1,100 @@
+"""Manifest of saved sequences used to resume generation."""
+import hashlib
+import json
+import os
+from pathlib import Path
+from typing import Any, Dict, Iterable
+
+import numpy as np
+
+MANIFEST_FILE = "manifest.jsonl"
+
+
+def params_hash(params: Dict[str, Any]) -> str:
+    """Calculate hash of generation parameters."""
+    dumped = json.dumps(params, sort_keys=True, default=list)
+    return hashlib.sha256(dumped.encode()).hexdigest()
+
+
+def file_checksums(directory: Path, files: Iterable[Path]) -> Dict[str, str]:
+    """Calculate SHA-256 checksums of files relative to directory."""
+    checksums = {}
+    for file in files:
+        checksums[str(file.relative_to(directory))] = hashlib.sha256(
+            file.read_bytes()
+        ).hexdigest()
+    return checksums
+
+
+class Manifest:
+    """Append-only JSON Lines record of sequences saved in a subset directory.
+
+    Each line records sequence index, its seed, hash of generation parameters and
+    checksums of saved files. A line is appended with a single write once the
+    sequence is saved, so an interrupted run leaves at most one incomplete trailing
+    line, which is truncated when loading (before further records are appended).
+    """
+
+    def __init__(self, directory: str, params: Dict[str, Any]):
+        """
+        :param directory: subset directory
+        :param params: parameters the subset is generated with
+        """
+        self.path = Path(directory).joinpath(MANIFEST_FILE)
+        self.params_hash = params_hash(params)
+
+    def load(self) -> Dict[int, Dict[str, Any]]:
+        """Load records of saved sequences and truncate incomplete trailing line.
+
+        :return: records by sequence index
+        """
+        records: Dict[int, Dict[str, Any]] = {}
+        if not self.path.exists():
+            return records
+        with self.path.open("r+b") as fp:
+            content = fp.read()
+            complete = content.rfind(b"\n") + 1
+            if complete < len(content):
+                fp.truncate(complete)
+            for line in content[:complete].splitlines():
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                if record["params"] != self.params_hash:
+                    raise ValueError(
+                        f"Sequence {record['index']} in {self.path} was generated"
+                        " with different parameters"
+                    )
+                records[record["index"]] = record
+        return records
+
+    def reset(self):
+        """Remove all records."""
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.path.write_text("")
+
+    def append(
+        self, idx: int, seed_sequence: np.random.SeedSequence, files: Dict[str, str]
+    ):
+        """Record saved sequence.
+
+        :param idx: sequence index
+        :param seed_sequence: seed sequence the sequence was generated from
+        :param files: checksums of saved files
+        """
+        record = {
+            "index": idx,
+            "seed": {
+                "entropy": seed_sequence.entropy,
+                "spawn_key": list(seed_sequence.spawn_key),
+            },
+            "params": self.params_hash,
+            "files": files,
+        }
+        line = (json.dumps(record) + "\n").encode()
+        fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            os.write(fd, line)
+        finally:
+            os.close(fd)
@@ -1,34 +1,135 @@
 """Tools for loading MNIST dataset files."""
+import gzip
+import io
+import logging
+import os
+import shutil
+import struct
+import tempfile
 from pathlib import Path
-from typing import Dict, Tuple
+from typing import BinaryIO, Dict, Tuple
 
 import numpy as np
 
+logger = logging.getLogger(__name__)
+
+IDX_DTYPES: Dict[int, np.dtype] = {
+    0x08: np.dtype(np.uint8),
+    0x09: np.dtype(np.int8),
+    0x0B: np.dtype(">i2"),
+    0x0C: np.dtype(">i4"),
+    0x0D: np.dtype(">f4"),
+    0x0E: np.dtype(">f8"),
+}
+IDX_SUFFIXES = ("", "-idx3-ubyte", "-idx1-ubyte")
+
+
+def read_idx_header(fp: BinaryIO) -> Tuple[np.dtype, Tuple[int, ...], int]:
+    """Read header of IDX file.
+
+    :param fp: binary file object positioned at the beginning of the file
+    :return: data type, data shape and header length
+    """
+    magic = fp.read(4)
+    if len(magic) != 4 or magic[:2] != b"\x00\x00" or magic[2] not in IDX_DTYPES:
+        raise ValueError(f"Invalid IDX magic number: {magic!r}")
+    ndim = magic[3]
+    dims = fp.read(4 * ndim)
+    if len(dims) != 4 * ndim:
+        raise ValueError("Truncated IDX header")
+    shape = struct.unpack(f">{ndim}I", dims)
+    return IDX_DTYPES[magic[2]], shape, 4 + 4 * ndim
+
+
+def decompress(path: Path) -> Path:
+    """Decompress gzip file next to it (once) and return decompressed file path."""
+    target = path.with_suffix("")
+    if target.exists() and target.stat().st_mtime >= path.stat().st_mtime:
+        return target
+    fd, tmp = tempfile.mkstemp(dir=target.parent, prefix=f".{target.name}.")
+    try:
+        with gzip.open(path, "rb") as src, os.fdopen(fd, "wb") as dst:
+            shutil.copyfileobj(src, dst)
+        os.replace(tmp, target)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+    return target
+
+
+def load_idx(path: Path) -> np.ndarray:
+    """Load IDX file.
+
+    Uncompressed files are memory-mapped, so processes loading the same file share
+    its pages. Gzipped files are decompressed once to a cache file next to them and
+    memory-mapped; if the directory is not writable, they are decompressed in memory.
+
+    :param path: IDX file path (optionally gzipped)
+    :return: read-only array with data
+    """
+    if path.suffix == ".gz":
+        try:
+            path = decompress(path)
+        except OSError:
+            logger.warning(f"Cannot cache decompressed {path}, reading into memory.")
+            with gzip.open(path, "rb") as fp:
+                content = fp.read()
+            dtype, shape, offset = read_idx_header(io.BytesIO(content))
+            data = np.frombuffer(content, dtype=dtype, offset=offset)
+            if data.size != int(np.prod(shape)):
+                raise ValueError(f"Unexpected size of data in {path}")
+            return data.reshape(shape)
+
+    with path.open("rb") as fp:
+        dtype, shape, offset = read_idx_header(fp)
+    expected = offset + int(np.prod(shape)) * dtype.itemsize
+    actual = path.stat().st_size
+    if actual != expected:
+        raise ValueError(f"Expected {expected} bytes in {path}, found {actual}")
+    return np.memmap(path, dtype=dtype, mode="r", offset=offset, shape=shape)
+
+
+def find_idx(data_dir: Path, name: str) -> Path:
+    """Find IDX file by name, accepting original MNIST and gzipped names."""
+    for suffix in IDX_SUFFIXES:
+        for candidate in [f"{name}{suffix}", f"{name}{suffix}.gz"]:
+            path = data_dir.joinpath(candidate)
+            if path.exists():
+                return path
+    raise FileNotFoundError(f"No {name} file in {data_dir}")
+
 
 def load_images(data_dir: Path, images_file: str) -> np.ndarray:
     """Load data from image file."""
-    with data_dir.joinpath(images_file).open() as fp:
-        loaded = np.fromfile(file=fp, dtype=np.uint8)
-        return loaded[16:].reshape((-1, 28, 28))
+    images = load_idx(find_idx(data_dir, images_file))
+    if images.ndim != 3:
+        raise ValueError(f"Expected 3 dimensions in {images_file}, got {images.ndim}")
+    return images
 
 
 def load_labels(data_dir: Path, labels_file: str) -> np.ndarray:
     """Load data from labels file."""
-    with data_dir.joinpath(labels_file).open() as fp:
-        loaded = np.fromfile(file=fp, dtype=np.uint8)
-        return loaded[8:]
+    labels = load_idx(find_idx(data_dir, labels_file))
+    if labels.ndim != 1:
+        raise ValueError(f"Expected 1 dimension in {labels_file}, got {labels.ndim}")
+    return labels
+
+
+def load_subset(data_dir: Path, subset: str) -> Tuple[np.ndarray, np.ndarray]:
+    """Load images and labels of MNIST subset."""
+    images = load_images(data_dir, f"{subset}-images")
+    labels = load_labels(data_dir, f"{subset}-labels")
+    if len(images) != len(labels):
+        raise ValueError(
+            f"Got {len(images)} images and {len(labels)} labels in {subset} subset"
+        )
+    return images, labels
 
 
 def fetch_mnist(data_dir: str = "mnist") -> Dict[str, Tuple[np.ndarray, np.ndarray]]:
     """Load MNIST dataset."""
     path = Path(data_dir)
     return {
-        "train": (
-            load_images(path, "train-images"),
-            load_labels(path, "train-labels"),
-        ),
-        "test": (
-            load_images(path, "test-images"),
-            load_labels(path, "test-labels"),
-        ),
+        "train": load_subset(path, "train"),
+        "test": load_subset(path, "test"),
     }
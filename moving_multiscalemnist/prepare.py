@@ -1,11 +1,13 @@
 """Prepare annotations for YOLOv4."""
-import json
 from argparse import ArgumentParser
+from multiprocessing import Pool
 from pathlib import Path
-from typing import List, Set, Tuple
+from typing import Iterable, List, Set, Tuple
 
 from tqdm import tqdm
 
+from moving_multiscalemnist.sequence import load_annotations, save_frame_labels
+
 TRAIN_FILE = "train.txt"
 TEST_FILE = "test.txt"
 NAMES_FILE = "obj.names"
@@ -14,60 +16,146 @@ NAMES_FILE = "obj.names"
 def handle_sequence(path: Path) -> Tuple[List[Path], Set[int]]:
     """Handle single sequence directory."""
     labels = set()
-    with path.joinpath("annotations.json").open("r") as fp:
-        annotations = json.load(fp)
+    annotations = load_annotations(path)
     images = list(sorted(path.glob("*.jpg")))
     if len(annotations) != len(images):
         raise ValueError("Unequal number of images and annotations")
     for image, annotation in zip(images, annotations):
-        with image.with_suffix(".txt").open("w") as fp:
-            for box, label in zip(annotation["bboxes"], annotation["labels"]):
-                labels.add(label)
-                x, y, w, h = box
-                fp.write(f"{label} {x} {y} {w} {h}\n")
+        labels.update(annotation["labels"])
+        save_frame_labels(image, annotation["bboxes"], annotation["labels"])
     return images, labels
 
 
-def handle_subset(path: Path) -> Tuple[List[Path], Set[int]]:
-    """Handle subset of sequences."""
+def _gather_sequences(
+    results: Iterable[Tuple[List[Path], Set[int]]], n_sequences: int
+) -> Tuple[List[Path], Set[int]]:
+    """Gather images and labels of handled sequences."""
     images = []
     labels = set()
-    for sequence in tqdm(list(sorted(path.glob("*")))):
-        seq_images, seq_labels = handle_sequence(sequence)
+    for seq_images, seq_labels in tqdm(results, total=n_sequences):
         images.extend(seq_images)
         labels.update(seq_labels)
     return images, labels
 
 
-def prepare_dataset(path: Path, train_folder: str, test_folder: str):
-    train_images, train_labels = handle_subset(path.joinpath(train_folder))
-    test_images, test_labels = handle_subset(path.joinpath(test_folder))
+def handle_subset(path: Path, workers: int = 1) -> Tuple[List[Path], Set[int]]:
+    """Handle subset of sequences."""
+    sequences = [sequence for sequence in sorted(path.glob("*")) if sequence.is_dir()]
+    if workers <= 1:
+        return _gather_sequences(map(handle_sequence, sequences), len(sequences))
+
+    with Pool(workers) as pool:
+        results = pool.imap(handle_sequence, sequences, chunksize=16)
+        return _gather_sequences(results, len(sequences))
+
+
+def sequence_images(n_sequences: int, n_frames: int) -> List[str]:
+    """List frame images of generated subset relative to its directory."""
+    return [
+        f"{idx:06d}/{frame_idx:06d}.jpg"
+        for idx in range(n_sequences)
+        for frame_idx in range(n_frames)
+    ]
+
+
+def shard_images(n_sequences: int, n_frames: int) -> List[str]:
+    """List frame images of subset saved as tar shards relative to its directory.
+
+    .. note: frames are listed as named in shards (see
+        :func:`moving_multiscalemnist.sequence.sequence_members`), so shards are
+        expected to be extracted into the subset directory
+    """
+    return [
+        f"{idx:06d}.{frame_idx:06d}.jpg"
+        for idx in range(n_sequences)
+        for frame_idx in range(n_frames)
+    ]
+
 
-    with path.joinpath(TRAIN_FILE).open("w") as fp:
-        for file in train_images:
-            fp.write(f"data/train/{str(file).split('train/')[-1]}\n")
+def save_image_list(path: Path, subset: str, images: Iterable[str]):
+    """Save YOLO image list of a single subset.
 
-    with path.joinpath(TEST_FILE).open("w") as fp:
-        for file in test_images:
-            fp.write(f"data/test/{str(file).split('test/')[-1]}\n")
+    :param path: dataset directory
+    :param subset: subset name (`train` or `test`)
+    :param images: images relative to subset directory
+    """
+    with path.joinpath(f"{subset}.txt").open("w") as fp:
+        for file in images:
+            fp.write(f"data/{subset}/{file}\n")
 
+
+def load_names(path: Path) -> Set[int]:
+    """Load labels listed in YOLO names file (empty if it was not saved yet)."""
+    if not path.joinpath(NAMES_FILE).exists():
+        return set()
+    with path.joinpath(NAMES_FILE).open("r") as fp:
+        return {int(line) for line in fp if line.strip()}
+
+
+def save_names(path: Path, labels: Set[int]):
+    """Save YOLO names and data files.
+
+    :param path: dataset directory
+    :param labels: labels present in dataset
+    """
     with path.joinpath(NAMES_FILE).open("w") as fp:
-        for label in sorted(train_labels.union(test_labels)):
+        for label in sorted(labels):
             fp.write(f"{label}\n")
 
     with path.joinpath("obj.data").open("w") as fp:
-        fp.write(f"classes = {max(len(train_labels), len(test_labels))}\n")
+        fp.write(f"classes = {len(labels)}\n")
         fp.write(f"train = data/{TRAIN_FILE}\n")
         fp.write(f"valid = data/{TEST_FILE}\n")
         fp.write(f"names = data/{NAMES_FILE}\n")
         fp.write("backup = data/\n")
 
 
+def save_dataset_files(
+    path: Path,
+    train_images: Iterable[str],
+    test_images: Iterable[str],
+    train_labels: Set[int],
+    test_labels: Set[int],
+):
+    """Save YOLO image lists, names and data files.
+
+    :param path: dataset directory
+    :param train_images: train images relative to train subset directory
+    :param test_images: test images relative to test subset directory
+    :param train_labels: labels present in train subset
+    :param test_labels: labels present in test subset
+    """
+    save_image_list(path, "train", train_images)
+    save_image_list(path, "test", test_images)
+    save_names(path, train_labels.union(test_labels))
+
+
+def prepare_dataset(path: Path, train_folder: str, test_folder: str, workers: int = 1):
+    train_images, train_labels = handle_subset(path.joinpath(train_folder), workers)
+    test_images, test_labels = handle_subset(path.joinpath(test_folder), workers)
+
+    save_dataset_files(
+        path,
+        train_images=(str(file).split("train/")[-1] for file in train_images),
+        test_images=(str(file).split("test/")[-1] for file in test_images),
+        train_labels=train_labels,
+        test_labels=test_labels,
+    )
+
+
 if __name__ == "__main__":
     parser = ArgumentParser()
     parser.add_argument("dataset", help="dataset directory")
     parser.add_argument("--train", default="train", help="train subdirectory")
     parser.add_argument("--test", default="test", help="test subdirectory")
+    parser.add_argument(
+        "--workers", "-w", default=1, type=int, help="number of worker processes"
+    )
     args = parser.parse_args()
 
-    prepare_dataset(Path(args.dataset), train_folder=args.train, test_folder=args.test)
+    prepare_dataset(
+        Path(args.dataset),
+        train_folder=args.train,
+        test_folder=args.test,
+        workers=args.workers,
+    )
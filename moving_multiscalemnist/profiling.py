@@ -0,0 +1,166 @@
+"""Opt-in timing of generation stages aggregated across worker processes."""
+import cProfile
+import json
+import os
+import pstats
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+from pathlib import Path
+from typing import Dict, Generator, List, Optional, Tuple
+
+Stats = Dict[str, Tuple[float, int]]
+
+_enabled = False
+_output: Optional[Path] = None
+_profiler: Optional[cProfile.Profile] = None
+_lock = threading.Lock()
+_stats: Dict[str, List[float]] = {}
+_totals: Dict[str, List[float]] = {}
+_null = nullcontext()
+
+
+class _Stage:
+    __slots__ = ("name", "start")
+
+    def __init__(self, name: str):
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+
+    def __exit__(self, *exc_info):
+        record(self.name, time.perf_counter() - self.start)
+
+
+def configure(enabled: bool, output: Optional[str] = None):
+    """Enable or disable stage timing and cProfile dumps in the current process.
+
+    :param enabled: record wall time and calls of stages
+    :param output: pstats file the hot loop is profiled to (not profiled if None)
+    """
+    global _enabled, _output, _profiler
+    _enabled = enabled
+    if output is None or Path(output) != _output:
+        _profiler = None
+    _output = None if output is None else Path(output)
+
+
+def settings() -> Tuple[bool, Optional[str]]:
+    """Get configuration of the current process to pass to worker processes."""
+    return _enabled, None if _output is None else str(_output)
+
+
+def stage(name: str):
+    """Measure wall time of a stage (a no-op unless timing is enabled)."""
+    return _Stage(name) if _enabled else _null
+
+
+def _add(stats: Dict[str, List[float]], name: str, seconds: float, calls: int):
+    with _lock:
+        entry = stats.setdefault(name, [0.0, 0])
+        entry[0] += seconds
+        entry[1] += calls
+
+
+def record(name: str, seconds: float, calls: int = 1):
+    """Add time and calls of a stage run in the current process."""
+    _add(_stats, name, seconds, calls)
+
+
+def collect() -> Stats:
+    """Take stages recorded in the current process since the last call."""
+    global _stats
+    with _lock:
+        stats, _stats = _stats, {}
+    return {name: (seconds, int(calls)) for name, (seconds, calls) in stats.items()}
+
+
+def merge(stats: Stats):
+    """Add stages collected in a (possibly other) process to the run totals.
+
+    .. note: totals are kept apart from stages recorded in the current process, so
+        that forked worker processes do not report them again
+    """
+    for name, (seconds, calls) in stats.items():
+        _add(_totals, name, seconds, calls)
+
+
+def totals() -> Stats:
+    """Take run totals (including stages not collected yet) and reset them."""
+    global _totals
+    merge(collect())
+    with _lock:
+        stats, _totals = _totals, {}
+    return {name: (seconds, int(calls)) for name, (seconds, calls) in stats.items()}
+
+
+def summary(stats: Stats) -> str:
+    """Format stages as a table sorted by total time."""
+    total = sum(seconds for seconds, _ in stats.values()) or 1.0
+    lines = [f"{'stage':<16}{'calls':>10}{'total [s]':>12}{'mean [ms]':>12}{'%':>7}"]
+    for name, (seconds, calls) in sorted(
+        stats.items(), key=lambda item: item[1][0], reverse=True
+    ):
+        lines.append(
+            f"{name:<16}{calls:>10}{seconds:>12.3f}"
+            f"{seconds / max(calls, 1) * 1e3:>12.3f}{seconds / total * 100:>7.1f}"
+        )
+    return "\n".join(lines)
+
+
+def save_summary(stats: Stats, path: Path, elapsed: float):
+    """Save stages and wall time of the whole run as JSON file."""
+    with path.open("w") as fp:
+        json.dump(
+            {
+                "elapsed": elapsed,
+                "stages": {
+                    name: {"seconds": seconds, "calls": calls}
+                    for name, (seconds, calls) in stats.items()
+                },
+            },
+            fp,
+            indent=2,
+        )
+
+
+def _part_files(output: Path) -> List[Path]:
+    return sorted(output.parent.glob(f"{output.name}.*.part"))
+
+
+@contextmanager
+def profile_hot_loop() -> Generator[None, None, None]:
+    """Profile the block with cProfile if profile output is configured.
+
+    .. note: each process accumulates its own profile and dumps it to a part file
+        next to the output; parts are merged with :func:`merge_profiles`
+    """
+    global _profiler
+    if _output is None:
+        yield
+        return
+    if _profiler is None:
+        _profiler = cProfile.Profile()
+    _profiler.enable()
+    try:
+        yield
+    finally:
+        _profiler.disable()
+        _profiler.dump_stats(str(_output) + f".{os.getpid()}.part")
+
+
+def clear_profiles(output: str):
+    """Remove part files left by a previous run."""
+    for part in _part_files(Path(output)):
+        part.unlink()
+
+
+def merge_profiles(output: str):
+    """Merge part files of all processes into a single pstats file."""
+    parts = _part_files(Path(output))
+    if not parts:
+        return
+    pstats.Stats(*(str(part) for part in parts)).dump_stats(output)
+    for part in parts:
+        part.unlink()
@@ -0,0 +1,362 @@
+"""Random access reader of generated subsets."""
+import io
+import json
+import os
+import tarfile
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+from PIL import Image
+
+from moving_multiscalemnist.manifest import MANIFEST_FILE
+from moving_multiscalemnist.sequence import (
+    APNG_FILE,
+    COLOR_MODES,
+    load_annotations,
+    load_apng,
+)
+from moving_multiscalemnist.writers import INDEX_FILE, load_tar_index
+
+READER_INDEX_FILE = "reader_index.npz"
+
+
+def _sequence_annotations(
+    annotations: List[Dict[str, Any]]
+) -> Tuple[List[List[float]], List[int], List[int], List[float], List[int]]:
+    boxes: List[List[float]] = []
+    labels: List[int] = []
+    ids: List[int] = []
+    visible: List[float] = []
+    counts: List[int] = []
+    for annotation in annotations:
+        boxes.extend(annotation["bboxes"])
+        labels.extend(annotation["labels"])
+        ids.extend(annotation["ids"])
+        visible.extend(annotation.get("visible", []))
+        counts.append(len(annotation["labels"]))
+    return boxes, labels, ids, visible, counts
+
+
+def build_index(directory: str) -> Dict[str, np.ndarray]:
+    """Build index of subset saved in JPEG or APNG directories or tar shards.
+
+    The index holds frame offsets of sequences and columnar annotations of frames
+    (as saved by :class:`moving_multiscalemnist.writers.ArrayWriter`); for tar
+    shards, it also holds shard, offset and size of each frame. Visible fractions
+    of digits are indexed if they were saved with annotations.
+
+    :param directory: subset directory
+    :return: index arrays
+    """
+    path = Path(directory)
+    boxes: List[List[float]] = []
+    labels: List[int] = []
+    ids: List[int] = []
+    visible: List[float] = []
+    counts: List[int] = []
+    n_frames: List[int] = []
+    index: Dict[str, np.ndarray] = {}
+    if path.joinpath(INDEX_FILE).exists():
+        entries = load_tar_index(directory)
+        shards = sorted({entry["shard"] for entry in entries})
+        shard_numbers = {shard: number for number, shard in enumerate(shards)}
+        frame_shards: List[int] = []
+        frame_offsets: List[int] = []
+        frame_sizes: List[int] = []
+        for entry in entries:
+            with path.joinpath(entry["shard"]).open("rb") as fp:
+                fp.seek(entry["offset"])
+                data = fp.read(entry["size"])
+            with tarfile.open(fileobj=io.BytesIO(data), mode="r:") as tar:
+                members = tar.getmembers()
+                frames = sorted(
+                    (member for member in members if member.name.endswith(".jpg")),
+                    key=lambda member: member.name,
+                )
+                annotations = json.load(
+                    tar.extractfile(  # type: ignore
+                        next(m for m in members if m.name.endswith(".json"))
+                    )
+                )
+            for member in frames:
+                frame_shards.append(shard_numbers[entry["shard"]])
+                frame_offsets.append(entry["offset"] + member.offset_data)
+                frame_sizes.append(member.size)
+            n_frames.append(len(frames))
+            for column, values in zip(
+                [boxes, labels, ids, visible, counts],
+                _sequence_annotations(annotations),
+            ):
+                column.extend(values)  # type: ignore
+        index["shards"] = np.array(shards)
+        index["frame_shards"] = np.array(frame_shards, dtype=np.int32)
+        index["frame_offsets"] = np.array(frame_offsets, dtype=np.int64)
+        index["frame_sizes"] = np.array(frame_sizes, dtype=np.int64)
+        layout = "tar"
+    else:
+        sequences = sorted(
+            int(sequence.name)
+            for sequence in path.iterdir()
+            if sequence.is_dir() and sequence.name.isdigit()
+        )
+        if sequences != list(range(len(sequences))):
+            raise ValueError(f"Sequence directories in {directory} are not contiguous")
+        layout = "jpeg"
+        if sequences and path.joinpath(f"{0:06d}", APNG_FILE).exists():
+            layout = "apng"
+        for idx in sequences:
+            annotations = load_annotations(path.joinpath(f"{idx:06d}"))
+            n_frames.append(len(annotations))
+            for column, values in zip(
+                [boxes, labels, ids, visible, counts],
+                _sequence_annotations(annotations),
+            ):
+                column.extend(values)  # type: ignore
+
+    sequence_offsets = np.zeros(len(n_frames) + 1, dtype=np.int64)
+    np.cumsum(n_frames, out=sequence_offsets[1:])
+    annotation_offsets = np.zeros(len(counts) + 1, dtype=np.int64)
+    np.cumsum(counts, out=annotation_offsets[1:])
+    index.update(
+        layout=np.array(layout),
+        sequence_offsets=sequence_offsets,
+        annotation_offsets=annotation_offsets,
+        boxes=np.array(boxes, dtype=np.float32).reshape(-1, 4),
+        labels=np.array(labels, dtype=np.int32),
+        ids=np.array(ids, dtype=np.int32),
+    )
+    if labels and len(visible) == len(labels):
+        index["visible"] = np.array(visible, dtype=np.float32)
+    return index
+
+
+def load_index(directory: str, rebuild: bool = False) -> Dict[str, np.ndarray]:
+    """Load index of subset, building and saving it if missing or outdated.
+
+    .. note: index is outdated when the subset manifest or tar index is newer
+    """
+    path = Path(directory)
+    index_path = path.joinpath(READER_INDEX_FILE)
+    sources = [path.joinpath(MANIFEST_FILE), path.joinpath(INDEX_FILE)]
+    outdated = rebuild or not index_path.exists()
+    if not outdated:
+        modified = index_path.stat().st_mtime_ns
+        outdated = any(
+            source.exists() and source.stat().st_mtime_ns > modified
+            for source in sources
+        )
+    if outdated:
+        index = build_index(directory)
+        tmp = path.joinpath(f".{READER_INDEX_FILE}.{os.getpid()}")
+        with tmp.open("wb") as fp:
+            np.savez(fp, allow_pickle=False, **index)
+        os.replace(tmp, index_path)
+        return index
+    with np.load(index_path) as data:
+        return {name: data[name] for name in data.files}
+
+
+class DatasetReader:
+    """Random access to frames and annotations of a generated subset.
+
+    Subset is read from JPEG or APNG directories or tar shards through a binary
+    index (see :func:`build_index`), built once and saved in the subset directory,
+    so no directories are listed and no JSON is parsed when the reader is created.
+    Decoded frames are kept in an LRU cache; with `prefetch`, following frames of
+    the sequence are decoded in background threads when a frame is read.
+
+    .. note: APNG frames are stored as differences from previous frames, so all
+        frames of a sequence are decoded (and cached) at once
+
+    .. note: open files, cache and threads are not pickled, so the reader may be
+        passed to worker processes
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        cache_size: int = 256,
+        prefetch: int = 0,
+        threads: int = 2,
+        rebuild: bool = False,
+        color_mode: str = "rgb",
+    ):
+        """
+        :param directory: subset directory
+        :param cache_size: maximum number of decoded frames kept in memory
+        :param prefetch: number of following frames decoded in background
+        :param threads: number of threads decoding prefetched frames
+        :param rebuild: rebuild index even if it is up to date
+        :param color_mode: decode frames with three channels ("rgb") or a single
+            channel ("gray", e.g. for subsets generated in "gray" color mode)
+        """
+        if color_mode not in COLOR_MODES:
+            raise ValueError(f"Unknown color mode: {color_mode}")
+        self.directory = Path(directory)
+        self.color_mode = color_mode
+        self.cache_size = cache_size
+        self.prefetch = prefetch
+        self.threads = threads
+        self._index = load_index(directory, rebuild=rebuild)
+        self.layout = str(self._index["layout"])
+        self._init_state()
+
+    def _init_state(self):
+        self._lock = threading.Lock()
+        self._cache: "OrderedDict[Tuple[int, int], np.ndarray]" = OrderedDict()
+        self._pending: Dict[Tuple[int, int], Future] = {}
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._files: Dict[int, int] = {}
+
+    def __getstate__(self) -> Dict[str, Any]:
+        state = self.__dict__.copy()
+        for name in ["_lock", "_cache", "_pending", "_executor", "_files"]:
+            del state[name]
+        return state
+
+    def __setstate__(self, state: Dict[str, Any]):
+        self.__dict__.update(state)
+        self._init_state()
+
+    def __len__(self) -> int:
+        return len(self._index["sequence_offsets"]) - 1
+
+    def __getitem__(self, idx: int) -> Dict[str, np.ndarray]:
+        """Read all frames of a sequence with annotations of its first frame.
+
+        :return: dict with frames of shape (frames, height, width, channels), boxes of
+            shape (frames, digits, 4), labels and ids of shape (digits,) and visible
+            fractions of shape (frames, digits) if indexed
+        """
+        if idx < 0:
+            idx += len(self)
+        frames = [self.frame(idx, frame_idx) for frame_idx in range(self.n_frames(idx))]
+        annotations = [
+            self.annotations(idx, frame_idx) for frame_idx in range(len(frames))
+        ]
+        sample = {
+            "frames": np.stack(frames),
+            "boxes": np.stack([annotation["boxes"] for annotation in annotations]),
+            "labels": annotations[0]["labels"],
+            "ids": annotations[0]["ids"],
+        }
+        if "visible" in self._index:
+            sample["visible"] = np.stack(
+                [annotation["visible"] for annotation in annotations]
+            )
+        return sample
+
+    def n_frames(self, idx: int) -> int:
+        """Get number of frames of a sequence."""
+        offsets = self._index["sequence_offsets"]
+        return int(offsets[idx + 1] - offsets[idx])
+
+    def _frame_number(self, idx: int, frame_idx: int) -> int:
+        if not 0 <= idx < len(self):
+            raise IndexError(f"Sequence index {idx} out of range")
+        if not 0 <= frame_idx < self.n_frames(idx):
+            raise IndexError(f"Frame index {frame_idx} out of range")
+        return int(self._index["sequence_offsets"][idx]) + frame_idx
+
+    def annotations(self, idx: int, frame_idx: int) -> Dict[str, np.ndarray]:
+        """Get boxes, labels, track ids and visible fractions (if saved) of a frame."""
+        number = self._frame_number(idx, frame_idx)
+        start, end = self._index["annotation_offsets"][number : number + 2]
+        return {
+            name: self._index[name][start:end]
+            for name in ["boxes", "labels", "ids", "visible"]
+            if name in self._index
+        }
+
+    def read_frame(self, idx: int, frame_idx: int) -> bytes:
+        """Read encoded JPEG frame."""
+        number = self._frame_number(idx, frame_idx)
+        if self.layout == "apng":
+            raise ValueError("APNG frames cannot be read separately")
+        if self.layout == "jpeg":
+            return self.directory.joinpath(
+                f"{idx:06d}", f"{frame_idx:06d}.jpg"
+            ).read_bytes()
+        shard = int(self._index["frame_shards"][number])
+        with self._lock:
+            if shard not in self._files:
+                self._files[shard] = os.open(
+                    self.directory.joinpath(str(self._index["shards"][shard])),
+                    os.O_RDONLY,
+                )
+            fd = self._files[shard]
+        return os.pread(
+            fd,
+            int(self._index["frame_sizes"][number]),
+            int(self._index["frame_offsets"][number]),
+        )
+
+    def _decode(self, idx: int, frame_idx: int) -> np.ndarray:
+        if self.layout == "apng":
+            path = self.directory.joinpath(f"{idx:06d}", APNG_FILE)
+            decoded = dict(
+                enumerate(load_apng(path, self.n_frames(idx), self.color_mode))
+            )
+        else:
+            with Image.open(io.BytesIO(self.read_frame(idx, frame_idx))) as image:
+                mode = COLOR_MODES[self.color_mode]
+                decoded = {frame_idx: np.asarray(image.convert(mode))}
+        # gray frames keep a single channel axis
+        frames = {
+            key: frame.reshape(*frame.shape[:2], -1) for key, frame in decoded.items()
+        }
+        with self._lock:
+            for decoded_idx, frame in frames.items():
+                self._cache[idx, decoded_idx] = frame
+                self._cache.move_to_end((idx, decoded_idx))
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+            self._pending.pop((idx, frame_idx), None)
+        return frames[frame_idx]
+
+    def _prefetch(self, idx: int, frame_idx: int):
+        if self.layout == "apng":
+            return
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(self.threads)
+        last = min(frame_idx + self.prefetch, self.n_frames(idx) - 1)
+        for next_idx in range(frame_idx + 1, last + 1):
+            key = idx, next_idx
+            with self._lock:
+                if key in self._cache or key in self._pending:
+                    continue
+                self._pending[key] = self._executor.submit(self._decode, *key)
+
+    def frame(self, idx: int, frame_idx: int) -> np.ndarray:
+        """Get decoded frame of shape (height, width, channels).
+
+        .. note: frames are cached, hence they should not be modified in place
+        """
+        self._frame_number(idx, frame_idx)
+        key = idx, frame_idx
+        with self._lock:
+            frame = self._cache.get(key)
+            if frame is not None:
+                self._cache.move_to_end(key)
+            pending = self._pending.get(key)
+        if frame is None:
+            frame = (
+                self._decode(idx, frame_idx) if pending is None else pending.result()
+            )
+        if self.prefetch > 0:
+            self._prefetch(idx, frame_idx)
+        return frame
+
+    def close(self):
+        """Stop prefetching threads and close shards."""
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+        for fd in self._files.values():
+            os.close(fd)
+        self._files = {}
+        self._pending = {}
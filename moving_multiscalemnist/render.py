@@ -0,0 +1,153 @@
+"""Vectorized renderer of batches of moving multiscale MNIST sequences."""
+from typing import Any, Generator, List, NamedTuple, Optional, Tuple
+
+import numpy as np
+from PIL import Image
+
+from moving_multiscalemnist.digit import Digit
+from moving_multiscalemnist.sequence import COLOR_MODES, Frame, FrameInstances
+from moving_multiscalemnist.trajectory import DigitBatch
+
+
+class RenderedBatch(NamedTuple):
+    """Frames and annotations of a batch of sequences.
+
+    :param frames: uint8 frames of shape (batch, frames, height, width)
+    :param bboxes: XYWH boxes of shape (batch, frames, digits, 4)
+    :param labels: digit labels of shape (batch, digits)
+    :param n_digits: number of digits in each sequence of shape (batch,)
+    :param id_maps: uint8 instance id maps of shape (batch, frames, height, width),
+        if rendered (see :class:`moving_multiscalemnist.sequence.FrameInstances`)
+    :param visible: visible fractions of digits of shape (batch, frames, digits), if
+        rendered
+    """
+
+    frames: np.ndarray
+    bboxes: np.ndarray
+    labels: np.ndarray
+    n_digits: np.ndarray
+    id_maps: Optional[np.ndarray] = None
+    visible: Optional[np.ndarray] = None
+
+
+def render_batch(
+    sequences: List[List[Digit]],
+    n_frames: int,
+    image_size: Tuple[int, int],
+    frames: Optional[np.ndarray] = None,
+    instances: bool = False,
+) -> RenderedBatch:
+    """Render a batch of sequences of moving digits.
+
+    Digit trajectories are calculated for all digits of all sequences at once and
+    sprites are composited into a single preallocated array with the same mask
+    semantics as :func:`moving_multiscalemnist.sequence.prepare_sequence`.
+
+    :param sequences: digits of each sequence in the batch
+    :param n_frames: number of frames to generate
+    :param image_size: target image size
+    :param frames: preallocated uint8 array of shape (batch, frames, height, width)
+        frames are rendered into (e.g. shared memory; allocated if not given)
+    :param instances: also render instance id maps and visible fractions of digits
+        from the same paste masks as frames
+    :return: rendered frames with bounding boxes and labels
+    """
+    width, height = image_size
+    batch = DigitBatch(sequences)
+    batch_size, max_digits = batch.valid.shape
+    trajectories = batch.trajectories(n_frames)
+
+    if frames is None:
+        frames = np.zeros((batch_size, n_frames, height, width), dtype=np.uint8)
+    else:
+        frames.fill(0)
+    id_maps = (
+        np.zeros((batch_size, n_frames, height, width), dtype=np.uint8)
+        if instances
+        else None
+    )
+    areas = np.zeros((batch_size, n_frames, max_digits), dtype=int)
+    sizes = trajectories.sizes.tolist()
+    xs = trajectories.x1.tolist()
+    ys = trajectories.y1.tolist()
+    for frame_idx in range(n_frames):
+        for seq_idx, sprites in enumerate(batch.sprites):
+            canvas = frames[seq_idx, frame_idx]
+            for digit_idx, sprite in enumerate(sprites):
+                size = sizes[frame_idx][seq_idx][digit_idx]
+                x1 = xs[frame_idx][seq_idx][digit_idx]
+                y1 = ys[frame_idx][seq_idx][digit_idx]
+                if id_maps is not None:
+                    areas[seq_idx, frame_idx, digit_idx] = sprite.area(size)
+
+                left, top = max(x1, 0), max(y1, 0)
+                right, bottom = min(x1 + size, width), min(y1 + size, height)
+                if left >= right or top >= bottom:
+                    continue
+                crop = (slice(top - y1, bottom - y1), slice(left - x1, right - x1))
+                mask = sprite.binary_mask(size)[crop]
+                np.copyto(
+                    canvas[top:bottom, left:right], sprite.array(size)[crop], where=mask
+                )
+                if id_maps is not None:
+                    region = id_maps[seq_idx, frame_idx, top:bottom, left:right]
+                    np.copyto(region, digit_idx + 1, where=mask)
+
+    bboxes = batch.bboxes(trajectories)
+
+    visible = None
+    if id_maps is not None:
+        counts = np.zeros((batch_size, n_frames, max_digits + 1), dtype=int)
+        for seq_idx in range(batch_size):
+            for frame_idx in range(n_frames):
+                counts[seq_idx, frame_idx] = np.bincount(
+                    id_maps[seq_idx, frame_idx].ravel(), minlength=max_digits + 1
+                )
+        visible = np.divide(
+            counts[..., 1:],
+            areas,
+            out=np.zeros(areas.shape),
+            where=areas > 0,
+        )
+
+    return RenderedBatch(
+        frames=frames,
+        bboxes=bboxes.transpose(1, 0, 2, 3),
+        labels=batch.labels,
+        n_digits=batch.n_digits,
+        id_maps=id_maps,
+        visible=visible,
+    )
+
+
+def iter_rendered_sequences(
+    rendered: RenderedBatch, color_mode: str = "rgb"
+) -> Generator[Generator[Frame, None, None], None, None]:
+    """Convert rendered batch to sequences in format of `prepare_sequence`."""
+    for seq_idx, n_digits in enumerate(rendered.n_digits):
+        yield _iter_rendered_frames(rendered, seq_idx, n_digits, color_mode)
+
+
+def _iter_rendered_frames(
+    rendered: RenderedBatch, seq_idx: int, n_digits: int, color_mode: str
+) -> Generator[Frame, None, None]:
+    labels = rendered.labels[seq_idx, :n_digits].tolist()
+    ids = list(range(n_digits))
+    for frame_idx, (frame, bboxes) in enumerate(
+        zip(rendered.frames[seq_idx], rendered.bboxes[seq_idx])
+    ):
+        image = Image.fromarray(frame)
+        annotations: Tuple[Any, ...] = (
+            image if color_mode == "gray" else image.convert(COLOR_MODES[color_mode]),
+            [tuple(bbox) for bbox in bboxes[:n_digits].tolist()],
+            labels,
+            ids,
+        )
+        if rendered.id_maps is not None and rendered.visible is not None:
+            annotations += (
+                FrameInstances(
+                    rendered.id_maps[seq_idx, frame_idx],
+                    rendered.visible[seq_idx, frame_idx, :n_digits].tolist(),
+                ),
+            )
+        yield annotations
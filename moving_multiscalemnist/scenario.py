@@ -0,0 +1,125 @@
+"""Columnar table of parameters of all sequences and digits of a subset."""
+from pathlib import Path
+from typing import List, NamedTuple, Tuple
+
+import numpy as np
+
+from moving_multiscalemnist.digit import DigitParams
+
+SCENARIO_FILE = "scenario.npz"
+SCENARIO_BLOCK = 1024
+
+
+class DigitParamColumns(NamedTuple):
+    """Parameters of many digits in arrays.
+
+    .. note: fields are the ones of :class:`moving_multiscalemnist.digit.DigitParams`,
+        each holding an array of values of all digits
+    """
+
+    size: np.ndarray
+    osc_t: np.ndarray
+    osc_var: np.ndarray
+    osc_dir: np.ndarray
+    x: np.ndarray
+    y: np.ndarray
+    vel_x: np.ndarray
+    vel_y: np.ndarray
+
+
+class Scenario(NamedTuple):
+    """Parameters of all digits of a subset in flat columns.
+
+    Digits of sequence `i` are stored between `digit_offsets[i]` and
+    `digit_offsets[i + 1]`; all other columns hold a value per digit.
+
+    :param digit_offsets: offsets of digits of sequences of shape (sequences + 1,)
+    :param source: index of digit image in (not shuffled) subset
+    :param label: digit label
+    :param size: base digit size
+    :param osc_t: oscillation period factor
+    :param osc_var: proportion in which size oscillates
+    :param osc_dir: oscillation direction
+    :param x: initial relative horizontal position of digit center
+    :param y: initial relative vertical position of digit center
+    :param vel_x: initial horizontal velocity
+    :param vel_y: initial vertical velocity
+    """
+
+    digit_offsets: np.ndarray
+    source: np.ndarray
+    label: np.ndarray
+    size: np.ndarray
+    osc_t: np.ndarray
+    osc_var: np.ndarray
+    osc_dir: np.ndarray
+    x: np.ndarray
+    y: np.ndarray
+    vel_x: np.ndarray
+    vel_y: np.ndarray
+
+    def __len__(self) -> int:
+        return len(self.digit_offsets) - 1
+
+    def sequence_digits(self, idx: int) -> List[Tuple[int, int, DigitParams]]:
+        """Get source index, label and parameters of each digit of a sequence."""
+        start, end = self.digit_offsets[idx : idx + 2].tolist()
+        columns = [
+            getattr(self, name)[start:end].tolist()
+            for name in ("source", "label", *DigitParams._fields)
+        ]
+        return [
+            (source, label, DigitParams(*params))
+            for source, label, *params in zip(*columns)
+        ]
+
+    def sequences(self, start: int, stop: int) -> "Scenario":
+        """Get scenario of a range of sequences."""
+        digit_start, digit_stop = self.digit_offsets[[start, stop]].tolist()
+        return Scenario(
+            self.digit_offsets[start : stop + 1] - digit_start,
+            *(column[digit_start:digit_stop] for column in self[1:]),
+        )
+
+
+def draw_digit_params(
+    random_state: np.random.RandomState,
+    shape: Tuple[int, ...],
+    image_size: Tuple[int, int],
+    sizes: Tuple[int, ...],
+    oscillations: Tuple[float, ...],
+    oscillations_variances: Tuple[float, ...],
+) -> DigitParamColumns:
+    """Draw parameters of digits with vectorized calls.
+
+    .. note: parameters are drawn as in :class:`moving_multiscalemnist.digit.Digit`,
+        one array per parameter instead of one digit after another
+
+    :param random_state: random state to draw parameters from
+    :param shape: shape of drawn arrays
+    :return: arrays of parameters of given shape
+    """
+    width, height = image_size
+    size = random_state.choice(sizes, size=shape)
+    osc_t = random_state.choice(oscillations, size=shape)
+    osc_var = random_state.choice(oscillations_variances, size=shape)
+    osc_dir = random_state.choice([1, -1], size=shape)
+    x_margin = size / (4 * width)
+    y_margin = size / (4 * height)
+    x = random_state.uniform(x_margin, 1 - x_margin)
+    y = random_state.uniform(y_margin, 1 - y_margin)
+    vel_x = random_state.uniform(-1, 1, size=shape)
+    vel_y = random_state.uniform(-1, 1, size=shape)
+    return DigitParamColumns(size, osc_t, osc_var, osc_dir, x, y, vel_x, vel_y)
+
+
+def save_scenario(path: Path, scenario: Scenario):
+    """Save scenario in npz file."""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    np.savez(path, **scenario._asdict())
+
+
+def load_scenario(path: Path) -> Scenario:
+    """Load scenario saved with :func:`save_scenario`."""
+    with np.load(path) as data:
+        return Scenario(**{name: data[name] for name in Scenario._fields})
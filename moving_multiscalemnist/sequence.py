@@ -1,13 +1,84 @@
 """Tool to create a sequence of moving multiscale MNIST."""
+import io
 import json
+import os
 from pathlib import Path
-from typing import Generator, Iterable, List, Tuple
+from typing import (
+    Any,
+    Dict,
+    Generator,
+    Iterable,
+    List,
+    NamedTuple,
+    Optional,
+    Tuple,
+    Union,
+)
 
 import numpy as np
+from numpy.lib.format import open_memmap
 from PIL import Image
+from PIL.PngImagePlugin import PngInfo
 
+from moving_multiscalemnist import profiling
 from moving_multiscalemnist.digit import Digit
 
+FRAME_FORMATS = ("jpeg", "apng")
+APNG_FILE = "frames.png"
+APNG_REPEATS_KEY = "repeats"
+ANNOTATIONS_FILE = "annotations.json"
+STREAM_ANNOTATIONS_FILE = "annotations.jsonl"
+COLOR_MODES = {"rgb": "RGB", "gray": "L"}
+MASK_FORMATS = ("float32", "packed")
+MASKS_FILE = "masks.npy"
+INSTANCES_FILE = "instances.npy"
+MAX_INSTANCES = np.iinfo(np.uint8).max
+
+
+class FrameInstances(NamedTuple):
+    """Instance segmentation of a frame.
+
+    :param id_map: uint8 map of shape (height, width) holding track id + 1 of the
+        digit visible in each pixel (0 for background)
+    :param visible: fraction of pixels of each digit visible in the frame, i.e. not
+        covered by digits pasted later nor out of the frame
+    """
+
+    id_map: np.ndarray
+    visible: List[float]
+
+
+Frame = Union[
+    Tuple[Image.Image, List[Tuple[float, float, float, float]], List[int], List[int]],
+    Tuple[
+        Image.Image,
+        List[Tuple[float, float, float, float]],
+        List[int],
+        List[int],
+        FrameInstances,
+    ],
+]
+"""Frame with boxes, labels and track ids of digits (and instances if requested)."""
+
+
+def save_frame_labels(
+    image: Union[Path, str],
+    bboxes: Iterable[Tuple[float, float, float, float]],
+    labels: Iterable[int],
+):
+    """Save YOLO labels file of a single frame next to its image."""
+    with open(os.path.splitext(image)[0] + ".txt", "w") as fp:
+        fp.write(frame_labels(bboxes, labels))
+
+
+def frame_labels(
+    bboxes: Iterable[Tuple[float, float, float, float]], labels: Iterable[int]
+) -> str:
+    """Format YOLO labels of a single frame."""
+    return "".join(
+        f"{label} {x} {y} {w} {h}\n" for (x, y, w, h), label in zip(bboxes, labels)
+    )
+
 
 def get_bbox_coords(
     bbox: Tuple[int, int, int, int], x1: int, y1: int, image_size: Tuple[int, int]
@@ -28,54 +99,416 @@ def get_bbox_coords(
     return x / width, y / height, w / width, h / height
 
 
+def paste_instance(
+    id_map: np.ndarray, mask: np.ndarray, x1: int, y1: int, instance: int
+):
+    """Mark pixels of digit mask pasted at given location in instance id map.
+
+    .. note: pixels of previously pasted digits are overwritten, as in the frame
+    """
+    height, width = id_map.shape
+    mask_height, mask_width = mask.shape
+    left, top = max(x1, 0), max(y1, 0)
+    right, bottom = min(x1 + mask_width, width), min(y1 + mask_height, height)
+    if left < right and top < bottom:
+        region = id_map[top:bottom, left:right]
+        region[mask[top - y1 : bottom - y1, left - x1 : right - x1]] = instance
+
+
+def visible_fractions(id_map: np.ndarray, areas: List[int]) -> List[float]:
+    """Calculate fractions of pixels of digits visible in instance id map.
+
+    :param id_map: instance id map (see :class:`FrameInstances`)
+    :param areas: numbers of pixels of digit masks
+    :return: visible fraction of each digit (0 for digits without pixels)
+    """
+    counts = np.bincount(id_map.ravel(), minlength=len(areas) + 1)[1 : len(areas) + 1]
+    return [
+        count / area if area else 0.0 for count, area in zip(counts.tolist(), areas)
+    ]
+
+
 def prepare_sequence(
-    digits: List[Digit], n_frames: int, image_size: Tuple[int, int]
-) -> Generator[
-    Tuple[Image.Image, List[Tuple[float, float, float, float]], List[int], List[int]],
-    None,
-    None,
-]:
+    digits: List[Digit],
+    n_frames: int,
+    image_size: Tuple[int, int],
+    color_mode: str = "rgb",
+    instances: bool = False,
+) -> Generator[Frame, None, None]:
     """Prepare sequence of images of moving digits.
 
     :param digits: digits to be put in the image
     :param n_frames: number of frames to generate
     :param image_size: target image size
+    :param color_mode: "rgb" (three identical channels) or "gray" (single channel)
+    :param instances: also yield :class:`FrameInstances` of each frame, composited
+        from the same paste masks as the frame
     :return: sequence of frames with bounding boxes, labels and track ids
     """
-    background = Image.new("RGB", image_size)
+    width, height = image_size
+    background = Image.new(COLOR_MODES[color_mode], image_size)
     for _ in range(n_frames):
         frame = background.copy()
+        id_map = np.zeros((height, width), dtype=np.uint8) if instances else None
+        areas = []
         bboxes = []
         labels = []
         ids = []
         for idx, digit in enumerate(digits):
-            mask = Image.fromarray(255 * (np.array(digit.image) > 100).astype(np.uint8))
-            frame.paste(digit.image, box=(digit.x1, digit.y1), mask=mask)
-            bbox = get_bbox_coords(digit.bbox, digit.x1, digit.y1, image_size)
+            x1, y1 = digit.x1, digit.y1
+            with profiling.stage("image"):
+                image = digit.image
+            with profiling.stage("mask"):
+                mask = digit.mask
+            with profiling.stage("paste"):
+                frame.paste(image, box=(x1, y1), mask=mask)
+            if id_map is not None:
+                with profiling.stage("instances"):
+                    paste_instance(id_map, digit.binary_mask, x1, y1, idx + 1)
+                    areas.append(digit.area)
+            with profiling.stage("bbox"):
+                bbox = get_bbox_coords(digit.bbox, x1, y1, image_size)
             bboxes.append(bbox)
             labels.append(digit.label)
             ids.append(idx)
-            digit.update()
-        yield frame, bboxes, labels, ids
+            with profiling.stage("update"):
+                digit.update()
+        if id_map is None:
+            yield frame, bboxes, labels, ids
+        else:
+            with profiling.stage("instances"):
+                visible = visible_fractions(id_map, areas)
+            yield frame, bboxes, labels, ids, FrameInstances(id_map, visible)
+
+
+def frame_annotation(
+    bboxes: List[Tuple[float, float, float, float]],
+    labels: List[int],
+    ids: List[int],
+    instances: List[FrameInstances],
+) -> Dict[str, Any]:
+    """Gather annotation of a frame saved in annotations file.
+
+    :param instances: instances of the frame, if yielded with the frame
+    """
+    annotation: Dict[str, Any] = {"bboxes": bboxes, "labels": labels, "ids": ids}
+    if instances:
+        annotation["visible"] = instances[0].visible
+    return annotation
+
+
+def frame_mask(frame: Image.Image) -> np.ndarray:
+    """Get boolean mask of digit pixels of a frame.
+
+    .. note: digits are pasted on black background only where their pixels exceed
+        the paste threshold (see :meth:`moving_multiscalemnist.sprite.Sprite.mask`),
+        so digit pixels are exactly the nonzero pixels of the frame
+    """
+    array = np.asarray(frame)
+    return (array[..., 0] if array.ndim == 3 else array) != 0
+
+
+def encode_masks(masks: np.ndarray, mask_format: str) -> np.ndarray:
+    """Encode boolean masks of shape (..., height, width) in given format.
+
+    :param masks: boolean masks
+    :param mask_format: "float32" (0 or 1 per pixel) or "packed" (8 pixels of a row
+        per byte, see `np.packbits`)
+    :return: masks of shape (..., height, width) or (..., height, ceil(width / 8))
+    """
+    if mask_format == "float32":
+        return masks.astype(np.float32)
+    if mask_format == "packed":
+        return np.packbits(masks, axis=-1)
+    raise ValueError(f"Unknown mask format: {mask_format}")
+
+
+def decode_masks(masks: np.ndarray, width: int) -> np.ndarray:
+    """Decode masks saved with :func:`encode_masks` to boolean masks."""
+    if masks.dtype == np.uint8:
+        return np.unpackbits(masks, axis=-1, count=width).astype(bool)
+    return masks != 0
+
+
+def save_apng(frames: List[Image.Image], path: Path, fps: float = 10):
+    """Save frames as a single lossless animated PNG.
+
+    .. note: frames are stored in grayscale (digits are pasted on the same value in
+        all channels), and each frame after the first is stored as the difference
+        from the previous one, cropped to the changed region; identical consecutive
+        frames are stored once with a longer duration, and the number of frames
+        each stored frame stands for is saved in a text chunk (see :func:`load_apng`)
+
+    :param frames: sequence frames
+    :param path: output file
+    :param fps: playback frame rate
+    """
+    with profiling.stage("encode"):
+        stored: List[Image.Image] = []
+        repeats: List[int] = []
+        previous = None
+        for frame in frames:
+            gray = frame.convert("L")
+            array = np.asarray(gray)
+            if previous is not None and np.array_equal(array, previous):
+                repeats[-1] += 1
+                continue
+            stored.append(gray)
+            repeats.append(1)
+            previous = array
+        info = PngInfo()
+        info.add_text(APNG_REPEATS_KEY, " ".join(map(str, repeats)))
+        stored[0].save(
+            path,
+            format="PNG",
+            save_all=True,
+            append_images=stored[1:],
+            duration=[1000 * count / fps for count in repeats],
+            loop=0,
+            pnginfo=info,
+        )
+
+
+def load_apng(path: Path, n_frames: int, color_mode: str = "rgb") -> List[np.ndarray]:
+    """Load all frames of animated PNG saved with :func:`save_apng`.
+
+    .. note: stored frames are repeated as many times as recorded when saving, so
+        frames merged when saving are restored
+
+    :param path: animated PNG file
+    :param n_frames: number of frames of the sequence
+    :param color_mode: "rgb" or "gray"
+    :return: frames of shape (height, width) for "gray" or (height, width, 3)
+    """
+    frames: List[np.ndarray] = []
+    with Image.open(path) as image:
+        repeats = image.info.get(APNG_REPEATS_KEY)
+        for apng_idx in range(getattr(image, "n_frames", 1)):
+            image.seek(apng_idx)
+            frames.append(np.asarray(image.convert(COLOR_MODES[color_mode])))
+    counts = [1] * len(frames) if repeats is None else list(map(int, repeats.split()))
+    if len(counts) != len(frames) or sum(counts) != n_frames:
+        raise ValueError(f"Expected {n_frames} frames in {path}")
+    return [frame for frame, count in zip(frames, counts) for _ in range(count)]
 
 
 def save_sequence(
-    sequence: Iterable[
-        Tuple[
-            Image.Image, List[Tuple[float, float, float, float]], List[int], List[int]
-        ]
-    ],
+    sequence: Iterable[Frame],
     directory: str,
     idx: int,
+    yolo_labels: bool = False,
+    frame_format: str = "jpeg",
+    mask_format: Optional[str] = None,
+    fps: float = 10,
 ):
-    """"""
+    """Save sequence frames as JPEG images with annotations in JSON file.
+
+    .. note: if frames are yielded with :class:`FrameInstances`, instance id maps of
+        all frames are saved in a single npy file and visible fractions of digits
+        are saved in annotations
+
+    :param sequence: sequence of frames with bounding boxes, labels and track ids
+    :param directory: subset directory
+    :param idx: sequence index
+    :param yolo_labels: also save YOLO labels file next to each frame
+    :param frame_format: "jpeg" (an image per frame) or "apng" (a single animated
+        PNG of all frames, see :func:`save_apng`)
+    :param mask_format: also save digit masks of all frames in a single npy file
+        (see :func:`encode_masks`)
+    :param fps: playback frame rate of animated PNG
+    """
+    if frame_format not in FRAME_FORMATS:
+        raise ValueError(f"Unknown frame format: {frame_format}")
+    if yolo_labels and frame_format != "jpeg":
+        raise ValueError("YOLO labels are saved only for JPEG frames")
     idx_str = f"{idx:06d}"
     path = Path(directory).joinpath(idx_str)
     path.mkdir(parents=True, exist_ok=True)
     annotation = []
-    for idx, (frame, bboxes, labels, ids) in enumerate(sequence):
-        with path.joinpath(f"{idx:06d}.jpg").open("wb") as fp:
-            frame.save(fp)
-        annotation.append({"bboxes": bboxes, "labels": labels, "ids": ids})
-    with path.joinpath("annotations.json").open("w") as fp:
+    frames = []
+    masks = []
+    id_maps: List[np.ndarray] = []
+    for idx, (frame, bboxes, labels, ids, *instances) in enumerate(sequence):
+        if mask_format is not None:
+            with profiling.stage("masks"):
+                masks.append(frame_mask(frame))
+        if frame_format == "apng":
+            frames.append(frame)
+        else:
+            image = path.joinpath(f"{idx:06d}.jpg")
+            with profiling.stage("encode"), image.open("wb") as fp:
+                frame.save(fp)
+        if yolo_labels:
+            with profiling.stage("labels"):
+                save_frame_labels(image, bboxes, labels)
+        id_maps.extend(frame_instances.id_map for frame_instances in instances)
+        annotation.append(frame_annotation(bboxes, labels, ids, instances))
+    if frames:
+        save_apng(frames, path.joinpath(APNG_FILE), fps=fps)
+    if id_maps:
+        with profiling.stage("instances"):
+            np.save(path.joinpath(INSTANCES_FILE), np.stack(id_maps))
+    if mask_format is not None:
+        with profiling.stage("masks"):
+            np.save(
+                path.joinpath(MASKS_FILE), encode_masks(np.stack(masks), mask_format)
+            )
+    annotations = path.joinpath(ANNOTATIONS_FILE)
+    with profiling.stage("annotations"), annotations.open("w") as fp:
         json.dump(annotation, fp, indent=2)
+
+
+def stream_sequence(
+    sequence: Iterable[Frame],
+    directory: str,
+    idx: int,
+    n_frames: int,
+    yolo_labels: bool = False,
+    mask_format: Optional[str] = None,
+):
+    """Save sequence frames as JPEG images with annotations streamed to JSON Lines.
+
+    Each frame is saved as soon as it is rendered and its annotation is appended as
+    a single line of the annotations file, which is flushed after every frame, so
+    memory use does not depend on the number of frames and an interrupted sequence
+    keeps all frames written so far readable (see :func:`load_annotations`).
+
+    .. note: masks and instance id maps are written to npy files preallocated for
+        all frames, so frames not yet rendered are zero
+
+    .. note: paths of frames are built as strings, since `pathlib` keeps interned
+        names of all paths it parses, which would grow with the number of frames
+
+    :param sequence: sequence of frames with bounding boxes, labels and track ids
+    :param directory: subset directory
+    :param idx: sequence index
+    :param n_frames: number of frames of the sequence
+    :param yolo_labels: also save YOLO labels file next to each frame
+    :param mask_format: also save digit masks of all frames in a single npy file
+        (see :func:`encode_masks`)
+    """
+    path = Path(directory).joinpath(f"{idx:06d}")
+    path.mkdir(parents=True, exist_ok=True)
+    masks: Optional[np.memmap] = None
+    id_maps: Optional[np.memmap] = None
+    annotations = path.joinpath(STREAM_ANNOTATIONS_FILE)
+    with annotations.open("w") as annotations_fp:
+        for frame_idx, (frame, bboxes, labels, ids, *instances) in enumerate(sequence):
+            image = os.path.join(path, f"{frame_idx:06d}.jpg")
+            with profiling.stage("encode"), open(image, "wb") as fp:
+                frame.save(fp, format="JPEG")
+            if yolo_labels:
+                with profiling.stage("labels"):
+                    save_frame_labels(image, bboxes, labels)
+            if mask_format is not None:
+                with profiling.stage("masks"):
+                    mask = encode_masks(frame_mask(frame), mask_format)
+                    if masks is None:
+                        masks = open_memmap(
+                            path.joinpath(MASKS_FILE),
+                            mode="w+",
+                            dtype=mask.dtype,
+                            shape=(n_frames, *mask.shape),
+                        )
+                    masks[frame_idx] = mask
+            for frame_instances in instances:
+                with profiling.stage("instances"):
+                    if id_maps is None:
+                        id_maps = open_memmap(
+                            path.joinpath(INSTANCES_FILE),
+                            mode="w+",
+                            dtype=np.uint8,
+                            shape=(n_frames, *frame_instances.id_map.shape),
+                        )
+                    id_maps[frame_idx] = frame_instances.id_map
+            with profiling.stage("annotations"):
+                annotation = frame_annotation(bboxes, labels, ids, instances)
+                annotations_fp.write(json.dumps(annotation) + "\n")
+                annotations_fp.flush()
+    for array in [masks, id_maps]:
+        if array is not None:
+            array.flush()
+
+
+def load_annotations(path: Path) -> List[Dict[str, Any]]:
+    """Load annotations of frames of a sequence saved in a directory.
+
+    .. note: annotations streamed with :func:`stream_sequence` are read up to the
+        last complete line, so annotations of an interrupted sequence are loaded
+        for all frames written before it was interrupted
+
+    :param path: sequence directory
+    :return: annotation of each frame
+    """
+    stream = path.joinpath(STREAM_ANNOTATIONS_FILE)
+    if not stream.exists():
+        with path.joinpath(ANNOTATIONS_FILE).open("r") as fp:
+            return json.load(fp)
+    annotations = []
+    with stream.open("r") as fp:
+        for line in fp:
+            if not line.endswith("\n"):
+                break
+            annotations.append(json.loads(line))
+    return annotations
+
+
+def encode_frame(frame: Image.Image) -> bytes:
+    """Encode frame as JPEG image (identical to the one saved by `save_sequence`)."""
+    buffer = io.BytesIO()
+    with profiling.stage("encode"):
+        frame.save(buffer, format="JPEG")
+    return buffer.getvalue()
+
+
+def encode_array(array: np.ndarray) -> bytes:
+    """Encode array as npy file."""
+    buffer = io.BytesIO()
+    np.save(buffer, array)
+    return buffer.getvalue()
+
+
+def sequence_members(
+    sequence: Iterable[Frame],
+    idx: int,
+    mask_format: Optional[str] = None,
+) -> List[Tuple[str, bytes]]:
+    """Encode sequence as files of a single WebDataset-style sample.
+
+    Files of a sample share the sequence index as a key: frames are named
+    `{idx}.{frame_idx}.jpg`, their YOLO labels are named `{idx}.{frame_idx}.txt`,
+    annotations (as saved by `save_sequence`) are named `{idx}.json`, masks (if
+    saved) are named `{idx}.masks.npy` and instance id maps (if yielded with frames)
+    are named `{idx}.instances.npy`.
+
+    :param sequence: sequence of frames with bounding boxes, labels and track ids
+    :param idx: sequence index
+    :param mask_format: also encode digit masks (see :func:`encode_masks`)
+    :return: file names and contents
+    """
+    key = f"{idx:06d}"
+    members = []
+    annotation = []
+    masks = []
+    id_maps: List[np.ndarray] = []
+    for frame_idx, (frame, bboxes, labels, ids, *instances) in enumerate(sequence):
+        members.append((f"{key}.{frame_idx:06d}.jpg", encode_frame(frame)))
+        with profiling.stage("labels"):
+            members.append(
+                (f"{key}.{frame_idx:06d}.txt", frame_labels(bboxes, labels).encode())
+            )
+        if mask_format is not None:
+            with profiling.stage("masks"):
+                masks.append(frame_mask(frame))
+        id_maps.extend(frame_instances.id_map for frame_instances in instances)
+        annotation.append(frame_annotation(bboxes, labels, ids, instances))
+    with profiling.stage("annotations"):
+        members.append((f"{key}.json", json.dumps(annotation, indent=2).encode()))
+    if mask_format is not None:
+        with profiling.stage("masks"):
+            encoded = encode_masks(np.stack(masks), mask_format)
+            members.append((f"{key}.{MASKS_FILE}", encode_array(encoded)))
+    if id_maps:
+        with profiling.stage("instances"):
+            members.append((f"{key}.{INSTANCES_FILE}", encode_array(np.stack(id_maps))))
+    return members
@@ -0,0 +1,204 @@
+"""Split of dataset generation across nodes and merge of their outputs."""
+import json
+import logging
+import shutil
+from pathlib import Path
+from typing import Any, Dict, List, Set, Tuple
+
+from moving_multiscalemnist.manifest import MANIFEST_FILE
+from moving_multiscalemnist.prepare import save_dataset_files, sequence_images
+from moving_multiscalemnist.trajectory import (
+    TRAJECTORIES_FILE,
+    concatenate_trajectories,
+    load_trajectories,
+    save_trajectories,
+)
+
+logger = logging.getLogger(__name__)
+
+SHARD_INFO_FILE = "shard.json"
+
+
+def shard_range(n_sequences: int, num_shards: int, shard_index: int) -> range:
+    """Get global indices of sequences generated by a shard.
+
+    Sequences are split into contiguous ranges, one per shard, with sizes differing
+    by at most one.
+
+    :param n_sequences: number of sequences in subset
+    :param num_shards: number of shards
+    :param shard_index: index of the shard
+    :return: indices of sequences of the shard
+    """
+    if num_shards < 1:
+        raise ValueError(f"Number of shards must be positive, got {num_shards}")
+    if not 0 <= shard_index < num_shards:
+        raise ValueError(f"Shard index {shard_index} out of range of {num_shards}")
+    return range(
+        n_sequences * shard_index // num_shards,
+        n_sequences * (shard_index + 1) // num_shards,
+    )
+
+
+def save_shard_info(
+    output_dir: str,
+    num_shards: int,
+    shard_index: int,
+    params: Dict[str, Any],
+    subsets: Dict[str, Dict[str, Any]],
+):
+    """Record generated shard in its output directory.
+
+    :param output_dir: dataset directory of the shard
+    :param num_shards: number of shards
+    :param shard_index: index of the shard
+    :param params: parameters of the whole dataset
+    :param subsets: range of sequence indices and labels of digits of the shard in
+        each subset
+    """
+    with Path(output_dir).joinpath(SHARD_INFO_FILE).open("w") as fp:
+        json.dump(
+            {
+                "num_shards": num_shards,
+                "shard_index": shard_index,
+                "params": params,
+                "subsets": subsets,
+            },
+            fp,
+            indent=2,
+        )
+
+
+def _load_shard_infos(shard_dirs: List[str]) -> List[Dict[str, Any]]:
+    """Load records of all shards ordered by shard index and check they match."""
+    infos = []
+    for directory in shard_dirs:
+        path = Path(directory).joinpath(SHARD_INFO_FILE)
+        if not path.exists():
+            raise ValueError(f"No shard record in {directory}, shard is incomplete")
+        with path.open("r") as fp:
+            infos.append({**json.load(fp), "directory": Path(directory)})
+    infos.sort(key=lambda info: info["shard_index"])
+    num_shards = infos[0]["num_shards"]
+    if [info["shard_index"] for info in infos] != list(range(num_shards)) or any(
+        info["num_shards"] != num_shards for info in infos
+    ):
+        raise ValueError(f"Expected each of {num_shards} shards exactly once")
+    if any(info["params"] != infos[0]["params"] for info in infos):
+        raise ValueError("Shards were generated with different parameters")
+    return infos
+
+
+def _merge_manifests(infos: List[Dict[str, Any]], subset: str) -> str:
+    """Concatenate manifests of subset, checking all shard sequences are saved."""
+    lines: List[str] = []
+    for info in infos:
+        start, stop = info["subsets"][subset]["start"], info["subsets"][subset]["stop"]
+        records = {}
+        with info["directory"].joinpath(subset, MANIFEST_FILE).open("r") as fp:
+            for line in fp:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                records[record["index"]] = record
+        if sorted(records) != list(range(start, stop)):
+            raise ValueError(
+                f"Shard {info['shard_index']} is missing {subset} sequences"
+            )
+        lines.extend(json.dumps(records[idx]) + "\n" for idx in range(start, stop))
+    return "".join(lines)
+
+
+def _plan_moves(
+    infos: List[Dict[str, Any]], subset: str, output: Path
+) -> List[Tuple[Path, Path]]:
+    """List entries of shard subset directories to move, checking for conflicts.
+
+    Sequence directories of all shards are moved; other files (the same in all
+    shards) are taken from the first shard having them.
+    """
+    moves = []
+    targets: Set[str] = set()
+    for info in infos:
+        for entry in sorted(info["directory"].joinpath(subset).iterdir()):
+            if entry.name in (MANIFEST_FILE, TRAJECTORIES_FILE):
+                continue
+            target = output.joinpath(entry.name)
+            if entry.name.isdigit():
+                if entry.name in targets or target.exists():
+                    raise ValueError(f"Sequence {target} is saved by two shards")
+            elif entry.name in targets or target.exists():
+                continue
+            targets.add(entry.name)
+            moves.append((entry, target))
+    return moves
+
+
+def merge_shards(shard_dirs: List[str], output_dir: str):
+    """Merge datasets generated by all shards into a single dataset.
+
+    Sequence directories of shards are moved to the output directory (so shard
+    directories are emptied) and subset manifests and trajectories are
+    concatenated; files of whole subsets (e.g. scenario), which are the same in
+    all shards, are taken from the first shard. YOLO image lists and names are
+    built from ranges and labels recorded by shards, without reading annotations
+    of sequences.
+
+    .. note: manifests, trajectories and sequence directories of all subsets of all
+        shards are checked before anything is moved, so an incomplete or
+        conflicting shard leaves all shards untouched
+
+    .. note: sequences are numbered by global indices and depend only on the seed
+        and their index, so the merged dataset is identical to a dataset generated
+        by a single node
+
+    :param shard_dirs: dataset directories of all shards
+    :param output_dir: merged dataset directory
+    """
+    infos = _load_shard_infos(shard_dirs)
+    params = infos[0]["params"]
+    output = Path(output_dir)
+    subsets = list(infos[0]["subsets"])
+    manifests = {subset: _merge_manifests(infos, subset) for subset in subsets}
+    moves = {
+        subset: _plan_moves(infos, subset, output.joinpath(subset))
+        for subset in subsets
+    }
+    trajectories = {
+        subset: concatenate_trajectories(
+            [
+                load_trajectories(info["directory"].joinpath(subset, TRAJECTORIES_FILE))
+                for info in infos
+            ]
+        )
+        for subset in subsets
+        if params.get("trajectories")
+    }
+
+    labels: Dict[str, Set[int]] = {}
+    for subset in subsets:
+        logger.info(f"Merging {subset} dataset of {len(infos)} shards.")
+        subset_output = output.joinpath(subset)
+        subset_output.mkdir(parents=True, exist_ok=True)
+        if subset in trajectories:
+            save_trajectories(
+                subset_output.joinpath(TRAJECTORIES_FILE), *trajectories[subset]
+            )
+        for entry, target in moves[subset]:
+            shutil.move(str(entry), str(target))
+        subset_output.joinpath(MANIFEST_FILE).write_text(manifests[subset])
+        labels[subset] = set()
+        for info in infos:
+            labels[subset].update(info["subsets"][subset]["labels"])
+
+    if params["format"] == "jpeg":
+        logger.info("Generating annotations.")
+        save_dataset_files(
+            output,
+            train_images=sequence_images(params["train_size"], params["n_frames"]),
+            test_images=sequence_images(params["test_size"], params["n_frames"]),
+            train_labels=labels["train"],
+            test_labels=labels["test"],
+        )
+    logger.info("Done.")
@@ -0,0 +1,88 @@
+"""Cache of resized digit sprites."""
+from typing import Dict, Tuple
+
+import numpy as np
+from PIL import Image
+
+
+def tight_bboxes(images: np.ndarray) -> np.ndarray:
+    """Calculate tight X1Y1X2Y2 bboxes of nonzero pixels of a stack of images.
+
+    .. note: bbox is found from row and column projections instead of coordinates of
+        all nonzero pixels; an empty image gets a bbox of the whole image
+
+    :param images: images of shape (..., height, width)
+    :return: bboxes of shape (..., 4)
+    """
+    height, width = images.shape[-2:]
+    nonzero = images > 0
+    columns = np.any(nonzero, axis=-2)
+    rows = np.any(nonzero, axis=-1)
+    return np.stack(
+        [
+            columns.argmax(axis=-1),
+            rows.argmax(axis=-1),
+            width - 1 - columns[..., ::-1].argmax(axis=-1),
+            height - 1 - rows[..., ::-1].argmax(axis=-1),
+        ],
+        axis=-1,
+    )
+
+
+class Sprite:
+    """MNIST digit image with resized variants cached by size.
+
+    .. note: digit size takes only a few distinct values along the oscillation period,
+        so a single sprite may be shared between frames and between digits created
+        from the same MNIST image
+    """
+
+    def __init__(self, image: np.ndarray):
+        """
+        :param image: digit image as np array
+        """
+        self._image = Image.fromarray(image)
+        self._images: Dict[int, Image.Image] = {}
+        self._arrays: Dict[int, np.ndarray] = {}
+        self._binary_masks: Dict[int, np.ndarray] = {}
+        self._masks: Dict[int, Image.Image] = {}
+        self._areas: Dict[int, int] = {}
+        self._bboxes: Dict[int, Tuple[int, int, int, int]] = {}
+
+    def image(self, size: int) -> Image.Image:
+        """Get digit image resized to given size."""
+        if size not in self._images:
+            self._images[size] = self._image.resize((size, size))
+        return self._images[size]
+
+    def array(self, size: int) -> np.ndarray:
+        """Get digit image resized to given size as np array."""
+        if size not in self._arrays:
+            self._arrays[size] = np.array(self.image(size))
+        return self._arrays[size]
+
+    def binary_mask(self, size: int) -> np.ndarray:
+        """Get boolean mask of digit pixels pasted onto the frame."""
+        if size not in self._binary_masks:
+            self._binary_masks[size] = self.array(size) > 100
+        return self._binary_masks[size]
+
+    def area(self, size: int) -> int:
+        """Get number of digit pixels pasted onto the frame."""
+        if size not in self._areas:
+            self._areas[size] = int(self.binary_mask(size).sum())
+        return self._areas[size]
+
+    def mask(self, size: int) -> Image.Image:
+        """Get paste mask of the digit resized to given size."""
+        if size not in self._masks:
+            mask = 255 * self.binary_mask(size).astype(np.uint8)
+            self._masks[size] = Image.fromarray(mask)
+        return self._masks[size]
+
+    def bbox(self, size: int) -> Tuple[int, int, int, int]:
+        """Get tight X1Y1X2Y2 bbox of the digit resized to given size."""
+        if size not in self._bboxes:
+            x1, y1, x2, y2 = tight_bboxes(self.array(size)).tolist()
+            self._bboxes[size] = (x1, y1, x2, y2)
+        return self._bboxes[size]
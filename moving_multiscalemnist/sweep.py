@@ -0,0 +1,188 @@
+"""Generation of many dataset variants over a grid of parameters."""
+import itertools
+import json
+import logging
+from multiprocessing import Pool
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from moving_multiscalemnist.atlas import Atlas, load_atlas, oscillated_sizes
+from moving_multiscalemnist.generate import SUBSETS, generate_dataset
+from moving_multiscalemnist.mnist import fetch_mnist
+
+logger = logging.getLogger(__name__)
+
+SWEEP_FILE = "sweep.json"
+CONFIG_FILE = "config.json"
+SWEEP_PARAMS = (
+    "train_size",
+    "test_size",
+    "n_frames",
+    "min_digits",
+    "max_digits",
+    "image_size",
+    "sizes",
+    "oscillations",
+    "oscillations_variances",
+    "fps",
+    "seed",
+)
+
+
+def expand_grid(grid: Dict[str, List[Any]]) -> List[Dict[str, Any]]:
+    """List all combinations of values of parameters in grid.
+
+    :param grid: values of each parameter
+    :return: configurations in order of the last parameter changing fastest
+    """
+    names = list(grid)
+    return [
+        dict(zip(names, values))
+        for values in itertools.product(*(grid[name] for name in names))
+    ]
+
+
+def load_sweep(path: str) -> List[Dict[str, Any]]:
+    """Load configurations of a sweep from JSON file.
+
+    The file holds a "grid" of values of parameters (expanded to all their
+    combinations) and/or a list of "configs"; a configuration may be given a
+    "name" of its output directory.
+
+    :param path: sweep file path
+    :return: configurations (grid configurations first)
+    """
+    with open(path, "r") as fp:
+        sweep = json.load(fp)
+    unknown = set(sweep) - {"grid", "configs"}
+    if unknown:
+        raise ValueError(f"Unknown sweep keys: {sorted(unknown)}")
+    return expand_grid(sweep.get("grid", {})) + list(sweep.get("configs", []))
+
+
+def name_configs(configs: List[Dict[str, Any]]) -> List[Tuple[str, Dict[str, Any]]]:
+    """Validate configurations and name them (by their position if not named)."""
+    named = []
+    for idx, config in enumerate(configs):
+        config = dict(config)
+        name = str(config.pop("name", f"{idx:03d}"))
+        unknown = set(config) - set(SWEEP_PARAMS)
+        if unknown:
+            raise ValueError(f"Unknown parameters of config {name}: {sorted(unknown)}")
+        named.append((name, config))
+    names = [name for name, _ in named]
+    if len(set(names)) != len(names):
+        raise ValueError("Config names are not unique")
+    return named
+
+
+def load_sweep_atlases(
+    atlas_dir: str,
+    mnist: Dict[str, Tuple[np.ndarray, np.ndarray]],
+    params: List[Dict[str, Any]],
+) -> Dict[str, Atlas]:
+    """Load atlases of subsets holding all digit sizes reached in any variant."""
+    sizes = sorted(
+        {
+            size
+            for config in params
+            for size in oscillated_sizes(
+                config["sizes"],
+                config["oscillations"],
+                config["oscillations_variances"],
+                config["fps"],
+                config["n_frames"],
+            )
+        }
+    )
+    return {
+        subset: load_atlas(atlas_dir, images=mnist[subset][0], sizes=sizes)
+        for subset in SUBSETS
+    }
+
+
+_sweep_kwargs: Dict[str, Any] = {}
+
+
+def _init_sweep_worker(kwargs: Dict[str, Any]):
+    """Store arguments shared by all variants in worker process."""
+    _sweep_kwargs.update(kwargs)
+
+
+def _generate_variant(variant: Tuple[str, Dict[str, Any]]) -> str:
+    """Generate single variant with arguments shared by all variants."""
+    name, params = variant
+    generate_dataset(**_sweep_kwargs, **params)
+    return name
+
+
+def generate_sweep(
+    configs: List[Dict[str, Any]],
+    output_dir: str,
+    data_dir: str,
+    workers: int = 1,
+    atlas_dir: Optional[str] = None,
+    **base_params: Any,
+):
+    """Generate a dataset variant for each configuration in a single process pool.
+
+    MNIST is loaded once (memory-mapped, so its pages are shared by all processes)
+    and with `atlas_dir`, a single atlas per subset holding digit sizes of all
+    variants is built once and shared by all of them. With at least as many
+    variants as workers, variants are generated in parallel, one per worker process;
+    otherwise they are generated one after another, each with all workers.
+
+    Each variant is saved in a directory named after the configuration, with
+    parameters of the variant recorded in a JSON file; names and parameters of all
+    variants are also recorded in a JSON file in the output directory.
+
+    .. note: a variant depends only on its parameters, so it is identical to a
+        dataset generated separately with the same parameters
+
+    :param configs: parameters overriding `base_params` in each variant (see
+        :func:`load_sweep`)
+    :param output_dir: directory of all variants
+    :param data_dir: MNIST location
+    :param workers: number of worker processes
+    :param atlas_dir: cache directory of sprite atlases (digits are resized on the
+        fly if not given)
+    :param base_params: parameters of :func:`generate_dataset` shared by variants
+    """
+    named = name_configs(configs)
+    variants = [(name, {**base_params, **config}) for name, config in named]
+    output = Path(output_dir)
+    output.mkdir(parents=True, exist_ok=True)
+    with output.joinpath(SWEEP_FILE).open("w") as fp:
+        json.dump([{"name": name, **params} for name, params in variants], fp, indent=2)
+    mnist = fetch_mnist(data_dir)
+    atlases = (
+        None
+        if atlas_dir is None
+        else load_sweep_atlases(atlas_dir, mnist, [params for _, params in variants])
+    )
+    parallel = workers > 1 and len(variants) >= workers
+    kwargs = {
+        "data_dir": data_dir,
+        "mnist": mnist,
+        "atlases": atlases,
+        "workers": 1 if parallel else workers,
+    }
+    tasks = []
+    for name, params in variants:
+        directory = output.joinpath(name)
+        directory.mkdir(exist_ok=True)
+        with directory.joinpath(CONFIG_FILE).open("w") as fp:
+            json.dump(params, fp, indent=2)
+        tasks.append((name, {"output_dir": str(directory), **params}))
+
+    logger.info(f"Generating {len(tasks)} variants in {output}.")
+    if not parallel:
+        _init_sweep_worker(kwargs)
+        for name in map(_generate_variant, tasks):
+            logger.info(f"Generated variant {name}.")
+        return
+    with Pool(workers, initializer=_init_sweep_worker, initargs=(kwargs,)) as pool:
+        for name in pool.imap_unordered(_generate_variant, tasks):
+            logger.info(f"Generated variant {name}.")
@@ -0,0 +1,371 @@
+"""Vectorized motion of digits of a batch of sequences."""
+from pathlib import Path
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+import numpy as np
+from PIL import Image
+
+from moving_multiscalemnist.digit import Digit
+from moving_multiscalemnist.sprite import Sprite
+
+TRAJECTORIES_FILE = "trajectories.npz"
+
+
+class Trajectories(NamedTuple):
+    """Positions and sizes of all digits of a batch of sequences in all frames.
+
+    :param x: relative horizontal digit centers of shape (frames, batch, digits)
+    :param y: relative vertical digit centers of shape (frames, batch, digits)
+    :param sizes: digit sizes of shape (frames, batch, digits)
+    :param x1: left digit edges of shape (frames, batch, digits)
+    :param y1: top digit edges of shape (frames, batch, digits)
+    :param bounce_x: digits bouncing horizontally after the frame
+    :param bounce_y: digits bouncing vertically after the frame
+    :param labels: digit labels of shape (batch, digits)
+    :param n_digits: number of digits in each sequence of shape (batch,)
+    """
+
+    x: np.ndarray
+    y: np.ndarray
+    sizes: np.ndarray
+    x1: np.ndarray
+    y1: np.ndarray
+    bounce_x: np.ndarray
+    bounce_y: np.ndarray
+    labels: np.ndarray
+    n_digits: np.ndarray
+
+
+def shall_bounce(
+    position: np.ndarray, margin: np.ndarray, counter: np.ndarray, threshold: int
+) -> np.ndarray:
+    """Vectorized :meth:`moving_multiscalemnist.digit.Digit.shall_bounce_horizontally`.
+
+    .. note: bounce counter is updated in place
+    """
+    bounce = (position < margin) | (1 - margin < position)
+    counter += bounce
+    counter[counter == threshold] = 0
+    return bounce & (counter == 0)
+
+
+class DigitBatch:
+    """State of all digits of a batch of sequences kept in arrays.
+
+    .. note: sequences with fewer digits are padded; padded digits are never drawn
+    """
+
+    def __init__(self, sequences: List[List[Digit]], max_digits: Optional[int] = None):
+        """
+        :param sequences: digits of each sequence in the batch
+        :param max_digits: number of digits sequences are padded to (at least the
+            number of digits of the longest sequence)
+        """
+        batch_size = len(sequences)
+        max_digits = max(
+            [len(digits) for digits in sequences]
+            + ([max_digits] if max_digits is not None else []),
+            default=0,
+        )
+        shape = (batch_size, max_digits)
+
+        self.n_digits = np.array([len(digits) for digits in sequences], dtype=int)
+        self.valid = np.arange(max_digits)[None, :] < self.n_digits[:, None]
+        self.sprites: List[List[Sprite]] = [
+            [digit._sprite for digit in digits] for digits in sequences
+        ]
+
+        self.labels = np.full(shape, -1, dtype=int)
+        self._base_size = np.zeros(shape, dtype=int)
+        self._osc_t = np.ones(shape)
+        self._osc_var = np.zeros(shape)
+        self._x = np.full(shape, 0.5)
+        self._y = np.full(shape, 0.5)
+        self._vel_x = np.zeros(shape)
+        self._vel_y = np.zeros(shape)
+        self._x_bounce = np.full(shape, -1, dtype=int)
+        self._y_bounce = np.full(shape, -1, dtype=int)
+        self._t = np.zeros(shape, dtype=int)
+        self._T = np.ones(shape)
+        self._bounce_thresh = 10
+
+        for seq_idx, digits in enumerate(sequences):
+            for digit_idx, digit in enumerate(digits):
+                idx = seq_idx, digit_idx
+                self.labels[idx] = digit.label
+                self._base_size[idx] = digit._size
+                self._osc_t[idx] = digit._osc_t
+                self._osc_var[idx] = digit._osc_var
+                self._x[idx] = digit._x
+                self._y[idx] = digit._y
+                self._vel_x[idx] = digit._vel_x
+                self._vel_y[idx] = digit._vel_y
+                self._x_bounce[idx] = digit._x_bounce
+                self._y_bounce[idx] = digit._y_bounce
+                self._t[idx] = digit._t
+                self._T[idx] = digit._T
+                self._bounce_thresh = digit._bounce_thresh
+
+        first = next((digits[0] for digits in sequences if digits), None)
+        self._image_width, self._image_height = (
+            (first._image_width, first._image_height) if first is not None else (0, 0)
+        )
+
+    def _sin(self, t: np.ndarray) -> np.ndarray:
+        return np.round(
+            1 + np.sin(t / (self._T * self._osc_t) * 2 * np.pi) * self._osc_var, 2
+        )
+
+    def frame_sizes(self, n_frames: int) -> np.ndarray:
+        """Calculate digit sizes in the following frames.
+
+        :param n_frames: number of frames
+        :return: sizes of shape (frames, batch, digits)
+        """
+        t = self._t + np.arange(n_frames)[:, None, None]
+        return np.trunc(self._base_size * self._sin(t)).astype(int)
+
+    def tight_bboxes(self, sizes: np.ndarray) -> np.ndarray:
+        """Gather tight X1Y1X2Y2 bboxes of sprites of given sizes.
+
+        :param sizes: sizes of shape (..., batch, digits)
+        :return: bboxes of shape (..., batch, digits, 4)
+        """
+        bboxes = np.zeros(sizes.shape + (4,), dtype=int)
+        for seq_idx, sprites in enumerate(self.sprites):
+            for digit_idx, sprite in enumerate(sprites):
+                digit_sizes = sizes[..., seq_idx, digit_idx]
+                for size in np.unique(digit_sizes).tolist():
+                    bboxes[..., seq_idx, digit_idx, :][
+                        digit_sizes == size
+                    ] = sprite.bbox(size)
+        return bboxes
+
+    def trajectories(self, n_frames: int) -> Trajectories:
+        """Calculate motion of all digits in the following frames.
+
+        .. note: sizes (hence bounce margins) of all frames are calculated at once,
+            so only the bounce counters and positions are stepped frame by frame,
+            for all digits of all sequences together; the batch is not modified
+
+        :param n_frames: number of frames
+        :return: digit trajectories
+        """
+        width, height = self._image_width, self._image_height
+        sizes = self.frame_sizes(n_frames)
+        x_margins = sizes / (4 * width) if width else np.zeros(sizes.shape)
+        y_margins = sizes / (4 * height) if height else np.zeros(sizes.shape)
+
+        x, y = self._x.copy(), self._y.copy()
+        vel_x, vel_y = self._vel_x.copy(), self._vel_y.copy()
+        x_bounce, y_bounce = self._x_bounce.copy(), self._y_bounce.copy()
+        xs = np.zeros(sizes.shape)
+        ys = np.zeros(sizes.shape)
+        bounce_x = np.zeros(sizes.shape, dtype=bool)
+        bounce_y = np.zeros(sizes.shape, dtype=bool)
+        for frame_idx in range(n_frames):
+            xs[frame_idx], ys[frame_idx] = x, y
+            bounce_x[frame_idx] = shall_bounce(
+                x, x_margins[frame_idx], x_bounce, self._bounce_thresh
+            )
+            bounce_y[frame_idx] = shall_bounce(
+                y, y_margins[frame_idx], y_bounce, self._bounce_thresh
+            )
+            vel_x[bounce_x[frame_idx]] = -vel_x[bounce_x[frame_idx]]
+            vel_y[bounce_y[frame_idx]] = -vel_y[bounce_y[frame_idx]]
+            x += vel_x / self._T
+            y += vel_y / self._T
+
+        return Trajectories(
+            x=xs,
+            y=ys,
+            sizes=sizes,
+            x1=np.trunc(xs * width - sizes / 2).astype(int),
+            y1=np.trunc(ys * height - sizes / 2).astype(int),
+            bounce_x=bounce_x,
+            bounce_y=bounce_y,
+            labels=self.labels,
+            n_digits=self.n_digits,
+        )
+
+    def bboxes(self, trajectories: Trajectories) -> np.ndarray:
+        """Calculate XYWH boxes of digits moving along trajectories.
+
+        :param trajectories: trajectories of the batch
+        :return: bboxes of shape (frames, batch, digits, 4)
+        """
+        return get_bbox_coords_batch(
+            self.tight_bboxes(trajectories.sizes),
+            trajectories.x1,
+            trajectories.y1,
+            (self._image_width, self._image_height),
+        )
+
+
+def get_bbox_coords_batch(
+    bboxes: np.ndarray, x1: np.ndarray, y1: np.ndarray, image_size: Tuple[int, int]
+) -> np.ndarray:
+    """Vectorized version of :func:`moving_multiscalemnist.sequence.get_bbox_coords`.
+
+    :param bboxes: X1Y1X2Y2 digit bboxes of shape (..., 4)
+    :param x1: digit locations of shape (...)
+    :param y1: digit locations of shape (...)
+    :param image_size: target image size
+    :return: XYWH bboxes of shape (..., 4)
+    """
+    width, height = image_size
+
+    x2 = np.clip(x1 + bboxes[..., 2], 0, width)
+    y2 = np.clip(y1 + bboxes[..., 3], 0, height)
+    x1 = np.clip(x1 + bboxes[..., 0], 0, width)
+    y1 = np.clip(y1 + bboxes[..., 1], 0, height)
+
+    return np.stack(
+        [
+            (x1 + x2) / 2 / width,
+            (y1 + y2) / 2 / height,
+            (x2 - x1) / width,
+            (y2 - y1) / height,
+        ],
+        axis=-1,
+    )
+
+
+class TrajectoryDigit:
+    """View of a single digit moving along precomputed trajectory.
+
+    .. note: provides the interface of :class:`moving_multiscalemnist.digit.Digit`
+        used by :func:`moving_multiscalemnist.sequence.prepare_sequence`
+    """
+
+    def __init__(
+        self, trajectories: Trajectories, sprite: Sprite, seq_idx: int, digit_idx: int
+    ):
+        """
+        :param trajectories: trajectories of the batch
+        :param sprite: digit sprite
+        :param seq_idx: sequence index in the batch
+        :param digit_idx: digit index in the sequence
+        """
+        self._trajectories = trajectories
+        self._sprite = sprite
+        self._idx = seq_idx, digit_idx
+        self._frame = 0
+        self.label = int(trajectories.labels[self._idx])
+
+    def _get(self, values: np.ndarray) -> int:
+        return int(values[(self._frame, *self._idx)])
+
+    @property
+    def size(self) -> int:
+        return self._get(self._trajectories.sizes)
+
+    @property
+    def x1(self) -> int:
+        return self._get(self._trajectories.x1)
+
+    @property
+    def y1(self) -> int:
+        return self._get(self._trajectories.y1)
+
+    @property
+    def image(self) -> Image.Image:
+        return self._sprite.image(self.size)
+
+    @property
+    def mask(self) -> Image.Image:
+        return self._sprite.mask(self.size)
+
+    @property
+    def binary_mask(self) -> np.ndarray:
+        return self._sprite.binary_mask(self.size)
+
+    @property
+    def area(self) -> int:
+        return self._sprite.area(self.size)
+
+    @property
+    def bbox(self) -> Tuple[int, int, int, int]:
+        return self._sprite.bbox(self.size)
+
+    def update(self) -> "TrajectoryDigit":
+        self._frame += 1
+        return self
+
+
+def trajectory_digits(
+    batch: DigitBatch, trajectories: Trajectories
+) -> List[List[TrajectoryDigit]]:
+    """Create views of all digits of a batch moving along trajectories."""
+    return [
+        [
+            TrajectoryDigit(trajectories, sprite, seq_idx, digit_idx)
+            for digit_idx, sprite in enumerate(sprites)
+        ]
+        for seq_idx, sprites in enumerate(batch.sprites)
+    ]
+
+
+def concatenate_trajectories(
+    parts: List[Tuple[Trajectories, np.ndarray]]
+) -> Tuple[Trajectories, np.ndarray]:
+    """Join trajectories and boxes of consecutive batches into a single batch.
+
+    :param parts: trajectories and boxes of batches padded to the same number of
+        digits
+    :return: trajectories and boxes of all sequences of the batches
+    """
+    trajectories = Trajectories(
+        **{
+            name: np.concatenate(
+                [getattr(part, name) for part, _ in parts],
+                axis=0 if name in ("labels", "n_digits") else 1,
+            )
+            for name in Trajectories._fields
+        }
+    )
+    return trajectories, np.concatenate([bboxes for _, bboxes in parts], axis=1)
+
+
+def save_trajectories(path: Path, trajectories: Trajectories, bboxes: np.ndarray):
+    """Save trajectories and ground truth boxes of a batch as npz file.
+
+    .. note: arrays are stored with batch as the first dimension, i.e. of shape
+        (sequences, frames, digits)
+
+    :param path: output file
+    :param trajectories: digit trajectories
+    :param bboxes: XYWH boxes of shape (frames, batch, digits, 4)
+    """
+    arrays = {
+        name: np.swapaxes(values, 0, 1)
+        for name, values in trajectories._asdict().items()
+        if name not in ("labels", "n_digits")
+    }
+    np.savez(
+        path,
+        labels=trajectories.labels,
+        n_digits=trajectories.n_digits,
+        bboxes=np.swapaxes(bboxes, 0, 1),
+        **arrays,
+    )
+
+
+def load_trajectories(path: Path) -> Tuple[Trajectories, np.ndarray]:
+    """Load trajectories and boxes saved with :func:`save_trajectories`."""
+    with np.load(path) as data:
+        arrays: Dict[str, np.ndarray] = {name: data[name] for name in data.files}
+    bboxes = np.swapaxes(arrays.pop("bboxes"), 0, 1)
+    return (
+        Trajectories(
+            **{
+                name: (
+                    values
+                    if name in ("labels", "n_digits")
+                    else np.swapaxes(values, 0, 1)
+                )
+                for name, values in arrays.items()
+            }
+        ),
+        bboxes,
+    )
@@ -0,0 +1,269 @@
+"""Shared memory transport of rendered batches between processes."""
+import multiprocessing
+import queue
+import traceback
+from multiprocessing.process import BaseProcess
+from multiprocessing.queues import Queue
+from multiprocessing.shared_memory import SharedMemory
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from moving_multiscalemnist.dataset import MovingMultiscaleMNIST
+from moving_multiscalemnist.render import RenderedBatch
+
+POLL_INTERVAL = 1.0
+
+
+class BatchRing:
+    """Ring of slots holding rendered batches in shared memory.
+
+    Each slot holds frames of shape (batch, frames, height, width), boxes of shape
+    (batch, frames, digits, 4), labels of shape (batch, digits), numbers of digits
+    and sequence indices of shape (batch,), so processes exchange only slot numbers.
+
+    .. note: only names of shared memory blocks are pickled; blocks are attached
+        again when the ring is copied to another process
+    """
+
+    def __init__(
+        self,
+        n_slots: int,
+        batch_size: int,
+        n_frames: int,
+        image_size: Tuple[int, int],
+        max_digits: int,
+        names: Optional[Dict[str, str]] = None,
+    ):
+        """
+        :param n_slots: number of slots
+        :param batch_size: maximum number of sequences in a slot
+        :param n_frames: number of frames in each sequence
+        :param image_size: frame size
+        :param max_digits: maximum number of digits in sequence
+        :param names: names of existing shared memory blocks to attach (new blocks
+            are created if not given)
+        """
+        width, height = image_size
+        self.n_slots = n_slots
+        self.batch_size = batch_size
+        self.n_frames = n_frames
+        self.image_size = (width, height)
+        self.max_digits = max_digits
+        self._attach(names)
+
+    def _attach(self, names: Optional[Dict[str, str]]):
+        """Create shared memory blocks (or attach existing ones) and map arrays."""
+        n_slots, batch_size, n_frames = self.n_slots, self.batch_size, self.n_frames
+        width, height = self.image_size
+        max_digits = self.max_digits
+        self._layout = {
+            "frames": ((n_slots, batch_size, n_frames, height, width), np.uint8),
+            "bboxes": ((n_slots, batch_size, n_frames, max_digits, 4), np.float64),
+            "labels": ((n_slots, batch_size, max_digits), np.int64),
+            "n_digits": ((n_slots, batch_size), np.int64),
+            "indices": ((n_slots, batch_size), np.int64),
+        }
+        self._owner = names is None
+        self._blocks: Dict[str, SharedMemory] = {}
+        self.arrays: Dict[str, np.ndarray] = {}
+        for key, (shape, dtype) in self._layout.items():
+            size = max(1, int(np.prod(shape)) * np.dtype(dtype).itemsize)
+            block = (
+                SharedMemory(create=True, size=size)
+                if names is None
+                else SharedMemory(name=names[key])
+            )
+            self._blocks[key] = block
+            self.arrays[key] = np.ndarray(shape, dtype=dtype, buffer=block.buf)
+
+    @property
+    def names(self) -> Dict[str, str]:
+        """Names of shared memory blocks."""
+        return {key: block.name for key, block in self._blocks.items()}
+
+    def __getstate__(self) -> Dict[str, Any]:
+        return {
+            "n_slots": self.n_slots,
+            "batch_size": self.batch_size,
+            "n_frames": self.n_frames,
+            "image_size": self.image_size,
+            "max_digits": self.max_digits,
+            "names": self.names,
+        }
+
+    def __setstate__(self, state: Dict[str, Any]):
+        state = state.copy()
+        names = state.pop("names")
+        self.__dict__.update(state)
+        self._attach(names)
+
+    def write(self, slot: int, indices: List[int], rendered: RenderedBatch) -> int:
+        """Copy annotations of a batch to slot (frames are rendered in place).
+
+        :return: number of digits of the batch
+        """
+        n_sequences, _, n_digits, _ = rendered.bboxes.shape
+        self.arrays["bboxes"][slot, :n_sequences, :, :n_digits] = rendered.bboxes
+        self.arrays["labels"][slot, :n_sequences, :n_digits] = rendered.labels
+        self.arrays["n_digits"][slot, :n_sequences] = rendered.n_digits
+        self.arrays["indices"][slot, :n_sequences] = indices
+        return n_digits
+
+    def batch(
+        self, slot: int, n_sequences: int, n_digits: int
+    ) -> Tuple[np.ndarray, RenderedBatch]:
+        """Get views of sequence indices and batch held in slot."""
+        return self.arrays["indices"][slot, :n_sequences], RenderedBatch(
+            frames=self.arrays["frames"][slot, :n_sequences],
+            bboxes=self.arrays["bboxes"][slot, :n_sequences, :, :n_digits],
+            labels=self.arrays["labels"][slot, :n_sequences, :n_digits],
+            n_digits=self.arrays["n_digits"][slot, :n_sequences],
+        )
+
+    def close(self):
+        """Detach shared memory blocks and remove them if created by this ring.
+
+        .. note: blocks still referenced by views are unmapped when the views are
+            garbage collected
+        """
+        self.arrays = {}
+        for block in self._blocks.values():
+            try:
+                block.close()
+            except BufferError:
+                pass
+            if self._owner:
+                block.unlink()
+        self._blocks = {}
+
+
+def _render_worker(
+    dataset: MovingMultiscaleMNIST,
+    ring: BatchRing,
+    tasks: Queue,
+    ready: Queue,
+):
+    """Render batches of sequences into slots until stopped with None."""
+    ready.cancel_join_thread()
+    while True:
+        task = tasks.get()
+        if task is None:
+            break
+        batch_idx, slot, indices = task
+        try:
+            rendered = dataset.render(
+                indices, frames=ring.arrays["frames"][slot, : len(indices)]
+            )
+            ready.put(
+                (batch_idx, slot, len(indices), ring.write(slot, indices, rendered))
+            )
+        except Exception:
+            ready.put((batch_idx, slot, None, traceback.format_exc()))
+
+
+class SharedMemoryLoader:
+    """Iterate over batches of dataset rendered by worker processes.
+
+    Workers render frames directly into a ring of shared memory slots and send back
+    only slot numbers, so neither frames nor annotations are pickled. Batches are
+    yielded in order of sequence indices as pairs of indices and
+    :class:`moving_multiscalemnist.render.RenderedBatch` (padded digits included).
+
+    .. note: yielded arrays are views of a slot, which is reused for another batch
+        when the next batch is taken; arrays have to be copied to be kept longer
+    """
+
+    def __init__(
+        self,
+        dataset: MovingMultiscaleMNIST,
+        workers: int = 2,
+        n_slots: Optional[int] = None,
+        batch_size: Optional[int] = None,
+        indices: Optional[List[int]] = None,
+    ):
+        """
+        :param dataset: dataset rendering sequences
+        :param workers: number of rendering processes
+        :param n_slots: number of batches rendered ahead (twice the number of workers
+            if not given)
+        :param batch_size: number of sequences in a batch (dataset batch size if not
+            given)
+        :param indices: indices of sequences to render (all sequences if not given)
+        """
+        self.dataset = dataset
+        self.workers = max(1, workers)
+        self.n_slots = max(1, n_slots or 2 * self.workers)
+        self.batch_size = batch_size or dataset.batch_size
+        self.indices = list(range(len(dataset))) if indices is None else indices
+
+    def __len__(self) -> int:
+        return -(-len(self.indices) // self.batch_size)
+
+    def __iter__(self) -> Iterator[Tuple[np.ndarray, RenderedBatch]]:
+        batches = [
+            self.indices[start : start + self.batch_size]
+            for start in range(0, len(self.indices), self.batch_size)
+        ]
+        context = multiprocessing.get_context()
+        ring = BatchRing(
+            self.n_slots,
+            batch_size=self.batch_size,
+            n_frames=self.dataset.n_frames,
+            image_size=self.dataset.image_size,
+            max_digits=self.dataset.max_digits,
+        )
+        tasks, ready = context.Queue(), context.Queue()
+        processes = [
+            context.Process(
+                target=_render_worker,
+                args=(self.dataset, ring, tasks, ready),
+                daemon=True,
+            )
+            for _ in range(self.workers)
+        ]
+        for process in processes:
+            process.start()
+        submitted = 0
+
+        def submit(slot: int):
+            nonlocal submitted
+            if submitted < len(batches):
+                tasks.put((submitted, slot, batches[submitted]))
+                submitted += 1
+
+        try:
+            for slot in range(self.n_slots):
+                submit(slot)
+            received: Dict[int, Tuple[int, Optional[int], Any]] = {}
+            for batch_idx in range(len(batches)):
+                while batch_idx not in received:
+                    message = self._receive(ready, processes)
+                    received[message[0]] = message[1:]
+                slot, n_sequences, n_digits = received.pop(batch_idx)
+                if n_sequences is None:
+                    raise RuntimeError(
+                        f"Rendering batch {batch_idx} failed:\n{n_digits}"
+                    )
+                yield ring.batch(slot, n_sequences, n_digits)
+                submit(slot)
+        finally:
+            for _ in processes:
+                tasks.put(None)
+            for process in processes:
+                process.join(timeout=10 * POLL_INTERVAL)
+                if process.is_alive():
+                    process.terminate()
+            ring.close()
+
+    @staticmethod
+    def _receive(
+        ready: Queue, processes: Sequence[BaseProcess]
+    ) -> Tuple[int, int, Optional[int], Any]:
+        """Wait for a rendered batch, checking if workers are still alive."""
+        while True:
+            try:
+                return ready.get(timeout=POLL_INTERVAL)
+            except queue.Empty:
+                if any(process.exitcode is not None for process in processes):
+                    raise RuntimeError("Rendering worker exited unexpectedly")
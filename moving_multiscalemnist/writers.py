@@ -0,0 +1,563 @@
+"""Writers of generated sequences."""
+import io
+import json
+import tarfile
+import threading
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple, Type
+
+import numpy as np
+
+from moving_multiscalemnist import profiling
+from moving_multiscalemnist.defaults import FPS, SHARD_SIZE
+from moving_multiscalemnist.prepare import (
+    load_names,
+    save_image_list,
+    save_names,
+    shard_images,
+)
+from moving_multiscalemnist.sequence import (
+    ANNOTATIONS_FILE,
+    APNG_FILE,
+    INSTANCES_FILE,
+    MASKS_FILE,
+    STREAM_ANNOTATIONS_FILE,
+    Frame,
+    encode_masks,
+    frame_mask,
+    save_sequence,
+    sequence_members,
+    stream_sequence,
+)
+
+Sequence = Iterable[Frame]
+
+FRAMES_FILE = "frames.npy"
+BOXES_FILE = "boxes.npy"
+LABELS_FILE = "labels.npy"
+IDS_FILE = "ids.npy"
+VISIBLE_FILE = "visible.npy"
+OFFSETS_FILE = "frame_offsets.npy"
+INDEX_FILE = "index.json"
+SHARD_FILE = "shard-{:06d}.tar"
+TAR_BLOCK = tarfile.BLOCKSIZE
+
+
+class SequenceWriter:
+    """Base writer of a subset of sequences.
+
+    Writers are created in the main process and copied to worker processes, where
+    :meth:`write` is called for each sequence. Values returned by :meth:`write` are
+    passed to :meth:`collect` in the main process and :meth:`close` is called once
+    all sequences are written.
+    """
+
+    resumable = False
+    streaming = False
+
+    def __init__(
+        self,
+        directory: str,
+        n_sequences: int,
+        n_frames: int,
+        image_size: Tuple[int, int],
+        color_mode: str = "rgb",
+        mask_format: Optional[str] = None,
+        instances: bool = False,
+    ):
+        """
+        :param directory: output directory of the subset
+        :param n_sequences: number of sequences in the subset
+        :param n_frames: number of frames in each sequence
+        :param image_size: frame size
+        :param color_mode: color mode frames are rendered in ("rgb" or "gray")
+        :param mask_format: also save digit masks of frames in given format (see
+            :func:`moving_multiscalemnist.sequence.encode_masks`)
+        :param instances: frames are rendered with instance id maps and visible
+            fractions of digits, which are saved as well
+        """
+        self.directory = Path(directory)
+        self.n_sequences = n_sequences
+        self.n_frames = n_frames
+        self.image_size = image_size
+        self.color_mode = color_mode
+        self.mask_format = mask_format
+        self.instances = instances
+
+    def _extra_files(self, idx: int) -> List[Path]:
+        path = self.directory.joinpath(f"{idx:06d}")
+        files = []
+        if self.mask_format is not None:
+            files.append(path.joinpath(MASKS_FILE))
+        if self.instances:
+            files.append(path.joinpath(INSTANCES_FILE))
+        return files
+
+    def write(self, idx: int, sequence: Sequence) -> Any:
+        """Write single sequence (called in worker process)."""
+        raise NotImplementedError
+
+    def collect(self, idx: int, result: Any):
+        """Gather result of writing a sequence (called in main process)."""
+
+    def sequence_files(self, idx: int) -> List[Path]:
+        """List files holding only the given sequence."""
+        return []
+
+    def close(self):
+        """Finalize subset once all sequences are written."""
+
+
+class JpegWriter(SequenceWriter):
+    """Write each sequence to a directory of JPEG frames and JSON annotations.
+
+    .. note: YOLO labels files are saved next to frames in the same pass
+
+    .. note: with `streaming`, frames are written as they are rendered and their
+        annotations are appended to a JSON Lines file (see
+        :func:`moving_multiscalemnist.sequence.stream_sequence`), so sequences are
+        written in constant memory
+    """
+
+    resumable = True
+
+    def __init__(
+        self,
+        directory: str,
+        n_sequences: int,
+        n_frames: int,
+        image_size: Tuple[int, int],
+        color_mode: str = "rgb",
+        mask_format: Optional[str] = None,
+        instances: bool = False,
+        streaming: bool = False,
+    ):
+        """
+        :param streaming: stream frames and annotations of sequences to files
+        """
+        super().__init__(
+            directory,
+            n_sequences,
+            n_frames,
+            image_size,
+            color_mode,
+            mask_format,
+            instances,
+        )
+        self.streaming = streaming
+
+    def write(self, idx: int, sequence: Sequence) -> Any:
+        if self.streaming:
+            stream_sequence(
+                sequence,
+                directory=str(self.directory),
+                idx=idx,
+                n_frames=self.n_frames,
+                yolo_labels=True,
+                mask_format=self.mask_format,
+            )
+            return
+        save_sequence(
+            sequence,
+            directory=str(self.directory),
+            idx=idx,
+            yolo_labels=True,
+            mask_format=self.mask_format,
+        )
+
+    def sequence_files(self, idx: int) -> List[Path]:
+        path = self.directory.joinpath(f"{idx:06d}")
+        return [
+            *sorted(path.glob("*.jpg")),
+            *sorted(path.glob("*.txt")),
+            path.joinpath(
+                STREAM_ANNOTATIONS_FILE if self.streaming else ANNOTATIONS_FILE
+            ),
+            *self._extra_files(idx),
+        ]
+
+
+class ApngWriter(SequenceWriter):
+    """Write each sequence to a directory with a single lossless animated PNG.
+
+    .. note: consecutive frames differ only where digits moved, so frames stored as
+        differences take a fraction of the size of JPEG frames (see
+        :func:`moving_multiscalemnist.sequence.save_apng`)
+    """
+
+    resumable = True
+
+    def __init__(
+        self,
+        directory: str,
+        n_sequences: int,
+        n_frames: int,
+        image_size: Tuple[int, int],
+        color_mode: str = "rgb",
+        mask_format: Optional[str] = None,
+        instances: bool = False,
+        fps: float = FPS,
+    ):
+        """
+        :param fps: playback frame rate of animated PNGs
+        """
+        super().__init__(
+            directory,
+            n_sequences,
+            n_frames,
+            image_size,
+            color_mode,
+            mask_format,
+            instances,
+        )
+        self.fps = fps
+
+    def write(self, idx: int, sequence: Sequence) -> Any:
+        save_sequence(
+            sequence,
+            directory=str(self.directory),
+            idx=idx,
+            frame_format="apng",
+            mask_format=self.mask_format,
+            fps=self.fps,
+        )
+
+    def sequence_files(self, idx: int) -> List[Path]:
+        path = self.directory.joinpath(f"{idx:06d}")
+        return [
+            path.joinpath(APNG_FILE),
+            path.joinpath(ANNOTATIONS_FILE),
+            *self._extra_files(idx),
+        ]
+
+
+class ArrayWriter(SequenceWriter):
+    """Write subset to contiguous memory-mappable arrays.
+
+    Frames of all sequences are stored in a single (sequences, frames, height, width,
+    channels) uint8 array (with a single channel in "gray" color mode); masks and
+    instance id maps, if saved, are stored in (sequences, frames, height, width)
+    arrays (with 8 pixels of a row per byte if masks are packed). Annotations are
+    stored in flat columnar arrays of boxes, labels, track ids and visible fractions
+    (if saved); annotations of frame `i` (counted across all sequences) are stored
+    between `frame_offsets[i]` and `frame_offsets[i + 1]`.
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        n_sequences: int,
+        n_frames: int,
+        image_size: Tuple[int, int],
+        color_mode: str = "rgb",
+        mask_format: Optional[str] = None,
+        instances: bool = False,
+    ):
+        super().__init__(
+            directory,
+            n_sequences,
+            n_frames,
+            image_size,
+            color_mode,
+            mask_format,
+            instances,
+        )
+        width, height = image_size
+        self.directory.mkdir(parents=True, exist_ok=True)
+        channels = 1 if color_mode == "gray" else 3
+        arrays: List[Tuple[str, np.dtype, Tuple[int, ...]]] = [
+            (FRAMES_FILE, np.dtype(np.uint8), (height, width, channels))
+        ]
+        if mask_format is not None:
+            empty = encode_masks(np.zeros((height, width), dtype=bool), mask_format)
+            arrays.append((MASKS_FILE, empty.dtype, empty.shape))
+        if instances:
+            arrays.append((INSTANCES_FILE, np.dtype(np.uint8), (height, width)))
+        for file, dtype, shape in arrays:
+            array = np.lib.format.open_memmap(
+                self.directory.joinpath(file),
+                mode="w+",
+                dtype=dtype,
+                shape=(n_sequences, n_frames, *shape),
+            )
+            array.flush()
+            del array
+        self._frames: Optional[np.ndarray] = None
+        self._masks: Optional[np.ndarray] = None
+        self._id_maps: Optional[np.ndarray] = None
+        self._annotations: Dict[int, Tuple[np.ndarray, ...]] = {}
+
+    def __getstate__(self) -> Dict[str, Any]:
+        state = self.__dict__.copy()
+        state["_frames"] = None
+        state["_masks"] = None
+        state["_id_maps"] = None
+        state["_annotations"] = {}
+        return state
+
+    @property
+    def frames(self) -> np.ndarray:
+        if self._frames is None:
+            self._frames = np.load(self.directory.joinpath(FRAMES_FILE), mmap_mode="r+")
+        return self._frames
+
+    @property
+    def masks(self) -> np.ndarray:
+        if self._masks is None:
+            self._masks = np.load(self.directory.joinpath(MASKS_FILE), mmap_mode="r+")
+        return self._masks
+
+    @property
+    def id_maps(self) -> np.ndarray:
+        if self._id_maps is None:
+            self._id_maps = np.load(
+                self.directory.joinpath(INSTANCES_FILE), mmap_mode="r+"
+            )
+        return self._id_maps
+
+    def write(self, idx: int, sequence: Sequence) -> Tuple[np.ndarray, ...]:
+        boxes = []
+        labels = []
+        ids = []
+        visible = []
+        counts = []
+        for frame_idx, (
+            frame,
+            bboxes,
+            frame_labels,
+            frame_ids,
+            *instances,
+        ) in enumerate(sequence):
+            with profiling.stage("encode"):
+                array = np.asarray(frame)
+                self.frames[idx, frame_idx] = array.reshape(self.frames.shape[2:])
+            if self.mask_format is not None:
+                with profiling.stage("masks"):
+                    self.masks[idx, frame_idx] = encode_masks(
+                        frame_mask(frame), self.mask_format
+                    )
+            for frame_instances in instances:
+                with profiling.stage("instances"):
+                    self.id_maps[idx, frame_idx] = frame_instances.id_map
+                visible.extend(frame_instances.visible)
+            boxes.extend(bboxes)
+            labels.extend(frame_labels)
+            ids.extend(frame_ids)
+            counts.append(len(frame_labels))
+        return (
+            np.array(boxes, dtype=np.float32).reshape(-1, 4),
+            np.array(labels, dtype=np.int32),
+            np.array(ids, dtype=np.int32),
+            np.array(counts, dtype=np.int64),
+            np.array(visible, dtype=np.float32),
+        )
+
+    def collect(self, idx: int, result: Tuple[np.ndarray, ...]):
+        self._annotations[idx] = result
+
+    def close(self):
+        results = [self._annotations[idx] for idx in range(self.n_sequences)]
+        boxes, labels, ids, counts, visible = (
+            np.concatenate(column)
+            for column in zip(
+                *results,
+                (
+                    np.zeros((0, 4), dtype=np.float32),
+                    np.zeros(0, dtype=np.int32),
+                    np.zeros(0, dtype=np.int32),
+                    np.zeros(0, dtype=np.int64),
+                    np.zeros(0, dtype=np.float32),
+                ),
+            )
+        )
+        offsets = np.zeros(self.n_sequences * self.n_frames + 1, dtype=np.int64)
+        np.cumsum(counts, out=offsets[1:])
+        np.save(self.directory.joinpath(BOXES_FILE), boxes.reshape(-1, 4))
+        np.save(self.directory.joinpath(LABELS_FILE), labels)
+        np.save(self.directory.joinpath(IDS_FILE), ids)
+        np.save(self.directory.joinpath(OFFSETS_FILE), offsets)
+        if self.instances:
+            np.save(self.directory.joinpath(VISIBLE_FILE), visible)
+
+
+def tar_member(name: str, data: bytes) -> bytes:
+    """Encode a file as a tar archive member (header, contents and padding)."""
+    info = tarfile.TarInfo(name)
+    info.size = len(data)
+    info.mode = 0o644
+    info.mtime = 0
+    header = info.tobuf(format=tarfile.USTAR_FORMAT)
+    return header + data + bytes(-len(data) % TAR_BLOCK)
+
+
+class TarWriter(SequenceWriter):
+    """Write sequences as samples of size-bounded tar shards with an index.
+
+    Each process appends samples of the sequences it writes to its own shard,
+    named after the first sequence in it, and starts a new shard once the shard
+    would exceed the size limit, so shards are written in parallel. Index saved on
+    close maps each sequence to its shard, offset and size in bytes, so a sequence
+    may be read without extracting (see :func:`read_tar_sample`). YOLO image list
+    of the subset (e.g. `train.txt`) and names files are saved next to the subset
+    directory, with labels of the other subset kept in the names file.
+
+    .. note: samples follow WebDataset conventions (see
+        :func:`moving_multiscalemnist.sequence.sequence_members`), so shards may be
+        streamed sequentially as well
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        n_sequences: int,
+        n_frames: int,
+        image_size: Tuple[int, int],
+        color_mode: str = "rgb",
+        mask_format: Optional[str] = None,
+        instances: bool = False,
+        shard_size: int = SHARD_SIZE,
+    ):
+        """
+        :param shard_size: maximum size of a shard in bytes (a shard holds at least a
+            single sequence)
+        """
+        super().__init__(
+            directory,
+            n_sequences,
+            n_frames,
+            image_size,
+            color_mode,
+            mask_format,
+            instances,
+        )
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.shard_size = shard_size
+        self._lock: Optional[threading.Lock] = None
+        self._shard: Optional[Tuple[str, int]] = None
+        self._index: Dict[int, Tuple[str, int, int]] = {}
+        self._labels: Set[int] = set()
+
+    def __getstate__(self) -> Dict[str, Any]:
+        state = self.__dict__.copy()
+        state["_lock"] = None
+        state["_shard"] = None
+        state["_index"] = {}
+        state["_labels"] = set()
+        return state
+
+    @property
+    def lock(self) -> threading.Lock:
+        if self._lock is None:
+            self._lock = threading.Lock()
+        return self._lock
+
+    def write(self, idx: int, sequence: Sequence) -> Tuple[str, int, int, Set[int]]:
+        labels: Set[int] = set()
+
+        def frames() -> Sequence:
+            for frame in sequence:
+                labels.update(frame[2])
+                yield frame
+
+        data = b"".join(
+            tar_member(name, content)
+            for name, content in sequence_members(frames(), idx, self.mask_format)
+        )
+        with self.lock:
+            if self._shard is None or (
+                self._shard[1] > 0
+                # leave space for the end of archive marker
+                and self._shard[1] + len(data) + 2 * TAR_BLOCK > self.shard_size
+            ):
+                self._shard = SHARD_FILE.format(idx), 0
+            shard, offset = self._shard
+            mode = "ab" if offset else "wb"
+            with self.directory.joinpath(shard).open(mode) as fp:
+                fp.write(data)
+            self._shard = shard, offset + len(data)
+        return shard, offset, len(data), labels
+
+    def collect(self, idx: int, result: Tuple[str, int, int, Set[int]]):
+        shard, offset, size, labels = result
+        self._index[idx] = shard, offset, size
+        self._labels.update(labels)
+
+    def close(self):
+        entries = [self._index[idx] for idx in range(self.n_sequences)]
+        shards = sorted({shard for shard, _, _ in entries})
+        for shard in shards:
+            with self.directory.joinpath(shard).open("ab") as fp:
+                fp.write(bytes(2 * TAR_BLOCK))
+        for stale in self.directory.glob(SHARD_FILE.replace("{:06d}", "*")):
+            if stale.name not in shards:
+                stale.unlink()
+        with self.directory.joinpath(INDEX_FILE).open("w") as fp:
+            json.dump(
+                {
+                    "shards": shards,
+                    "sequences": [
+                        {"shard": shard, "offset": offset, "size": size}
+                        for shard, offset, size in entries
+                    ],
+                },
+                fp,
+            )
+        dataset = self.directory.parent
+        save_image_list(
+            dataset, self.directory.name, shard_images(self.n_sequences, self.n_frames)
+        )
+        save_names(dataset, self._labels | load_names(dataset))
+
+
+def load_tar_index(directory: str) -> List[Dict[str, Any]]:
+    """Load shard, offset and size of each sequence saved with :class:`TarWriter`."""
+    with Path(directory).joinpath(INDEX_FILE).open("r") as fp:
+        return json.load(fp)["sequences"]
+
+
+def read_tar_sample(directory: str, entry: Dict[str, Any]) -> Dict[str, bytes]:
+    """Read files of a single sequence from its shard without extracting it.
+
+    :param directory: subset directory
+    :param entry: index entry of the sequence (see :func:`load_tar_index`)
+    :return: file contents by name
+    """
+    with Path(directory).joinpath(entry["shard"]).open("rb") as fp:
+        fp.seek(entry["offset"])
+        data = fp.read(entry["size"])
+    with tarfile.open(fileobj=io.BytesIO(data), mode="r:") as tar:
+        return {
+            member.name: tar.extractfile(member).read()  # type: ignore
+            for member in tar.getmembers()
+        }
+
+
+WRITERS: Dict[str, Type[SequenceWriter]] = {
+    "jpeg": JpegWriter,
+    "apng": ApngWriter,
+    "npy": ArrayWriter,
+    "tar": TarWriter,
+}
+
+
+def load_arrays(directory: str) -> Dict[str, np.ndarray]:
+    """Load subset saved with :class:`ArrayWriter` as read-only memory maps.
+
+    .. note: masks, instance id maps and visible fractions are loaded only if they
+        were saved
+    """
+    path = Path(directory)
+    return {
+        name: np.load(path.joinpath(file), mmap_mode="r")
+        for name, file in [
+            ("frames", FRAMES_FILE),
+            ("boxes", BOXES_FILE),
+            ("labels", LABELS_FILE),
+            ("ids", IDS_FILE),
+            ("frame_offsets", OFFSETS_FILE),
+            ("masks", MASKS_FILE),
+            ("id_maps", INSTANCES_FILE),
+            ("visible", VISIBLE_FILE),
+        ]
+        if path.joinpath(file).exists()
+    }
@@ -1,3 +1,4 @@
+import struct
 from unittest.mock import patch
 
 import numpy as np
@@ -14,3 +15,29 @@ def sample_digit(_choice_mock, _uniform_mock):
     image = np.zeros((32, 32))
     image[10:20, 8:23] = 0.2
     return Digit(image, label=3, image_size=(128, 128), sizes=(32, 64))
+
+
+@pytest.fixture
+def mnist_subset():
+    """Return small random subset of images and labels."""
+    random_state = np.random.RandomState(0)
+    images = np.zeros((20, 28, 28), dtype=np.uint8)
+    images[:, 6:22, 8:20] = random_state.randint(0, 256, size=(20, 16, 12))
+    labels = random_state.randint(0, 10, size=20).astype(np.uint8)
+    return images, labels
+
+
+@pytest.fixture
+def mnist_dir(tmp_path, mnist_subset):
+    """Return directory with small MNIST-like dataset files."""
+    images, labels = mnist_subset
+    path = tmp_path.joinpath("mnist")
+    path.mkdir()
+    for subset in ["train", "test"]:
+        path.joinpath(f"{subset}-images").write_bytes(
+            b"\x00\x00\x08\x03" + struct.pack(">3I", *images.shape) + images.tobytes()
+        )
+        path.joinpath(f"{subset}-labels").write_bytes(
+            b"\x00\x00\x08\x01" + struct.pack(">I", *labels.shape) + labels.tobytes()
+        )
+    return path
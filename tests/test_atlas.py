@@ -0,0 +1,68 @@
+"""Test sprite atlas."""
+import pickle
+
+import numpy as np
+
+from moving_multiscalemnist.atlas import load_atlas, oscillated_sizes
+from moving_multiscalemnist.digit import Digit
+from moving_multiscalemnist.sprite import Sprite
+
+
+def test_oscillated_sizes():
+    """Verify if atlas sizes cover all sizes digits take."""
+    params = {
+        "sizes": (16, 24),
+        "oscillations": (0.8, 1.2),
+        "oscillations_variances": (0.1, 0.3),
+        "fps": 10,
+    }
+    sizes = oscillated_sizes(n_frames=20, **params)
+    random_state = np.random.RandomState(0)
+    for _ in range(20):
+        digit = Digit(
+            np.zeros((28, 28), dtype=np.uint8),
+            label=0,
+            image_size=(64, 64),
+            random_state=random_state,
+            **params,
+        )
+        for _ in range(20):
+            assert digit.size in sizes
+            digit.update()
+
+
+def test_atlas_sprite(tmp_path, mnist_subset):
+    """Verify if atlas sprites are identical to resized sprites."""
+    images, _ = mnist_subset
+    atlas = load_atlas(str(tmp_path), images, sizes=[16, 21])
+
+    for idx in [0, 7]:
+        sprite = Sprite(images[idx])
+        atlas_sprite = atlas.sprite(idx, images[idx])
+        for size in [16, 21, 30]:
+            assert np.array_equal(atlas_sprite.array(size), sprite.array(size))
+            assert np.array_equal(
+                atlas_sprite.binary_mask(size), sprite.binary_mask(size)
+            )
+            assert np.array_equal(
+                np.array(atlas_sprite.image(size)), np.array(sprite.image(size))
+            )
+            assert atlas_sprite.bbox(size) == sprite.bbox(size)
+        assert isinstance(atlas_sprite.array(16), np.memmap)
+
+
+def test_atlas_cached(tmp_path, mnist_subset):
+    """Verify if atlas is built once per images and sizes and pickled by path."""
+    images, _ = mnist_subset
+    atlas = load_atlas(str(tmp_path), images, sizes=[16])
+    modified = atlas.directory.joinpath("16-images.npy").stat().st_mtime_ns
+
+    assert load_atlas(str(tmp_path), images, sizes=[16]).directory == atlas.directory
+    assert load_atlas(str(tmp_path), images[::-1], sizes=[16]).directory != (
+        atlas.directory
+    )
+    assert atlas.directory.joinpath("16-images.npy").stat().st_mtime_ns == modified
+
+    copied = pickle.loads(pickle.dumps(atlas))
+    assert len(pickle.dumps(atlas)) < 1000
+    assert np.array_equal(copied.images[16], atlas.images[16])
@@ -0,0 +1,46 @@
+"""Test benchmark harness."""
+import json
+
+import pytest
+
+from moving_multiscalemnist.benchmark import benchmark
+
+
+def test_benchmark(mnist_dir, tmp_path):
+    """Verify if benchmark reports all metrics for every configuration."""
+    results = benchmark(
+        data_dir=str(mnist_dir),
+        n_sequences=2,
+        n_frames=[2],
+        max_digits=[2, 3],
+        image_sizes=[(32, 32)],
+        sizes=[(8,)],
+        n_calls=5,
+    )
+    missing = benchmark(
+        data_dir=str(tmp_path),
+        n_sequences=1,
+        n_frames=[1],
+        max_digits=[1],
+        image_sizes=[(32, 32)],
+        sizes=[(8,)],
+        n_calls=1,
+    )
+
+    json.dumps(results)
+    assert results["environment"]["source"] == "mnist"
+    assert missing["environment"]["source"] == "synthetic"
+    assert len(results["runs"]) == 2
+    run = results["runs"][1]
+    assert run["params"]["max_digits"] == 3
+    assert set(run["render"]) == {"pil", "numpy", "dense"}
+    assert set(run["save"]) == {"jpeg", "apng", "npy", "tar"}
+    assert run["save"]["apng"]["read_frames_per_sec"] > 0
+    assert run["render"]["numpy"]["frames_per_sec"] > 0
+    assert run["digit"]["update_us"] > 0
+    assert run["generate"]["sequences_per_sec"] > 0
+    assert run["generate"]["frames_per_sec"] == pytest.approx(
+        2 * run["generate"]["sequences_per_sec"]
+    )
+    assert "peak_rss_mb" not in run
+    assert results["peak_rss_mb"] > 0
@@ -0,0 +1,62 @@
+"""Test in-memory dataset."""
+import pickle
+
+import numpy as np
+import pytest
+
+from moving_multiscalemnist import MovingMultiscaleMNIST
+from moving_multiscalemnist.generate import generate_subset, get_subset_seed_sequence
+from moving_multiscalemnist.mnist import fetch_mnist
+
+PARAMS = {
+    "n_frames": 3,
+    "min_digits": 1,
+    "max_digits": 3,
+    "image_size": (64, 48),
+    "sizes": (16, 24),
+    "oscillations": (1.0,),
+    "oscillations_variances": (0.2,),
+    "fps": 10,
+}
+
+
+@pytest.fixture
+def dataset(mnist_dir):
+    """Return small in-memory dataset."""
+    return MovingMultiscaleMNIST(
+        str(mnist_dir), subset="test", length=5, seed=3, batch_size=2, **PARAMS
+    )
+
+
+def test_dataset_item(dataset):
+    """Verify if dataset item contains arrays of a single sequence."""
+    item = dataset[1]
+    n_digits = len(item["labels"])
+
+    assert len(dataset) == 5
+    assert item["frames"].shape == (3, 48, 64)
+    assert item["frames"].dtype == np.uint8
+    assert item["boxes"].shape == (3, n_digits, 4)
+    assert item["ids"].tolist() == list(range(n_digits))
+    with pytest.raises(IndexError):
+        dataset[5]
+
+
+def test_dataset_deterministic(dataset, mnist_dir):
+    """Verify if items are reproducible and match generated subset."""
+    items = list(dataset)
+    expected = generate_subset(
+        fetch_mnist(str(mnist_dir))["test"],
+        n_sequences=5,
+        seed_sequence=get_subset_seed_sequence(3, "test"),
+        **PARAMS,
+    )
+
+    restored = pickle.loads(pickle.dumps(dataset))
+    for idx, (item, sequence) in enumerate(zip(items, expected)):
+        for key, value in restored[idx].items():
+            assert (value == item[key]).all()
+        for frame_idx, (frame, bboxes, labels, ids) in enumerate(sequence):
+            assert (item["frames"][frame_idx] == np.array(frame)[..., 0]).all()
+            assert item["boxes"][frame_idx] == pytest.approx(np.array(bboxes))
+            assert item["labels"].tolist() == labels
@@ -0,0 +1,122 @@
+"""Test renderer of dense scenes."""
+import numpy as np
+import pytest
+
+from moving_multiscalemnist.dense import (
+    GRID_CELL,
+    SpatialGrid,
+    _dirty_regions,
+    iter_dense_sequence,
+)
+from moving_multiscalemnist.digit import Digit
+from moving_multiscalemnist.sequence import prepare_sequence
+
+
+def _digits(mnist_subset, seed, n_digits, image_size, sizes=(16, 32)):
+    images, labels = mnist_subset
+    random_state = np.random.RandomState(seed)
+    return [
+        Digit(
+            images[idx % len(images)],
+            label=labels[idx % len(images)].item(),
+            image_size=image_size,
+            sizes=sizes,
+            oscillations=(0.5, 1.0),
+            oscillations_variances=(0.0, 0.3),
+            random_state=random_state,
+        )
+        for idx in range(n_digits)
+    ]
+
+
+@pytest.mark.parametrize(
+    "n_digits, image_size", [(4, (300, 200)), (40, (160, 128)), (1, (48, 48))]
+)
+def test_iter_dense_sequence(mnist_subset, n_digits, image_size):
+    """Verify if dense renderer reproduces frames and boxes of PIL renderer."""
+    expected = prepare_sequence(
+        _digits(mnist_subset, 1, n_digits, image_size),
+        n_frames=20,
+        image_size=image_size,
+        instances=True,
+    )
+    dense = iter_dense_sequence(
+        _digits(mnist_subset, 1, n_digits, image_size),
+        n_frames=20,
+        image_size=image_size,
+        instances=True,
+    )
+
+    for (frame, *annotations, instances), (
+        dense_frame,
+        *dense_annotations,
+        dense_instances,
+    ) in zip(expected, dense):
+        assert dense_frame.mode == frame.mode == "RGB"
+        assert (np.array(dense_frame) == np.array(frame)).all()
+        bboxes, labels, ids = annotations
+        dense_bboxes, dense_labels, dense_ids = dense_annotations
+        assert dense_bboxes == pytest.approx(bboxes)
+        assert (dense_labels, dense_ids) == (labels, ids)
+        assert (dense_instances.id_map == instances.id_map).all()
+        assert dense_instances.visible == pytest.approx(instances.visible)
+
+
+def test_iter_dense_sequence_large_digits(mnist_subset):
+    """Verify if digits larger than the frame are repainted when they change."""
+    digits = _digits(mnist_subset, 3, 3, (40, 40), sizes=(56, 64))
+    expected = prepare_sequence(digits, n_frames=20, image_size=(40, 40))
+    dense = iter_dense_sequence(
+        _digits(mnist_subset, 3, 3, (40, 40), sizes=(56, 64)),
+        n_frames=20,
+        image_size=(40, 40),
+    )
+
+    for (frame, *_), (dense_frame, *_) in zip(expected, dense):
+        assert (np.array(dense_frame) == np.array(frame)).all()
+
+
+def test_iter_dense_sequence_gray(mnist_subset):
+    """Verify if frames are rendered with a single channel."""
+    frame, *_ = next(
+        iter_dense_sequence(
+            _digits(mnist_subset, 2, 3, (64, 48)),
+            n_frames=2,
+            image_size=(64, 48),
+            color_mode="gray",
+        )
+    )
+
+    assert frame.mode == "L"
+    assert frame.size == (64, 48)
+
+
+def test_spatial_grid():
+    """Verify if digits are found in cells overlapping queried region."""
+    grid = SpatialGrid(cell=10)
+    grid.insert(2, (0, 0, 10, 10))
+    grid.insert(0, (5, 5, 25, 12))
+    grid.insert(1, (30, 30, 35, 35))
+
+    assert grid.query((0, 0, 1, 1)) == [0, 2]
+    assert grid.query((20, 10, 40, 40)) == [0, 1]
+    assert grid.query((40, 0, 50, 10)) == []
+
+
+def test_dirty_regions():
+    """Verify if footprints of changed digits are merged in runs of grid cells."""
+    image_size = (4 * GRID_CELL, 4 * GRID_CELL)
+    previous = [(0, 0, 10), (70, 5, 10), (200, 200, 10), (-10, -10, 300)]
+    current = [(0, 0, 10), (75, 5, 10), (0, 0, 0), (-10, -10, 300)]
+
+    assert _dirty_regions(previous, previous, image_size) == []
+    assert _dirty_regions(previous, current, image_size) == [
+        (GRID_CELL, 0, 2 * GRID_CELL, GRID_CELL),
+        (3 * GRID_CELL, 3 * GRID_CELL, 4 * GRID_CELL, 4 * GRID_CELL),
+    ]
+    assert _dirty_regions([(0, 0, 3 * GRID_CELL)], [(0, 0, 0)], image_size) == [
+        (0, 0, 4 * GRID_CELL, 4 * GRID_CELL)
+    ]
+    assert _dirty_regions([(-10, -10, 300)], [(-20, -10, 300)], image_size) == [
+        (0, 0, 4 * GRID_CELL, 4 * GRID_CELL)
+    ]
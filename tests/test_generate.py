@@ -0,0 +1,482 @@
+"""Test generating dataset."""
+import io
+import json
+
+import numpy as np
+import pytest
+from PIL import Image
+
+from moving_multiscalemnist.generate import (
+    generate_dataset,
+    generate_subset,
+    get_random_state,
+    plan_subset,
+)
+from moving_multiscalemnist.prepare import prepare_dataset
+from moving_multiscalemnist.reader import DatasetReader
+from moving_multiscalemnist.sequence import decode_masks
+from moving_multiscalemnist.writers import load_arrays, load_tar_index, read_tar_sample
+
+
+def _generate(mnist_subset, seed, n_sequences=3):
+    return [
+        [(np.array(frame), bboxes, labels, ids) for frame, bboxes, labels, ids in seq]
+        for seq in generate_subset(
+            mnist_subset,
+            n_sequences=n_sequences,
+            n_frames=3,
+            min_digits=1,
+            max_digits=3,
+            image_size=(64, 64),
+            sizes=(16, 24),
+            oscillations=(1.0,),
+            oscillations_variances=(0.2,),
+            fps=10,
+            seed_sequence=np.random.SeedSequence(seed),
+        )
+    ]
+
+
+def test_generate_subset_deterministic(mnist_subset):
+    """Verify if subset generated with the same seed is identical."""
+    first = _generate(mnist_subset, seed=7)
+    second = _generate(mnist_subset, seed=7)
+
+    for first_seq, second_seq in zip(first, second):
+        for (frame_1, *annotation_1), (frame_2, *annotation_2) in zip(
+            first_seq, second_seq
+        ):
+            assert (frame_1 == frame_2).all()
+            assert annotation_1 == annotation_2
+
+
+def test_generate_subset_prefix(mnist_subset):
+    """Verify if larger subset starts with the same sequences."""
+    short = _generate(mnist_subset, seed=7, n_sequences=2)
+    long = _generate(mnist_subset, seed=7, n_sequences=4)
+
+    for short_seq, long_seq in zip(short, long):
+        for (frame_1, *annotation_1), (frame_2, *annotation_2) in zip(
+            short_seq, long_seq
+        ):
+            assert (frame_1 == frame_2).all()
+            assert annotation_1 == annotation_2
+
+
+def test_plan_subset():
+    """Verify if digit slices are consecutive and fit in subset."""
+    slices = plan_subset(
+        10,
+        n_sequences=20,
+        min_digits=2,
+        max_digits=4,
+        random_state=get_random_state(np.random.SeedSequence(3)),
+    )
+
+    assert len(slices) == 20
+    for (start, end), (next_start, _) in zip(slices, slices[1:]):
+        assert 2 <= end - start <= 4
+        assert end <= 10
+        assert next_start in (0, end)
+
+
+def _read_dataset(path):
+    return {
+        str(file.relative_to(path)): file.read_bytes()
+        for file in sorted(path.rglob("*"))
+        if file.is_file()
+    }
+
+
+@pytest.mark.parametrize("workers, writer_threads", [(2, 0), (1, 2), (2, 3)])
+def test_generate_dataset_workers(tmp_path, mnist_dir, workers, writer_threads):
+    """Verify if generated dataset does not depend on workers and writer threads."""
+    for name, dataset_workers, dataset_writer_threads in [
+        ("single", 1, 0),
+        ("parallel", workers, writer_threads),
+    ]:
+        generate_dataset(
+            data_dir=str(mnist_dir),
+            train_size=4,
+            test_size=2,
+            n_frames=2,
+            min_digits=1,
+            max_digits=3,
+            image_size=(64, 64),
+            sizes=(16,),
+            oscillations=(1.0,),
+            oscillations_variances=(0.1,),
+            fps=10,
+            seed=5,
+            workers=dataset_workers,
+            batch_size=3,
+            writer_threads=dataset_writer_threads,
+            queue_depth=2,
+            output_dir=str(tmp_path.joinpath(name)),
+        )
+
+    expected = _read_dataset(tmp_path.joinpath("single"))
+    assert _read_dataset(tmp_path.joinpath("parallel")) == expected
+    assert "train/000003/000001.jpg" in expected
+
+
+@pytest.mark.parametrize(
+    "engine, atlas",
+    [("numpy", False), ("dense", False), ("pil", True), ("numpy", True)],
+)
+def test_generate_dataset_engines(tmp_path, mnist_dir, engine, atlas):
+    """Verify if engines produce the same dataset with and without sprite atlas."""
+    for name, dataset_engine, atlas_dir in [
+        ("pil", "pil", None),
+        (engine, engine, str(tmp_path.joinpath("atlas")) if atlas else None),
+    ]:
+        generate_dataset(
+            data_dir=str(mnist_dir),
+            train_size=5,
+            test_size=2,
+            n_frames=3,
+            min_digits=1,
+            max_digits=3,
+            image_size=(64, 64),
+            sizes=(16, 24),
+            oscillations=(1.0,),
+            oscillations_variances=(0.1,),
+            fps=10,
+            seed=5,
+            engine=dataset_engine,
+            batch_size=2,
+            atlas_dir=atlas_dir,
+            output_dir=str(tmp_path.joinpath(f"output_{name}")),
+        )
+
+    assert _read_dataset(tmp_path.joinpath(f"output_{engine}")) == _read_dataset(
+        tmp_path.joinpath("output_pil")
+    )
+
+
+def test_generate_dataset_arrays(tmp_path, mnist_dir):
+    """Verify if dataset saved as arrays matches the JPEG annotations."""
+    for output_format in ["jpeg", "npy"]:
+        generate_dataset(
+            data_dir=str(mnist_dir),
+            train_size=3,
+            test_size=2,
+            n_frames=2,
+            min_digits=1,
+            max_digits=3,
+            image_size=(64, 64),
+            sizes=(16,),
+            oscillations=(1.0,),
+            oscillations_variances=(0.1,),
+            fps=10,
+            seed=5,
+            workers=2,
+            output_format=output_format,
+            output_dir=str(tmp_path.joinpath(f"output_{output_format}")),
+        )
+
+    jpeg = tmp_path.joinpath("output_jpeg")
+    arrays = load_arrays(str(tmp_path.joinpath("output_npy/train")))
+    assert arrays["frames"].shape == (3, 2, 64, 64, 3)
+    offsets = arrays["frame_offsets"]
+    for idx in range(3):
+        annotations = json.loads(
+            jpeg.joinpath(f"train/{idx:06d}/annotations.json").read_text()
+        )
+        for frame_idx, annotation in enumerate(annotations):
+            start, end = offsets[2 * idx + frame_idx : 2 * idx + frame_idx + 2]
+            assert arrays["labels"][start:end].tolist() == annotation["labels"]
+            assert arrays["ids"][start:end].tolist() == annotation["ids"]
+            assert arrays["boxes"][start:end] == pytest.approx(
+                np.array(annotation["bboxes"])
+            )
+
+
+def test_generate_dataset_resume(tmp_path, mnist_dir):
+    """Verify if interrupted and extended dataset is identical to a fresh one."""
+    params = {
+        "data_dir": str(mnist_dir),
+        "test_size": 2,
+        "n_frames": 2,
+        "min_digits": 1,
+        "max_digits": 3,
+        "image_size": (64, 64),
+        "sizes": (16,),
+        "oscillations": (1.0,),
+        "oscillations_variances": (0.1,),
+        "fps": 10,
+        "seed": 5,
+    }
+    fresh = tmp_path.joinpath("fresh")
+    generate_dataset(train_size=6, output_dir=str(fresh), **params)
+
+    resumed = tmp_path.joinpath("resumed")
+    generate_dataset(train_size=3, output_dir=str(resumed), **params)
+    manifest = resumed.joinpath("train/manifest.jsonl")
+    lines = manifest.read_text().splitlines()
+    manifest.write_text("\n".join(lines[:2]) + "\n")
+    sequence = resumed.joinpath("train/000001/000000.jpg")
+    modified = sequence.stat().st_mtime_ns
+    generate_dataset(train_size=6, resume=True, output_dir=str(resumed), **params)
+
+    assert sequence.stat().st_mtime_ns == modified
+    assert _read_dataset(fresh) == _read_dataset(resumed)
+
+
+@pytest.mark.parametrize(
+    "streaming, train_size, test_size", [(False, 4, 3), (True, 3, 1)]
+)
+def test_prepare_dataset(tmp_path, mnist_dir, streaming, train_size, test_size):
+    """Verify if YOLO files saved during generation match prepared ones."""
+    path = tmp_path.joinpath("dataset")
+    generate_dataset(
+        data_dir=str(mnist_dir),
+        train_size=train_size,
+        test_size=test_size,
+        n_frames=2,
+        min_digits=1,
+        max_digits=3,
+        image_size=(64, 64),
+        sizes=(16,),
+        oscillations=(1.0,),
+        oscillations_variances=(0.1,),
+        fps=10,
+        seed=5,
+        streaming=streaming,
+        output_dir=str(path),
+    )
+    generated = _read_dataset(path)
+    for file in path.rglob("*.txt"):
+        file.unlink()
+
+    prepare_dataset(path, train_folder="train", test_folder="test", workers=2)
+
+    assert _read_dataset(path) == generated
+    last = f"{train_size - 1:06d}/000001"
+    assert f"train/{last}.txt" in generated
+    assert generated["train.txt"].decode().splitlines()[-1] == (
+        f"data/train/{last}.jpg"
+    )
+
+
+def test_generate_dataset_tar(tmp_path, mnist_dir):
+    """Verify if sequences and YOLO files saved with tar shards match JPEG ones."""
+    for output_format in ["jpeg", "tar"]:
+        generate_dataset(
+            data_dir=str(mnist_dir),
+            train_size=5,
+            test_size=2,
+            n_frames=2,
+            min_digits=1,
+            max_digits=3,
+            image_size=(64, 64),
+            sizes=(16,),
+            oscillations=(1.0,),
+            oscillations_variances=(0.1,),
+            fps=10,
+            seed=5,
+            workers=2,
+            output_format=output_format,
+            shard_size=8192,
+            output_dir=str(tmp_path.joinpath(f"output_{output_format}")),
+        )
+    jpeg = tmp_path.joinpath("output_jpeg/train")
+    tar = tmp_path.joinpath("output_tar/train")
+
+    index = load_tar_index(str(tar))
+    assert len({entry["shard"] for entry in index}) > 1
+    for idx, entry in enumerate(index):
+        sample = read_tar_sample(str(tar), entry)
+        for frame_idx in range(2):
+            assert (
+                sample[f"{idx:06d}.{frame_idx:06d}.jpg"]
+                == jpeg.joinpath(f"{idx:06d}/{frame_idx:06d}.jpg").read_bytes()
+            )
+            assert (
+                sample[f"{idx:06d}.{frame_idx:06d}.txt"]
+                == jpeg.joinpath(f"{idx:06d}/{frame_idx:06d}.txt").read_bytes()
+            )
+        assert (
+            sample[f"{idx:06d}.json"]
+            == jpeg.joinpath(f"{idx:06d}/annotations.json").read_bytes()
+        )
+
+    for file in ["obj.names", "obj.data"]:
+        assert (
+            tar.parent.joinpath(file).read_bytes()
+            == jpeg.parent.joinpath(file).read_bytes()
+        )
+    for subset, n_sequences in [("train", 5), ("test", 2)]:
+        assert tar.parent.joinpath(f"{subset}.txt").read_text().splitlines() == [
+            f"data/{subset}/{idx:06d}.{frame_idx:06d}.jpg"
+            for idx in range(n_sequences)
+            for frame_idx in range(2)
+        ]
+
+
+def test_generate_dataset_gray(tmp_path, mnist_dir):
+    """Verify if single channel frames and masks match frames rendered in RGB."""
+    datasets = {}
+    for output_format, color_mode, mask_format in [
+        ("npy", "rgb", None),
+        ("npy", "gray", "packed"),
+        ("jpeg", "gray", "float32"),
+        ("tar", "gray", "packed"),
+    ]:
+        output = tmp_path.joinpath(f"output_{output_format}_{color_mode}")
+        generate_dataset(
+            data_dir=str(mnist_dir),
+            train_size=3,
+            test_size=1,
+            n_frames=2,
+            min_digits=1,
+            max_digits=3,
+            image_size=(60, 40),
+            sizes=(16,),
+            oscillations=(1.0,),
+            oscillations_variances=(0.1,),
+            fps=10,
+            seed=5,
+            engine="numpy",
+            output_format=output_format,
+            color_mode=color_mode,
+            mask_format=mask_format,
+            output_dir=str(output),
+        )
+        datasets[output_format, color_mode] = output.joinpath("train")
+
+    rgb = load_arrays(str(datasets["npy", "rgb"]))
+    gray = load_arrays(str(datasets["npy", "gray"]))
+    assert "masks" not in rgb
+    assert gray["frames"].shape == (3, 2, 40, 60, 1)
+    assert (gray["frames"][..., 0] == rgb["frames"][..., 0]).all()
+    masks = decode_masks(gray["masks"], width=60)
+    assert gray["masks"].shape == (3, 2, 40, 8)
+    assert (masks == (rgb["frames"][..., 0] > 0)).all()
+
+    jpeg = datasets["jpeg", "gray"]
+    with Image.open(jpeg.joinpath("000002/000001.jpg")) as image:
+        assert image.mode == "L"
+    jpeg_masks = np.load(jpeg.joinpath("000002/masks.npy"))
+    assert jpeg_masks.dtype == np.float32
+    assert (jpeg_masks == masks[2]).all()
+
+    tar = datasets["tar", "gray"]
+    sample = read_tar_sample(str(tar), load_tar_index(str(tar))[1])
+    tar_masks = np.load(io.BytesIO(sample["000001.masks.npy"]))
+    assert (decode_masks(tar_masks, width=60) == masks[1]).all()
+
+
+def test_generate_dataset_instances(tmp_path, mnist_dir):
+    """Verify if instance maps and visible fractions are saved in all formats."""
+    datasets = {}
+    for output_format, engine in [
+        ("npy", "pil"),
+        ("npy", "numpy"),
+        ("npy", "dense"),
+        ("jpeg", "numpy"),
+        ("tar", "pil"),
+    ]:
+        output = tmp_path.joinpath(f"output_{output_format}_{engine}")
+        generate_dataset(
+            data_dir=str(mnist_dir),
+            train_size=3,
+            test_size=1,
+            n_frames=2,
+            min_digits=2,
+            max_digits=4,
+            image_size=(40, 30),
+            sizes=(20,),
+            oscillations=(1.0,),
+            oscillations_variances=(0.1,),
+            fps=10,
+            seed=6,
+            engine=engine,
+            output_format=output_format,
+            instances=True,
+            output_dir=str(output),
+        )
+        datasets[output_format, engine] = output.joinpath("train")
+
+    pil = load_arrays(str(datasets["npy", "pil"]))
+    numpy = load_arrays(str(datasets["npy", "numpy"]))
+    assert pil["id_maps"].shape == (3, 2, 30, 40)
+    assert ((pil["id_maps"] > 0) == (pil["frames"][..., 0] > 0)).all()
+    assert (pil["id_maps"] == numpy["id_maps"]).all()
+    dense = load_arrays(str(datasets["npy", "dense"]))
+    assert (pil["id_maps"] == dense["id_maps"]).all()
+    assert (pil["visible"] == dense["visible"]).all()
+    assert pil["visible"].shape == pil["labels"].shape
+    assert pil["visible"] == pytest.approx(numpy["visible"])
+
+    sequence = datasets["jpeg", "numpy"].joinpath("000001")
+    assert (np.load(sequence.joinpath("instances.npy")) == pil["id_maps"][1]).all()
+    annotations = json.loads(sequence.joinpath("annotations.json").read_text())
+    start, end = pil["frame_offsets"][2:4]
+    assert annotations[0]["visible"] == pytest.approx(pil["visible"][start:end])
+    reader = DatasetReader(str(datasets["jpeg", "numpy"]))
+    assert reader.annotations(1, 0)["visible"] == pytest.approx(
+        annotations[0]["visible"]
+    )
+
+    shard_path = datasets["tar", "pil"]
+    sample = read_tar_sample(str(shard_path), load_tar_index(str(shard_path))[2])
+    id_maps = np.load(io.BytesIO(sample["000002.instances.npy"]))
+    assert (id_maps == pil["id_maps"][2]).all()
+
+
+@pytest.mark.parametrize("engine", ["pil", "dense"])
+def test_generate_dataset_streaming(tmp_path, mnist_dir, engine):
+    """Verify if streamed dataset holds the same frames and annotations."""
+    for name, dataset_engine, streaming in [
+        ("saved", "pil", False),
+        ("streamed", engine, True),
+    ]:
+        generate_dataset(
+            data_dir=str(mnist_dir),
+            train_size=3,
+            test_size=1,
+            n_frames=5,
+            min_digits=1,
+            max_digits=3,
+            image_size=(48, 48),
+            sizes=(16,),
+            oscillations=(1.0,),
+            oscillations_variances=(0.1,),
+            fps=10,
+            seed=8,
+            writer_threads=2,
+            engine=dataset_engine,
+            streaming=streaming,
+            output_dir=str(tmp_path.joinpath(name)),
+        )
+    saved = DatasetReader(str(tmp_path.joinpath("saved/train")))
+    streamed = DatasetReader(str(tmp_path.joinpath("streamed/train")))
+
+    assert streamed.directory.joinpath("000002/annotations.jsonl").exists()
+    for idx in range(3):
+        expected, sample = saved[idx], streamed[idx]
+        for key, array in expected.items():
+            assert (sample[key] == array).all()
+
+
+def test_generate_dataset_streaming_numpy(tmp_path, mnist_dir):
+    """Verify if streaming is rejected for the batched numpy engine."""
+    with pytest.raises(ValueError):
+        generate_dataset(
+            data_dir=str(mnist_dir),
+            train_size=3,
+            test_size=1,
+            n_frames=5,
+            min_digits=1,
+            max_digits=3,
+            image_size=(48, 48),
+            sizes=(16,),
+            oscillations=(1.0,),
+            oscillations_variances=(0.1,),
+            fps=10,
+            seed=8,
+            engine="numpy",
+            streaming=True,
+            output_dir=str(tmp_path.joinpath("dataset")),
+        )
@@ -0,0 +1,55 @@
+"""Test manifest of saved sequences."""
+import numpy as np
+import pytest
+
+from moving_multiscalemnist.manifest import Manifest, file_checksums
+
+
+def test_manifest_records(tmp_path):
+    """Verify if appended records are loaded by sequence index."""
+    manifest = Manifest(str(tmp_path), params={"n_frames": 10})
+    manifest.reset()
+    manifest.append(3, np.random.SeedSequence(1, spawn_key=(0, 2, 3)), {"a": "b"})
+    manifest.append(1, np.random.SeedSequence(1, spawn_key=(0, 2, 1)), {})
+
+    records = Manifest(str(tmp_path), params={"n_frames": 10}).load()
+
+    assert sorted(records) == [1, 3]
+    assert records[3]["seed"] == {"entropy": 1, "spawn_key": [0, 2, 3]}
+    assert records[3]["files"] == {"a": "b"}
+
+
+def test_manifest_incomplete_line(tmp_path):
+    """Verify if interrupted append is ignored."""
+    manifest = Manifest(str(tmp_path), params={})
+    manifest.reset()
+    manifest.append(0, np.random.SeedSequence(1), {})
+    with manifest.path.open("a") as fp:
+        fp.write('{"index": 1, "se')
+
+    assert list(manifest.load()) == [0]
+    manifest.append(2, np.random.SeedSequence(1), {})
+    assert list(manifest.load()) == [0, 2]
+
+
+def test_manifest_params_mismatch(tmp_path):
+    """Verify if records of different parameters are rejected."""
+    manifest = Manifest(str(tmp_path), params={"n_frames": 10})
+    manifest.reset()
+    manifest.append(0, np.random.SeedSequence(1), {})
+
+    with pytest.raises(ValueError):
+        Manifest(str(tmp_path), params={"n_frames": 20}).load()
+
+
+def test_file_checksums(tmp_path):
+    """Verify if checksums are keyed by path relative to directory."""
+    tmp_path.joinpath("seq").mkdir()
+    file = tmp_path.joinpath("seq", "frame.jpg")
+    file.write_bytes(b"")
+
+    assert file_checksums(tmp_path, [file]) == {
+        "seq/frame.jpg": (
+            "e3b0c44298fc1c149afbf4c8996fb92427ae41e4649b934ca495991b7852b855"
+        )
+    }
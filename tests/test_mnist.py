@@ -0,0 +1,74 @@
+import gzip
+import io
+
+import numpy as np
+import pytest
+
+from moving_multiscalemnist import mnist
+from moving_multiscalemnist.mnist import fetch_mnist, load_idx, read_idx_header
+
+
+def test_read_idx_header():
+    """Verify if IDX header is parsed."""
+    fp = io.BytesIO(b"\x00\x00\x08\x03\x00\x00\x00\x02\x00\x00\x00\x1c\x00\x00\x00\x1c")
+    dtype, shape, offset = read_idx_header(fp)
+    assert dtype == np.uint8
+    assert shape == (2, 28, 28)
+    assert offset == 16
+
+
+@pytest.mark.parametrize(
+    "header", [b"\x01\x00\x08\x01\x00\x00\x00\x01", b"\x00\x00\x07\x01", b"\x00\x00"]
+)
+def test_read_idx_header_invalid(header):
+    """Verify if invalid IDX header raises an error."""
+    with pytest.raises(ValueError):
+        read_idx_header(io.BytesIO(header))
+
+
+def test_fetch_mnist(mnist_dir, mnist_subset):
+    """Verify if MNIST files are memory-mapped."""
+    images, labels = mnist_subset
+    mnist = fetch_mnist(str(mnist_dir))
+    for subset in ["train", "test"]:
+        assert isinstance(mnist[subset][0], np.memmap)
+        assert np.array_equal(mnist[subset][0], images)
+        assert np.array_equal(mnist[subset][1], labels)
+
+
+def test_fetch_mnist_gzipped(mnist_dir, mnist_subset):
+    """Verify if gzipped files with original MNIST names are decompressed once."""
+    images, labels = mnist_subset
+    for file in list(mnist_dir.iterdir()):
+        suffix = "-idx3-ubyte.gz" if "images" in file.name else "-idx1-ubyte.gz"
+        with gzip.open(mnist_dir.joinpath(file.name + suffix), "wb") as fp:
+            fp.write(file.read_bytes())
+        file.unlink()
+    mnist = fetch_mnist(str(mnist_dir))
+    assert np.array_equal(mnist["train"][0], images)
+    assert np.array_equal(mnist["test"][1], labels)
+    assert mnist_dir.joinpath("train-images-idx3-ubyte").exists()
+
+
+def test_load_idx_truncated(mnist_dir):
+    """Verify if file with unexpected size raises an error."""
+    path = mnist_dir.joinpath("train-images")
+    path.write_bytes(path.read_bytes()[:-1])
+    with pytest.raises(ValueError):
+        load_idx(path)
+
+
+def test_load_idx_gzipped_in_memory(mnist_dir, mnist_subset, monkeypatch):
+    """Verify if gzipped file is read into memory if it cannot be cached."""
+    images, _ = mnist_subset
+    path = mnist_dir.joinpath("train-images.gz")
+    with gzip.open(path, "wb") as fp:
+        fp.write(mnist_dir.joinpath("train-images").read_bytes())
+
+    def decompress(path):
+        raise PermissionError(path)
+
+    monkeypatch.setattr(mnist, "decompress", decompress)
+    loaded = load_idx(path)
+    assert not isinstance(loaded, np.memmap)
+    assert np.array_equal(loaded, images)
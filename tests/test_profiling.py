@@ -0,0 +1,62 @@
+"""Test profiling of generation stages."""
+import json
+import pstats
+
+from moving_multiscalemnist import profiling
+from moving_multiscalemnist.generate import generate_dataset
+
+
+def test_stage_disabled():
+    """Verify if stages are not recorded unless profiling is enabled."""
+    profiling.configure(False)
+    with profiling.stage("test"):
+        pass
+    assert "test" not in profiling.collect()
+
+
+def test_stage_merged():
+    """Verify if stages collected in processes are summed in totals."""
+    profiling.configure(True)
+    profiling.totals()
+    for _ in range(3):
+        with profiling.stage("test"):
+            pass
+    profiling.merge({"test": (1.0, 2)})
+    stats = profiling.totals()
+    profiling.configure(False)
+
+    seconds, calls = stats["test"]
+    assert calls == 5
+    assert seconds >= 1.0
+    assert "test" in profiling.summary(stats)
+    assert profiling.totals() == {}
+
+
+def test_generate_dataset_profile(tmp_path, mnist_dir):
+    """Verify if stages of all workers are summarized and hot loop is profiled."""
+    generate_dataset(
+        data_dir=str(mnist_dir),
+        train_size=4,
+        test_size=2,
+        n_frames=2,
+        min_digits=1,
+        max_digits=3,
+        image_size=(64, 64),
+        sizes=(16,),
+        oscillations=(1.0,),
+        oscillations_variances=(0.1,),
+        fps=10,
+        seed=5,
+        workers=2,
+        profile=True,
+        profile_output=str(tmp_path.joinpath("generate.prof")),
+        output_dir=str(tmp_path.joinpath("dataset")),
+    )
+
+    summary = json.loads(tmp_path.joinpath("dataset/profile.json").read_text())
+    assert summary["stages"]["encode"]["calls"] == 6 * 2
+    assert summary["stages"]["annotations"]["calls"] == 6
+    assert summary["stages"]["paste"]["calls"] >= 6 * 2
+    stats = pstats.Stats(str(tmp_path.joinpath("generate.prof")))
+    assert any(name == "save_sequence" for _, _, name in stats.stats)
+    assert list(tmp_path.glob("generate.prof.*")) == []
@@ -0,0 +1,116 @@
+"""Test random access reader of generated subsets."""
+import json
+import pickle
+
+import numpy as np
+import pytest
+from PIL import Image
+
+from moving_multiscalemnist.generate import generate_dataset
+from moving_multiscalemnist.reader import READER_INDEX_FILE, DatasetReader
+from moving_multiscalemnist.writers import load_arrays
+
+
+@pytest.fixture
+def datasets(tmp_path, mnist_dir):
+    """Generate small dataset saved in all output formats."""
+    paths = {}
+    for output_format in ["jpeg", "apng", "tar", "npy"]:
+        output = tmp_path.joinpath(output_format)
+        generate_dataset(
+            data_dir=str(mnist_dir),
+            train_size=4,
+            test_size=1,
+            n_frames=3,
+            min_digits=1,
+            max_digits=3,
+            image_size=(64, 64),
+            sizes=(16,),
+            oscillations=(1.0,),
+            oscillations_variances=(0.1,),
+            fps=10,
+            seed=5,
+            output_format=output_format,
+            shard_size=16384,
+            output_dir=str(output),
+        )
+        paths[output_format] = output.joinpath("train")
+    return paths
+
+
+@pytest.mark.parametrize("output_format", ["jpeg", "apng", "tar"])
+def test_reader(datasets, output_format):
+    """Verify if reader returns decoded frames and annotations of sequences."""
+    reader = DatasetReader(str(datasets[output_format]))
+    jpeg = datasets["jpeg"]
+    lossless = load_arrays(str(datasets["npy"]))["frames"]
+
+    assert len(reader) == 4
+    for idx in [3, 0, 2]:
+        annotations = json.loads(
+            jpeg.joinpath(f"{idx:06d}/annotations.json").read_text()
+        )
+        assert reader.n_frames(idx) == 3
+        for frame_idx, annotation in enumerate(annotations):
+            expected = (
+                lossless[idx, frame_idx]
+                if output_format == "apng"
+                else np.asarray(
+                    Image.open(jpeg.joinpath(f"{idx:06d}/{frame_idx:06d}.jpg"))
+                )
+            )
+            assert (reader.frame(idx, frame_idx) == expected).all()
+            frame_annotations = reader.annotations(idx, frame_idx)
+            assert frame_annotations["labels"].tolist() == annotation["labels"]
+            assert frame_annotations["boxes"] == pytest.approx(
+                np.array(annotation["bboxes"])
+            )
+    item = reader[1]
+    assert item["frames"].shape == (3, 64, 64, 3)
+    assert item["boxes"].shape == (3, len(item["labels"]), 4)
+    with pytest.raises(IndexError):
+        reader.frame(4, 0)
+    reader.close()
+
+
+def test_reader_index_reused(datasets):
+    """Verify if index is saved once and reused."""
+    DatasetReader(str(datasets["jpeg"]))
+    index = datasets["jpeg"].joinpath(READER_INDEX_FILE)
+    modified = index.stat().st_mtime_ns
+
+    reader = DatasetReader(str(datasets["jpeg"]))
+
+    assert index.stat().st_mtime_ns == modified
+    assert len(reader) == 4
+
+
+def test_reader_cache_and_prefetch(datasets):
+    """Verify if decoded frames are cached, evicted and prefetched."""
+    reader = DatasetReader(str(datasets["tar"]), cache_size=2, prefetch=2)
+
+    first = reader.frame(0, 0)
+    reader._executor.shutdown()  # wait for prefetched frames
+    assert set(reader._cache) == {(0, 1), (0, 2)}
+    assert reader.frame(0, 1) is reader._cache[0, 1]
+
+    copied = pickle.loads(pickle.dumps(reader))
+    assert (copied.frame(0, 0) == first).all()
+    copied.close()
+
+
+@pytest.mark.parametrize("output_format", ["jpeg", "apng"])
+def test_reader_gray(datasets, output_format):
+    """Verify if reader decodes frames with a single channel."""
+    reader = DatasetReader(str(datasets[output_format]), color_mode="gray")
+    lossless = load_arrays(str(datasets["npy"]))["frames"]
+
+    frames = reader[2]["frames"]
+    assert frames.shape == (3, 64, 64, 1)
+    if output_format == "apng":
+        assert (frames == lossless[2, ..., :1]).all()
+    else:
+        with Image.open(datasets["jpeg"].joinpath("000002/000001.jpg")) as image:
+            assert (frames[1, ..., 0] == np.asarray(image.convert("L"))).all()
+    with pytest.raises(ValueError):
+        DatasetReader(str(datasets[output_format]), color_mode="cmyk")
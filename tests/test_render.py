@@ -0,0 +1,102 @@
+"""Test vectorized batch renderer."""
+import numpy as np
+import pytest
+
+from moving_multiscalemnist.digit import Digit
+from moving_multiscalemnist.render import iter_rendered_sequences, render_batch
+from moving_multiscalemnist.sequence import get_bbox_coords, prepare_sequence
+from moving_multiscalemnist.trajectory import get_bbox_coords_batch
+
+
+def _digits(mnist_subset, seed):
+    images, labels = mnist_subset
+    random_state = np.random.RandomState(seed)
+    return [
+        [
+            Digit(
+                images[idx],
+                label=labels[idx].item(),
+                image_size=(64, 48),
+                sizes=(16, 32),
+                oscillations=(0.5, 1.0),
+                oscillations_variances=(0.0, 0.3),
+                random_state=random_state,
+            )
+            for idx in range(n_digits)
+        ]
+        for n_digits in [1, 4, 3]
+    ]
+
+
+def test_render_batch_matches_prepare_sequence(mnist_subset):
+    """Verify if batch renderer reproduces frames and boxes of PIL renderer."""
+    rendered = render_batch(
+        _digits(mnist_subset, seed=1), n_frames=25, image_size=(64, 48)
+    )
+    expected = [
+        list(prepare_sequence(digits, n_frames=25, image_size=(64, 48)))
+        for digits in _digits(mnist_subset, seed=1)
+    ]
+
+    assert rendered.frames.shape == (3, 25, 48, 64)
+    assert rendered.frames.dtype == np.uint8
+    assert rendered.n_digits.tolist() == [1, 4, 3]
+    for seq_idx, sequence in enumerate(expected):
+        for frame_idx, (frame, bboxes, labels, ids) in enumerate(sequence):
+            assert (
+                rendered.frames[seq_idx, frame_idx] == np.array(frame)[..., 0]
+            ).all()
+            n_digits = len(bboxes)
+            assert rendered.bboxes[seq_idx, frame_idx, :n_digits] == pytest.approx(
+                np.array(bboxes)
+            )
+            assert rendered.labels[seq_idx, :n_digits].tolist() == labels
+
+
+def test_iter_rendered_sequences(mnist_subset):
+    """Verify if rendered batch is converted to sequences of frames."""
+    rendered = render_batch(
+        _digits(mnist_subset, seed=2), n_frames=2, image_size=(64, 48)
+    )
+    sequences = [list(sequence) for sequence in iter_rendered_sequences(rendered)]
+
+    assert len(sequences) == 3
+    frame, bboxes, labels, ids = sequences[1][0]
+    assert frame.mode == "RGB"
+    assert frame.size == (64, 48)
+    assert len(bboxes) == len(labels) == len(ids) == 4
+
+
+def test_get_bbox_coords_batch():
+    """Verify if vectorized bbox coordinates match scalar ones."""
+    bboxes = np.array([[10, 12, 18, 20], [0, 0, 30, 30], [23, 17, 29, 31]])
+    x1 = np.array([13, -5, 90])
+    y1 = np.array([15, 80, 5])
+
+    coords = get_bbox_coords_batch(bboxes, x1, y1, (100, 100))
+
+    for bbox, x, y, result in zip(bboxes, x1, y1, coords):
+        assert tuple(result) == pytest.approx(get_bbox_coords(bbox, x, y, (100, 100)))
+
+
+def test_render_batch_instances(mnist_subset):
+    """Verify if batch renderer reproduces instance maps of PIL renderer."""
+    rendered = render_batch(
+        _digits(mnist_subset, seed=3), n_frames=10, image_size=(64, 48), instances=True
+    )
+    expected = [
+        list(prepare_sequence(digits, n_frames=10, image_size=(64, 48), instances=True))
+        for digits in _digits(mnist_subset, seed=3)
+    ]
+
+    assert rendered.id_maps is not None and rendered.visible is not None
+    assert ((rendered.id_maps > 0) == (rendered.frames > 0)).all()
+    assert rendered.visible.max() <= 1.0
+    for seq_idx, sequence in enumerate(expected):
+        for frame_idx, (*_, instances) in enumerate(sequence):
+            assert (rendered.id_maps[seq_idx, frame_idx] == instances.id_map).all()
+            n_digits = len(instances.visible)
+            assert rendered.visible[seq_idx, frame_idx, :n_digits] == pytest.approx(
+                instances.visible
+            )
+    assert (rendered.visible[1] < 1.0).any()
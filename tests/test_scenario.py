@@ -0,0 +1,146 @@
+"""Test scenario tables of digit parameters."""
+import numpy as np
+import pytest
+
+from moving_multiscalemnist.generate import (
+    generate_dataset,
+    get_subset_seed_sequence,
+    plan_scenario,
+    prepare_subset,
+    prepare_subset_digits,
+)
+from moving_multiscalemnist.mnist import fetch_mnist
+from moving_multiscalemnist.render import render_batch
+from moving_multiscalemnist.scenario import load_scenario, save_scenario
+from moving_multiscalemnist.writers import load_arrays
+
+SCENARIO_PARAMS = {
+    "image_size": (64, 48),
+    "sizes": (16, 32),
+    "oscillations": (0.5, 1.0),
+    "oscillations_variances": (0.0, 0.3),
+}
+
+
+def _plan(mnist_subset, n_sequences):
+    seed_sequence = get_subset_seed_sequence(3, "train")
+    order, slices = prepare_subset(
+        mnist_subset,
+        n_sequences=n_sequences,
+        min_digits=1,
+        max_digits=4,
+        seed_sequence=seed_sequence,
+    )
+    scenario = plan_scenario(
+        mnist_subset[1],
+        order=order,
+        slices=slices,
+        seed_sequence=seed_sequence,
+        max_digits=4,
+        **SCENARIO_PARAMS,
+    )
+    return scenario, order, slices
+
+
+def test_plan_scenario(mnist_subset):
+    """Verify if scenario is drawn from subset and does not depend on its length."""
+    scenario, order, slices = _plan(mnist_subset, n_sequences=1500)
+    longer, *_ = _plan(mnist_subset, n_sequences=2100)
+
+    assert len(scenario) == 1500
+    assert (np.diff(scenario.digit_offsets) == slices[:, 1] - slices[:, 0]).all()
+    start, end = slices[1100]
+    digits = scenario.sequence_digits(1100)
+    assert [source for source, *_ in digits] == order[start:end].tolist()
+    assert [label for _, label, _ in digits] == mnist_subset[1][
+        order[start:end]
+    ].tolist()
+    assert set(scenario.size.tolist()) == {16, 32}
+    margin = scenario.size / (4 * 64)
+    assert ((margin <= scenario.x) & (scenario.x <= 1 - margin)).all()
+    for column, longer_column in zip(scenario, longer.sequences(0, 1500)):
+        assert (column == longer_column).all()
+
+
+def test_save_scenario(tmp_path, mnist_subset):
+    """Verify if scenario is loaded as saved."""
+    scenario, *_ = _plan(mnist_subset, n_sequences=10)
+    save_scenario(tmp_path.joinpath("scenario.npz"), scenario)
+    loaded = load_scenario(tmp_path.joinpath("scenario.npz"))
+
+    for column, loaded_column in zip(scenario, loaded):
+        assert column.dtype == loaded_column.dtype
+        assert (column == loaded_column).all()
+
+
+def test_prepare_subset_digits_scenario(mnist_subset):
+    """Verify if digits are created with parameters of scenario."""
+    scenario, order, slices = _plan(mnist_subset, n_sequences=5)
+    digits = prepare_subset_digits(
+        *mnist_subset,
+        idx=3,
+        slices=slices,
+        order=order,
+        seed_sequence=get_subset_seed_sequence(3, "train"),
+        fps=10,
+        scenario=scenario,
+        **SCENARIO_PARAMS,
+    )
+
+    start, end = scenario.digit_offsets[3:5]
+    assert len(digits) == end - start
+    assert [digit._size for digit in digits] == scenario.size[start:end].tolist()
+    assert [digit._vel_y for digit in digits] == pytest.approx(
+        scenario.vel_y[start:end]
+    )
+
+
+def test_generate_dataset_scenario(tmp_path, mnist_dir):
+    """Verify if sequences are rendered from the saved scenario by both engines."""
+    datasets = []
+    for engine in ["pil", "numpy"]:
+        output = tmp_path.joinpath(f"output_{engine}")
+        generate_dataset(
+            data_dir=str(mnist_dir),
+            train_size=3,
+            test_size=1,
+            n_frames=4,
+            min_digits=1,
+            max_digits=3,
+            image_size=(48, 48),
+            sizes=(16,),
+            oscillations=(1.0,),
+            oscillations_variances=(0.2,),
+            fps=10,
+            seed=9,
+            engine=engine,
+            output_format="npy",
+            scenario=True,
+            output_dir=str(output),
+        )
+        datasets.append(output.joinpath("train"))
+
+    pil, numpy = (load_arrays(str(dataset)) for dataset in datasets)
+    assert (pil["frames"] == numpy["frames"]).all()
+    scenario = load_scenario(datasets[0].joinpath("scenario.npz"))
+    assert len(scenario) == 3
+    rendered = render_batch(
+        [
+            prepare_subset_digits(
+                *fetch_mnist(str(mnist_dir))["train"],
+                idx=idx,
+                slices=np.zeros((3, 2), dtype=int),
+                seed_sequence=get_subset_seed_sequence(9, "train"),
+                image_size=(48, 48),
+                sizes=(16,),
+                oscillations=(1.0,),
+                oscillations_variances=(0.2,),
+                fps=10,
+                scenario=scenario,
+            )
+            for idx in range(3)
+        ],
+        n_frames=4,
+        image_size=(48, 48),
+    )
+    assert (rendered.frames == pil["frames"][..., 0]).all()
@@ -1,7 +1,26 @@
 """Test creating sequence of digits."""
+import copy
+import json
+
+import numpy as np
 import pytest
+from PIL import Image
 
-from moving_multiscalemnist.sequence import get_bbox_coords, prepare_sequence
+from moving_multiscalemnist.digit import Digit
+from moving_multiscalemnist.sequence import (
+    decode_masks,
+    encode_masks,
+    frame_mask,
+    get_bbox_coords,
+    load_annotations,
+    load_apng,
+    paste_instance,
+    prepare_sequence,
+    save_apng,
+    save_sequence,
+    stream_sequence,
+    visible_fractions,
+)
 
 
 @pytest.mark.parametrize(
@@ -37,3 +56,114 @@ def test_prepare_sequence(sample_digit):
 
     assert labels_0[0] == labels_1[0] == sample_digit.label
     assert ids_0[0] == ids_1[0]
+
+
+@pytest.mark.parametrize(
+    "values, fps",
+    [
+        ([0, 0, 0, 50, 50, 100], 10),
+        ([0] * 37 + [50] + [100] * 41, 7),
+        ([0] * 5, 3),
+    ],
+)
+def test_apng_repeated_frames(tmp_path, values, fps):
+    """Verify if identical consecutive frames are restored from animated PNG."""
+    frames = [Image.new("RGB", (8, 8), (c, c, c)) for c in values]
+    path = tmp_path / "frames.png"
+    save_apng(frames, path, fps=fps)
+    loaded = load_apng(path, len(frames))
+    assert len(loaded) == len(frames)
+    for frame, expected in zip(loaded, frames):
+        np.testing.assert_array_equal(frame, np.asarray(expected))
+    with pytest.raises(ValueError):
+        load_apng(path, len(frames) + 1)
+
+
+@pytest.mark.parametrize("mask_format", ["float32", "packed"])
+def test_encode_masks(mask_format):
+    """Verify if encoded masks are decoded to the same boolean masks."""
+    masks = np.random.RandomState(0).rand(3, 5, 13) > 0.5
+    encoded = encode_masks(masks, mask_format)
+
+    assert encoded.shape[-1] == (13 if mask_format == "float32" else 2)
+    assert (decode_masks(encoded, width=13) == masks).all()
+
+
+def test_prepare_sequence_gray(mnist_subset):
+    """Verify if gray frames hold the single channel of RGB frames."""
+    images, labels = mnist_subset
+    digits = [
+        Digit(images[idx], label=labels[idx].item(), image_size=(64, 64), sizes=(24,))
+        for idx in range(3)
+    ]
+    rgb = list(prepare_sequence(copy.deepcopy(digits), n_frames=2, image_size=(64, 64)))
+    gray = list(
+        prepare_sequence(digits, n_frames=2, image_size=(64, 64), color_mode="gray")
+    )
+
+    assert frame_mask(rgb[0][0]).any()
+    for (rgb_frame, *rgb_annotation), (gray_frame, *gray_annotation) in zip(rgb, gray):
+        assert gray_frame.mode == "L"
+        assert (np.asarray(gray_frame) == np.asarray(rgb_frame)[..., 0]).all()
+        assert (frame_mask(gray_frame) == frame_mask(rgb_frame)).all()
+        assert gray_annotation == rgb_annotation
+
+
+def test_visible_fractions():
+    """Verify if visible fractions account for occluded and cut off pixels."""
+    id_map = np.zeros((4, 6), dtype=np.uint8)
+    mask = np.ones((3, 3), dtype=bool)
+    paste_instance(id_map, mask, x1=0, y1=0, instance=1)
+    paste_instance(id_map, mask, x1=2, y1=2, instance=2)
+    paste_instance(id_map, mask, x1=5, y1=-1, instance=3)
+
+    assert id_map.tolist() == [
+        [1, 1, 1, 0, 0, 3],
+        [1, 1, 1, 0, 0, 3],
+        [1, 1, 2, 2, 2, 0],
+        [0, 0, 2, 2, 2, 0],
+    ]
+    assert visible_fractions(id_map, [9, 9, 9, 0]) == pytest.approx(
+        [8 / 9, 6 / 9, 2 / 9, 0.0]
+    )
+
+
+def test_stream_sequence(tmp_path, mnist_subset):
+    """Verify if streamed sequence matches saved one and stays readable if cut."""
+    images, labels = mnist_subset
+    digits = [
+        Digit(images[idx], label=labels[idx].item(), image_size=(48, 48), sizes=(20,))
+        for idx in range(3)
+    ]
+    frames = list(
+        prepare_sequence(digits, n_frames=4, image_size=(48, 48), instances=True)
+    )
+    save_sequence(frames, str(tmp_path.joinpath("saved")), idx=0, mask_format="packed")
+    stream_sequence(
+        iter(frames),
+        str(tmp_path.joinpath("streamed")),
+        idx=0,
+        n_frames=4,
+        mask_format="packed",
+    )
+
+    saved = tmp_path.joinpath("saved/000000")
+    streamed = tmp_path.joinpath("streamed/000000")
+    assert load_annotations(streamed) == json.loads(json.dumps(load_annotations(saved)))
+    for name in ["000003.jpg", "masks.npy", "instances.npy"]:
+        assert streamed.joinpath(name).read_bytes() == saved.joinpath(name).read_bytes()
+
+    def interrupted():
+        yield from frames[:2]
+        raise KeyboardInterrupt
+
+    with pytest.raises(KeyboardInterrupt):
+        stream_sequence(interrupted(), str(tmp_path), idx=1, n_frames=4)
+    path = tmp_path.joinpath("000001")
+    with path.joinpath("annotations.jsonl").open("a") as fp:
+        fp.write('{"bboxes": [')
+    assert len(load_annotations(path)) == 2
+    assert sorted(file.name for file in path.glob("*.jpg")) == [
+        "000000.jpg",
+        "000001.jpg",
+    ]
@@ -0,0 +1,122 @@
+"""Test split of dataset generation across nodes."""
+import json
+
+import numpy as np
+import pytest
+
+from moving_multiscalemnist.generate import generate_dataset
+from moving_multiscalemnist.sharding import SHARD_INFO_FILE, merge_shards, shard_range
+from moving_multiscalemnist.trajectory import TRAJECTORIES_FILE, load_trajectories
+
+PARAMS = {
+    "train_size": 7,
+    "test_size": 2,
+    "n_frames": 3,
+    "min_digits": 1,
+    "max_digits": 3,
+    "image_size": (48, 32),
+    "sizes": (16,),
+    "oscillations": (1.0,),
+    "oscillations_variances": (0.1,),
+    "fps": 10,
+    "seed": 11,
+}
+
+
+def _read_dataset(path):
+    return {
+        str(file.relative_to(path)): file.read_bytes()
+        for file in sorted(path.rglob("*"))
+        if file.is_file() and file.name != TRAJECTORIES_FILE
+    }
+
+
+def _read_trajectories(path):
+    trajectories, bboxes = load_trajectories(path.joinpath("train", TRAJECTORIES_FILE))
+    return {**trajectories._asdict(), "bboxes": bboxes}
+
+
+def test_shard_range():
+    """Verify if shards cover all sequences in disjoint ranges of similar sizes."""
+    ranges = [shard_range(10, 3, idx) for idx in range(3)]
+
+    assert ranges == [range(0, 3), range(3, 6), range(6, 10)]
+    assert list(shard_range(2, 3, 0)) == []
+    with pytest.raises(ValueError):
+        shard_range(10, 3, 3)
+    with pytest.raises(ValueError):
+        shard_range(10, 0, 0)
+
+
+@pytest.mark.parametrize("output_format", ["jpeg", "apng"])
+def test_merge_shards(tmp_path, mnist_dir, output_format):
+    """Verify if merged shards are identical to dataset generated by single node."""
+    single = tmp_path.joinpath("single")
+    generate_dataset(
+        data_dir=str(mnist_dir),
+        output_format=output_format,
+        scenario=True,
+        trajectories=True,
+        output_dir=str(single),
+        **PARAMS,
+    )
+    shard_dirs = []
+    for shard_index in reversed(range(3)):
+        output = tmp_path.joinpath(f"shard_{shard_index}")
+        generate_dataset(
+            data_dir=str(mnist_dir),
+            output_format=output_format,
+            scenario=True,
+            trajectories=True,
+            num_shards=3,
+            shard_index=shard_index,
+            output_dir=str(output),
+            **PARAMS,
+        )
+        shard_dirs.append(str(output))
+
+    info = json.loads(tmp_path.joinpath("shard_1", SHARD_INFO_FILE).read_text())
+    assert info["subsets"]["train"]["start"] == 2
+    assert info["subsets"]["train"]["stop"] == 4
+    assert sorted(
+        path.name for path in tmp_path.joinpath("shard_1/train").iterdir()
+    ) == ["000002", "000003", "manifest.jsonl", "scenario.npz", TRAJECTORIES_FILE]
+    merge_shards(shard_dirs, str(tmp_path.joinpath("merged")))
+    assert _read_dataset(tmp_path.joinpath("merged")) == _read_dataset(single)
+    merged = _read_trajectories(tmp_path.joinpath("merged"))
+    expected = _read_trajectories(single)
+    assert merged.keys() == expected.keys()
+    for name, values in expected.items():
+        assert np.array_equal(merged[name], values)
+
+
+def test_merge_shards_incomplete(tmp_path, mnist_dir):
+    """Verify if shards are not merged with a shard missing or incomplete."""
+    shard_dirs = []
+    for shard_index in range(2):
+        output = tmp_path.joinpath(f"shard_{shard_index}")
+        generate_dataset(
+            data_dir=str(mnist_dir),
+            num_shards=2,
+            shard_index=shard_index,
+            output_dir=str(output),
+            **PARAMS,
+        )
+        shard_dirs.append(str(output))
+
+    with pytest.raises(ValueError):
+        merge_shards(shard_dirs[:1], str(tmp_path.joinpath("merged")))
+    manifest = tmp_path.joinpath("shard_1/test/manifest.jsonl")
+    manifest.write_text(manifest.read_text().splitlines()[0][:-5])
+    with pytest.raises(ValueError):
+        merge_shards(shard_dirs, str(tmp_path.joinpath("merged")))
+    assert tmp_path.joinpath("shard_0/train/000000").is_dir()
+    assert not tmp_path.joinpath("merged").exists()
+    with pytest.raises(ValueError):
+        generate_dataset(
+            data_dir=str(mnist_dir),
+            output_format="npy",
+            num_shards=2,
+            output_dir=str(tmp_path.joinpath("npy")),
+            **PARAMS,
+        )
@@ -0,0 +1,57 @@
+"""Test digit sprite cache."""
+import numpy as np
+
+from moving_multiscalemnist.digit import Digit
+from moving_multiscalemnist.sprite import Sprite, tight_bboxes
+
+
+def test_sprite_cached_by_size():
+    """Verify if resized images, masks and bboxes are reused for the same size."""
+    image = np.zeros((28, 28), dtype=np.uint8)
+    image[10:20, 8:23] = 255
+    sprite = Sprite(image)
+
+    assert sprite.image(16) is sprite.image(16)
+    assert sprite.mask(16) is sprite.mask(16)
+    assert sprite.image(16) is not sprite.image(32)
+    assert sprite.image(32).size == (32, 32)
+    assert sprite.bbox(28) == (8, 10, 22, 19)
+
+
+def test_sprite_mask():
+    """Verify if mask covers only bright digit pixels."""
+    image = np.zeros((28, 28), dtype=np.uint8)
+    image[5:10, 5:10] = 50
+    image[15:20, 15:20] = 200
+    mask = np.array(Sprite(image).mask(28))
+
+    assert set(np.unique(mask)) == {0, 255}
+    assert not mask[5:10, 5:10].any()
+    assert mask[15:20, 15:20].all()
+
+
+def test_digits_share_sprite():
+    """Verify if digits created from the same sprite share resized images."""
+    image = np.zeros((28, 28), dtype=np.uint8)
+    image[10:20, 8:23] = 255
+    sprite = Sprite(image)
+    digits = [
+        Digit(sprite, label=1, image_size=(64, 64), sizes=(16,)) for _ in range(2)
+    ]
+
+    assert digits[0].image is digits[1].image
+
+
+def test_tight_bboxes():
+    """Verify if bboxes of a stack of images match nonzero pixel coordinates."""
+    images = np.random.RandomState(0).randint(0, 256, size=(5, 3, 20, 24)) * (
+        np.random.RandomState(1).rand(5, 3, 20, 24) > 0.97
+    )
+    images[0, 0, 7, 9] = 1
+
+    bboxes = tight_bboxes(images)
+
+    assert bboxes.shape == (5, 3, 4)
+    for image, bbox in zip(images.reshape(-1, 20, 24), bboxes.reshape(-1, 4)):
+        ys, xs = np.where(image > 0)
+        assert bbox.tolist() == [xs.min(), ys.min(), xs.max(), ys.max()]
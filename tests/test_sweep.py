@@ -0,0 +1,94 @@
+"""Test generation of dataset variants over a grid of parameters."""
+import json
+
+import pytest
+
+from moving_multiscalemnist.generate import generate_dataset
+from moving_multiscalemnist.sweep import expand_grid, generate_sweep, load_sweep
+from moving_multiscalemnist.writers import load_arrays
+
+PARAMS = {
+    "train_size": 3,
+    "test_size": 1,
+    "n_frames": 2,
+    "min_digits": 1,
+    "max_digits": 3,
+    "image_size": (48, 32),
+    "sizes": (16,),
+    "oscillations": (1.0,),
+    "oscillations_variances": (0.1,),
+    "fps": 10,
+    "seed": 7,
+    "output_format": "npy",
+}
+
+
+def test_load_sweep(tmp_path):
+    """Verify if sweep file is expanded to grid and listed configurations."""
+    path = tmp_path.joinpath("sweep.json")
+    path.write_text(
+        json.dumps(
+            {
+                "grid": {"sizes": [[16], [16, 32]], "max_digits": [2, 4]},
+                "configs": [{"name": "small", "image_size": [32, 32]}],
+            }
+        )
+    )
+
+    assert load_sweep(str(path)) == [
+        {"sizes": [16], "max_digits": 2},
+        {"sizes": [16], "max_digits": 4},
+        {"sizes": [16, 32], "max_digits": 2},
+        {"sizes": [16, 32], "max_digits": 4},
+        {"name": "small", "image_size": [32, 32]},
+    ]
+    assert expand_grid({}) == [{}]
+
+
+def test_generate_sweep_unknown_param(tmp_path, mnist_dir):
+    """Verify if configurations with unknown parameters are rejected."""
+    with pytest.raises(ValueError):
+        generate_sweep(
+            [{"engine": "numpy"}],
+            output_dir=str(tmp_path),
+            data_dir=str(mnist_dir),
+            **PARAMS,
+        )
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_generate_sweep(tmp_path, mnist_dir, workers):
+    """Verify if variants match datasets generated separately."""
+    configs = [
+        {"name": "small", "sizes": [12], "max_digits": 2},
+        {"name": "large", "sizes": [20], "oscillations_variances": [0.3]},
+    ]
+    generate_sweep(
+        configs,
+        output_dir=str(tmp_path.joinpath("sweep")),
+        data_dir=str(mnist_dir),
+        workers=workers,
+        atlas_dir=str(tmp_path.joinpath("atlas")),
+        **PARAMS,
+    )
+
+    records = json.loads(tmp_path.joinpath("sweep/sweep.json").read_text())
+    assert [record["name"] for record in records] == ["small", "large"]
+    for atlas in tmp_path.joinpath("atlas").glob("atlas-*"):
+        sizes = json.loads(atlas.joinpath("atlas.json").read_text())["sizes"]
+        assert {12, 20} <= set(sizes)
+    for config in configs:
+        params = {**PARAMS, **config}
+        name = params.pop("name")
+        variant = tmp_path.joinpath("sweep", name)
+        recorded = json.loads(variant.joinpath("config.json").read_text())
+        assert recorded["sizes"] == config["sizes"]
+
+        output = tmp_path.joinpath(f"separate_{name}")
+        generate_dataset(data_dir=str(mnist_dir), output_dir=str(output), **params)
+        for subset in ["train", "test"]:
+            expected = load_arrays(str(output.joinpath(subset)))
+            arrays = load_arrays(str(variant.joinpath(subset)))
+            assert arrays.keys() == expected.keys()
+            for key, array in expected.items():
+                assert (arrays[key] == array).all()
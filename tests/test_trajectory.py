@@ -0,0 +1,130 @@
+"""Test vectorized digit trajectories."""
+import json
+
+import numpy as np
+import pytest
+
+from moving_multiscalemnist.digit import Digit
+from moving_multiscalemnist.generate import generate_dataset
+from moving_multiscalemnist.sequence import prepare_sequence
+from moving_multiscalemnist.trajectory import (
+    DigitBatch,
+    load_trajectories,
+    save_trajectories,
+    trajectory_digits,
+)
+
+
+def _digits(mnist_subset, seed, counts=(2, 5), fps=10):
+    images, labels = mnist_subset
+    random_state = np.random.RandomState(seed)
+    return [
+        [
+            Digit(
+                images[idx],
+                label=labels[idx].item(),
+                image_size=(48, 40),
+                sizes=(16, 24),
+                oscillations=(0.5, 1.0),
+                oscillations_variances=(0.0, 0.3),
+                fps=fps,
+                random_state=random_state,
+            )
+            for idx in range(n_digits)
+        ]
+        for n_digits in counts
+    ]
+
+
+@pytest.mark.parametrize("counts, fps", [((2, 5), 10), ((0, 3, 1), 7.5)])
+def test_trajectories_match_digits(mnist_subset, counts, fps):
+    """Verify if trajectories reproduce motion and bounces of digits."""
+    n_frames = 40
+    batch = DigitBatch(_digits(mnist_subset, seed=3, counts=counts, fps=fps))
+    trajectories = batch.trajectories(n_frames)
+
+    assert trajectories.x.shape == (n_frames, len(counts), max(counts))
+    assert trajectories.bounce_x.any()
+    assert batch.bboxes(trajectories).shape == (n_frames, len(counts), max(counts), 4)
+    for seq_idx, digits in enumerate(
+        _digits(mnist_subset, seed=3, counts=counts, fps=fps)
+    ):
+        for digit_idx, digit in enumerate(digits):
+            idx = seq_idx, digit_idx
+            for frame_idx in range(n_frames):
+                assert trajectories.x[(frame_idx, *idx)] == digit._x
+                assert trajectories.y[(frame_idx, *idx)] == digit._y
+                assert trajectories.sizes[(frame_idx, *idx)] == digit.size
+                assert trajectories.x1[(frame_idx, *idx)] == digit.x1
+                assert trajectories.y1[(frame_idx, *idx)] == digit.y1
+                vel_x, vel_y = digit._vel_x, digit._vel_y
+                digit.update()
+                assert trajectories.bounce_x[(frame_idx, *idx)] == (
+                    digit._vel_x == -vel_x
+                )
+                assert trajectories.bounce_y[(frame_idx, *idx)] == (
+                    digit._vel_y == -vel_y
+                )
+
+
+def test_trajectory_digits(mnist_subset):
+    """Verify if digit views render the same sequences as digits."""
+    batch = DigitBatch(_digits(mnist_subset, seed=4))
+    views = trajectory_digits(batch, batch.trajectories(12))
+
+    for digits, view in zip(_digits(mnist_subset, seed=4), views):
+        expected = prepare_sequence(digits, n_frames=12, image_size=(48, 40))
+        for (frame_1, *annotation_1), (frame_2, *annotation_2) in zip(
+            expected, prepare_sequence(view, n_frames=12, image_size=(48, 40))
+        ):
+            assert (np.array(frame_1) == np.array(frame_2)).all()
+            assert annotation_1 == annotation_2
+
+
+def test_save_trajectories(tmp_path, mnist_subset):
+    """Verify if trajectories are saved and loaded."""
+    batch = DigitBatch(_digits(mnist_subset, seed=5))
+    trajectories = batch.trajectories(6)
+    bboxes = batch.bboxes(trajectories)
+    save_trajectories(tmp_path.joinpath("trajectories.npz"), trajectories, bboxes)
+
+    loaded, loaded_bboxes = load_trajectories(tmp_path.joinpath("trajectories.npz"))
+    for name, values in trajectories._asdict().items():
+        assert np.array_equal(getattr(loaded, name), values)
+    assert np.array_equal(loaded_bboxes, bboxes)
+
+
+@pytest.mark.parametrize("batch_size", [1, 2])
+def test_generate_dataset_trajectories(tmp_path, mnist_dir, batch_size):
+    """Verify if exported boxes match boxes of saved sequences."""
+    generate_dataset(
+        data_dir=str(mnist_dir),
+        train_size=3,
+        test_size=2,
+        n_frames=4,
+        min_digits=1,
+        max_digits=3,
+        image_size=(64, 64),
+        sizes=(16,),
+        oscillations=(1.0,),
+        oscillations_variances=(0.1,),
+        fps=10,
+        seed=5,
+        batch_size=batch_size,
+        trajectories=True,
+        output_dir=str(tmp_path.joinpath("dataset")),
+    )
+    path = tmp_path.joinpath("dataset/train")
+    trajectories, bboxes = load_trajectories(path.joinpath("trajectories.npz"))
+    for idx in range(3):
+        annotations = json.loads(
+            path.joinpath(f"{idx:06d}/annotations.json").read_text()
+        )
+        n_digits = trajectories.n_digits[idx]
+        for frame_idx, annotation in enumerate(annotations):
+            assert bboxes[frame_idx, idx, :n_digits] == pytest.approx(
+                np.array(annotation["bboxes"])
+            )
+            assert trajectories.labels[idx, :n_digits].tolist() == (
+                annotation["labels"]
+            )
@@ -0,0 +1,77 @@
+"""Test shared memory transport of rendered batches."""
+import pickle
+from multiprocessing.shared_memory import SharedMemory
+
+import numpy as np
+import pytest
+
+from moving_multiscalemnist import MovingMultiscaleMNIST
+from moving_multiscalemnist.transport import BatchRing, SharedMemoryLoader
+
+PARAMS = {
+    "n_frames": 3,
+    "min_digits": 1,
+    "max_digits": 3,
+    "image_size": (64, 48),
+    "sizes": (16, 24),
+    "oscillations": (1.0,),
+    "oscillations_variances": (0.2,),
+    "fps": 10,
+}
+
+
+@pytest.fixture
+def dataset(mnist_dir):
+    """Return small in-memory dataset."""
+    return MovingMultiscaleMNIST(
+        str(mnist_dir), subset="test", length=7, seed=3, batch_size=2, **PARAMS
+    )
+
+
+def test_batch_ring_pickle():
+    """Verify if pickled ring attaches to the same shared memory."""
+    ring = BatchRing(2, batch_size=3, n_frames=4, image_size=(8, 6), max_digits=2)
+    restored = pickle.loads(pickle.dumps(ring))
+    ring.arrays["frames"][1, 2, 3] = 7
+
+    assert restored.arrays["frames"].shape == (2, 3, 4, 6, 8)
+    assert (restored.arrays["frames"][1, 2, 3] == 7).all()
+
+    names = ring.names
+    restored.close()
+    ring.close()
+    with pytest.raises(FileNotFoundError):
+        SharedMemory(name=names["frames"])
+
+
+@pytest.mark.parametrize("workers, n_slots", [(1, 1), (2, None)])
+def test_shared_memory_loader(dataset, workers, n_slots):
+    """Verify if batches rendered in shared memory match dataset batches."""
+    loader = SharedMemoryLoader(dataset, workers=workers, n_slots=n_slots)
+    batches = [
+        (indices.copy(), [array.copy() for array in batch if array is not None])
+        for indices, batch in loader
+    ]
+
+    assert len(batches) == len(loader) == 4
+    assert np.concatenate([indices for indices, _ in batches]).tolist() == list(
+        range(7)
+    )
+    for indices, (frames, bboxes, labels, n_digits) in batches:
+        expected = dataset.render(indices.tolist())
+        max_digits = expected.bboxes.shape[2]
+        assert (frames == expected.frames).all()
+        assert (bboxes[:, :, :max_digits] == expected.bboxes).all()
+        assert (labels[:, :max_digits] == expected.labels).all()
+        assert (n_digits == expected.n_digits).all()
+
+
+def test_shared_memory_loader_stopped(dataset):
+    """Verify if workers are stopped when iteration is interrupted."""
+    loader = SharedMemoryLoader(dataset, workers=2, indices=[4, 1, 2])
+    iterator = iter(loader)
+    indices, batch = next(iterator)
+
+    assert indices.tolist() == [4, 1]
+    assert (batch.frames == dataset.render([4, 1]).frames).all()
+    iterator.close()
@@ -0,0 +1,150 @@
+"""Test writers of generated sequences."""
+import json
+import pickle
+import tarfile
+
+import numpy as np
+import pytest
+from PIL import Image
+
+from moving_multiscalemnist.writers import (
+    ApngWriter,
+    ArrayWriter,
+    JpegWriter,
+    TarWriter,
+    load_arrays,
+    load_tar_index,
+    read_tar_sample,
+)
+
+
+def _sequence(n_frames, n_digits, value):
+    for frame_idx in range(n_frames):
+        frame = Image.new("RGB", (32, 24), color=(value + frame_idx,) * 3)
+        bboxes = [(0.1 * digit, 0.2, 0.3, 0.4) for digit in range(n_digits)]
+        yield frame, bboxes, [value] * n_digits, list(range(n_digits))
+
+
+def test_jpeg_writer(tmp_path):
+    """Verify if JPEG writer saves frames and annotations of a sequence."""
+    writer = JpegWriter(str(tmp_path), n_sequences=1, n_frames=2, image_size=(32, 24))
+    writer.write(3, _sequence(2, 1, 10))
+    writer.close()
+
+    path = tmp_path.joinpath("000003")
+    assert sorted(file.name for file in path.iterdir()) == [
+        "000000.jpg",
+        "000000.txt",
+        "000001.jpg",
+        "000001.txt",
+        "annotations.json",
+    ]
+    assert path.joinpath("000001.txt").read_text() == "10 0.0 0.2 0.3 0.4\n"
+    annotations = json.loads(path.joinpath("annotations.json").read_text())
+    assert annotations[1] == {
+        "bboxes": [[0.0, 0.2, 0.3, 0.4]],
+        "labels": [10],
+        "ids": [0],
+    }
+
+
+def test_apng_writer(tmp_path):
+    """Verify if APNG writer saves lossless frames at its frame rate in a file."""
+    writer = ApngWriter(
+        str(tmp_path), n_sequences=1, n_frames=3, image_size=(32, 24), fps=4
+    )
+    frames = list(_sequence(3, 2, 10))
+    writer.write(0, frames)
+
+    path = tmp_path.joinpath("000000")
+    assert writer.sequence_files(0) == [
+        path.joinpath("frames.png"),
+        path.joinpath("annotations.json"),
+    ]
+    with Image.open(path.joinpath("frames.png")) as image:
+        assert image.n_frames == 3
+        for frame_idx, (frame, *_) in enumerate(frames):
+            image.seek(frame_idx)
+            assert (np.array(image.convert("RGB")) == np.array(frame)).all()
+            assert image.info["duration"] == 250
+    annotations = json.loads(path.joinpath("annotations.json").read_text())
+    assert annotations[2]["labels"] == [10, 10]
+
+
+def test_array_writer(tmp_path):
+    """Verify if array writer saves lossless frames and columnar annotations."""
+    writer = ArrayWriter(str(tmp_path), n_sequences=2, n_frames=3, image_size=(32, 24))
+    for idx, n_digits in reversed(list(enumerate([2, 1]))):
+        writer.collect(idx, writer.write(idx, _sequence(3, n_digits, 10 * idx)))
+    writer.close()
+
+    arrays = load_arrays(str(tmp_path))
+    assert isinstance(arrays["frames"], np.memmap)
+    assert arrays["frames"].shape == (2, 3, 24, 32, 3)
+    assert (arrays["frames"][1, 2] == 12).all()
+    assert arrays["frame_offsets"].tolist() == [0, 2, 4, 6, 7, 8, 9]
+    assert arrays["labels"].tolist() == [0] * 6 + [10] * 3
+    assert arrays["ids"].tolist() == [0, 1] * 3 + [0] * 3
+    assert arrays["boxes"][1] == pytest.approx([0.1, 0.2, 0.3, 0.4])
+
+
+def test_tar_writer(tmp_path):
+    """Verify if tar writer saves size-bounded shards with an index of sequences."""
+    jpeg_writer = JpegWriter(str(tmp_path.joinpath("jpeg")), 4, 2, (32, 24))
+    writer = TarWriter(
+        str(tmp_path.joinpath("tar")),
+        n_sequences=4,
+        n_frames=2,
+        image_size=(32, 24),
+        shard_size=15000,
+    )
+    workers = [pickle.loads(pickle.dumps(writer)) for _ in range(2)]
+    for idx in [0, 2, 1, 3]:
+        worker = workers[idx % 2]
+        writer.collect(idx, worker.write(idx, _sequence(2, 1, 10 * idx)))
+        jpeg_writer.write(idx, _sequence(2, 1, 10 * idx))
+    writer.close()
+
+    path = tmp_path.joinpath("tar")
+    index = load_tar_index(str(path))
+    assert [entry["shard"] for entry in index] == [
+        "shard-000000.tar",
+        "shard-000001.tar",
+        "shard-000000.tar",
+        "shard-000001.tar",
+    ]
+    sample = read_tar_sample(str(path), index[2])
+    assert sorted(sample) == [
+        "000002.000000.jpg",
+        "000002.000000.txt",
+        "000002.000001.jpg",
+        "000002.000001.txt",
+        "000002.json",
+    ]
+    jpeg = tmp_path.joinpath("jpeg/000002")
+    assert sample["000002.000001.jpg"] == jpeg.joinpath("000001.jpg").read_bytes()
+    assert sample["000002.000001.txt"] == jpeg.joinpath("000001.txt").read_bytes()
+    assert json.loads(sample["000002.json"]) == json.loads(
+        jpeg.joinpath("annotations.json").read_text()
+    )
+    for shard in path.glob("*.tar"):
+        assert shard.stat().st_size <= 15000
+        with tarfile.open(shard) as tar:
+            assert len(tar.getnames()) == 10
+    assert tmp_path.joinpath("tar.txt").read_text().splitlines()[-2:] == [
+        "data/tar/000003.000000.jpg",
+        "data/tar/000003.000001.jpg",
+    ]
+    assert tmp_path.joinpath("obj.names").read_text().split() == ["0", "10", "20", "30"]
+
+
+def test_tar_writer_shared_shard(tmp_path):
+    """Verify if sequences written by a single process share a shard."""
+    writer = TarWriter(str(tmp_path), n_sequences=3, n_frames=2, image_size=(32, 24))
+    for idx in range(3):
+        writer.collect(idx, writer.write(idx, _sequence(2, 2, idx)))
+    writer.close()
+
+    with tarfile.open(tmp_path.joinpath("shard-000000.tar")) as tar:
+        assert tar.getnames()[-1] == "000002.json"
+    assert [entry["offset"] for entry in load_tar_index(str(tmp_path))][0] == 0